@@ -0,0 +1,142 @@
+"""Paginated, filterable and sortable listings behind the admin dashboard tabs.
+
+Each listing names a column projection (see serializers.py) with the joins
+it needs, the columns a free-text ``q`` matches, the columns it may be
+sorted by and any extra filters. Rows come back as plain tuples, already
+carrying the related fields to_dict() would lazy-load. A page therefore
+costs one COUNT and one SELECT however many rows it holds. ``fetch_page`` turns
+request arguments into one page of serialized rows plus the totals the
+dashboard needs for its pager.
+"""
+import math
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select
+
+from models import db, User, Pharmacy, Medicine, Hospital, SOS, Ambulance
+from counters import EXPIRY_WINDOW_DAYS
+import serializers
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+
+
+def _flag(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _expiring(value):
+    threshold = datetime.utcnow().date() + timedelta(days=EXPIRY_WINDOW_DAYS)
+    return Medicine.expiry <= threshold if _flag(value) else Medicine.expiry > threshold
+
+
+LISTINGS = {
+    'pharmacies': {
+        'tables': ('pharmacy', 'user'),
+        'select': serializers.pharmacies_select,
+        'projection': serializers.PHARMACY,
+        'search': (Pharmacy.shop_name, Pharmacy.dl_no, Pharmacy.prc_no, Pharmacy.phone),
+        'sort': {'id': Pharmacy.id, 'shop_name': Pharmacy.shop_name, 'verified': Pharmacy.verified},
+        'default_sort': 'id',
+        'filters': {'verified': lambda v: Pharmacy.verified == _flag(v)},
+    },
+    'hospitals': {
+        'tables': ('hospital',),
+        'select': lambda: serializers.HOSPITAL.select(),
+        'projection': serializers.HOSPITAL,
+        'search': (Hospital.name, Hospital.address, Hospital.phone),
+        'sort': {'id': Hospital.id, 'name': Hospital.name},
+        'default_sort': 'id',
+        'filters': {},
+    },
+    'medicines': {
+        'tables': ('medicine', 'pharmacy'),
+        'select': serializers.medicines_select,
+        'projection': serializers.MEDICINE_WITH_PHARMACY,
+        'search': (Medicine.name, Medicine.manufacturer, Pharmacy.shop_name),
+        'sort': {'id': Medicine.id, 'name': Medicine.name, 'qty': Medicine.qty, 'price': Medicine.price,
+                 'expiry': Medicine.expiry, 'pharmacy_name': Pharmacy.shop_name},
+        'default_sort': 'id',
+        'filters': {'pharmacy_id': lambda v: Medicine.pharmacy_id == int(v), 'expiring': _expiring},
+    },
+    'ambulances': {
+        'tables': ('ambulance',),
+        'select': lambda: serializers.AMBULANCE.select(),
+        'projection': serializers.AMBULANCE,
+        'search': (Ambulance.vehicle_number, Ambulance.driver_name, Ambulance.area),
+        'sort': {'id': Ambulance.id, 'vehicle_number': Ambulance.vehicle_number, 'area': Ambulance.area,
+                 'created_at': Ambulance.created_at},
+        'default_sort': 'id',
+        'filters': {},
+    },
+    'sos': {
+        'tables': ('sos', 'user'),
+        'select': serializers.sos_select,
+        'projection': serializers.SOS_REQUEST,
+        'search': (SOS.medicine_name,),
+        'sort': {'id': SOS.id, 'created_at': SOS.created_at, 'medicine_name': SOS.medicine_name,
+                 'status': SOS.status},
+        'default_sort': '-created_at',
+        'filters': {'status': lambda v: SOS.status == v},
+    },
+    'sub_admins': {
+        'tables': ('user',),
+        'select': lambda: serializers.USER.select().where(User.role == 'sub_admin'),
+        'projection': serializers.USER,
+        'search': (User.name, User.username, User.email),
+        'sort': {'id': User.id, 'name': User.name, 'username': User.username},
+        'default_sort': 'id',
+        'filters': {},
+    },
+}
+
+
+def fetch_page(name, args):
+    """One page of the named listing, driven by request args.
+
+    Recognised args: page, per_page (capped at MAX_PER_PAGE), q, sort (a
+    column name, prefixed with '-' for descending) and the listing's own
+    filters. Raises KeyError for an unknown listing and ValueError for a bad
+    sort column or filter value.
+    """
+    listing = LISTINGS[name]
+    query = listing['select']()
+
+    q = (args.get('q') or '').strip()
+    if q:
+        query = query.where(or_(*[column.ilike(f'%{q}%') for column in listing['search']]))
+
+    for key, criterion in listing['filters'].items():
+        value = args.get(key)
+        if value not in (None, ''):
+            query = query.where(criterion(value))
+
+    sort = args.get('sort') or listing['default_sort']
+    column = listing['sort'].get(sort.lstrip('-'))
+    if column is None:
+        raise ValueError(f'Cannot sort {name} by {sort!r}')
+    order = column.desc() if sort.startswith('-') else column.asc()
+    # Tie-break on the primary key so pages never overlap
+    primary = listing['sort']['id']
+    query = query.order_by(order, primary.desc() if sort.startswith('-') else primary.asc())
+
+    page = max(1, _int_arg(args, 'page', 1))
+    per_page = max(1, min(_int_arg(args, 'per_page', DEFAULT_PER_PAGE), MAX_PER_PAGE))
+    total = db.session.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+    rows = db.session.execute(query.limit(per_page).offset((page - 1) * per_page))
+    return {
+        'items': listing['projection'].rows(rows),
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': math.ceil(total / per_page),
+        'sort': sort,
+        'q': q,
+    }
+
+
+def _int_arg(args, key, default):
+    value = args.get(key)
+    if value in (None, ''):
+        return default
+    return int(value)
@@ -1,6 +1,9 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import or_
+from sqlalchemy import event, func, insert, or_, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
@@ -11,12 +14,28 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from models import db, User, Pharmacy, Medicine, Review, Hospital, SOS, SystemAlert, MedicineAlternative, Ambulance
 from config import config
+from geo import GeoIndex, bbox_filter, cell_area
+from distance import PointSet
+from search_index import AlternativeGraph, FuzzyIndex, PrefixIndex, TrigramIndex
+from search_backend import create_backend
+from admin_lists import LISTINGS, fetch_page
+import counters
+from jobs import JobQueue
+import table_versions
+import serializers
+from serializers import json_response
+from result_cache import ANY_ADDITION, ResultCache, SingleFlight, normalize_query
+import sos_dedup
+import sos_events
+import stock_adjust
+import stock_import
+from sos_events import EventBroker
+from sos_sweeper import Sweeper
 from datetime import datetime, timedelta
 import os
 import re
-import math
-import json
 import secrets
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -68,18 +87,177 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config.get('ALLOWED_EXTENSIONS', {'pdf', 'png', 'jpg', 'jpeg'})
 
-def haversine(lat1, lon1, lat2, lon2):
-    # Radius of the Earth in km
-    R = 6371.0
-    
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    
-    a = math.sin(dlat / 2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    distance = R * c
-    return distance
+# In-memory geohash index over pharmacy coordinates, built lazily on first search.
+# Rebuilt after GEO_INDEX_MAX_AGE seconds so other workers' writes are picked up.
+pharmacy_index = GeoIndex(max_age=app.config.get('GEO_INDEX_MAX_AGE'))
+
+def get_pharmacy_index():
+    if pharmacy_index.is_stale:
+        rows = db.session.query(Pharmacy.id, Pharmacy.latitude, Pharmacy.longitude).all()
+        pharmacy_index.rebuild(rows)
+    return pharmacy_index
+
+# Full-text backend (SQLite FTS5 / Postgres tsvector) chosen from the database URI
+search_backend = create_backend(app.config.get('SEARCH_BACKEND', 'substring'))
+SEARCHABLE_COLUMNS = ('name', 'generic_name', 'manufacturer', 'description')
+search_backend.register(Medicine.__table__, SEARCHABLE_COLUMNS)
+
+def medicine_text(med):
+    """Searchable text of a Medicine (or a row carrying the same columns)."""
+    return ' '.join(getattr(med, column) or '' for column in SEARCHABLE_COLUMNS)
+
+# Trigram index over Medicine.name for the substring backend on SQLite. Postgres
+# deployments use the pg_trgm GIN index (see migrations) and skip this.
+medicine_index = TrigramIndex(max_age=app.config.get('GEO_INDEX_MAX_AGE'))
+
+def medicine_index_enabled():
+    # Other backends never query it, so writes skip its upkeep too
+    return search_backend.name == 'substring' and db.engine.dialect.name == 'sqlite'
+
+# Brand <-> generic graph from MedicineAlternative, closed in both directions.
+# Marked stale on any ORM write to the table; rebuilt on the next lookup.
+alternative_graph = AlternativeGraph(max_age=app.config.get('GEO_INDEX_MAX_AGE'))
+
+@event.listens_for(MedicineAlternative, 'after_insert')
+@event.listens_for(MedicineAlternative, 'after_update')
+@event.listens_for(MedicineAlternative, 'after_delete')
+def _invalidate_alternative_graph(mapper, connection, target):
+    alternative_graph.invalidate()
+    name_suggestions.invalidate()
+    search_cache.clear()
+
+def get_alternative_graph():
+    if alternative_graph.is_stale:
+        rows = db.session.query(MedicineAlternative.medicine_name, MedicineAlternative.alternative_name).all()
+        alternative_graph.rebuild(rows)
+    return alternative_graph
+
+def get_medicine_index():
+    if medicine_index.is_stale:
+        rows = db.session.query(Medicine.id, Medicine.name, Medicine.pharmacy_id).all()
+        medicine_index.rebuild(rows)
+    return medicine_index
+
+# Distinct medicine and alternative names for /patient/suggest, weighted by
+# how many stock rows carry each name
+name_suggestions = PrefixIndex(max_age=app.config.get('GEO_INDEX_MAX_AGE'))
+
+def get_name_suggestions():
+    if name_suggestions.is_stale:
+        weighted = db.session.query(Medicine.name, func.count(Medicine.id)).group_by(Medicine.name).all()
+        pinned = []
+        for brand, generic in db.session.query(MedicineAlternative.medicine_name, MedicineAlternative.alternative_name):
+            pinned.extend((brand, generic))
+        name_suggestions.rebuild(weighted, pinned)
+    return name_suggestions
+
+# Edit-distance index over the words of distinct medicine names, used when a
+# search finds neither stock nor known alternatives
+fuzzy_index = FuzzyIndex(max_age=app.config.get('GEO_INDEX_MAX_AGE'))
+
+def get_fuzzy_index():
+    if fuzzy_index.is_stale:
+        weighted = db.session.query(Medicine.name, func.count(Medicine.id)).group_by(Medicine.name).all()
+        fuzzy_index.rebuild(weighted)
+    return fuzzy_index
+
+# search_medicine results per (normalized query, geo cell). Writes drop only the
+# entries whose search terms match the changed row; other workers rely on the TTL.
+search_cache = ResultCache(max_entries=app.config.get('SEARCH_CACHE_SIZE', 1024),
+                           ttl=app.config.get('SEARCH_CACHE_TTL', 60))
+
+# Identical concurrent reads (search_medicine, nearby_hospitals,
+# global_expiry_scan) share one database round trip. Leaders return plain
+# dicts, never ORM objects, since followers run in other sessions.
+single_flight = SingleFlight(timeout=app.config.get('SINGLE_FLIGHT_TIMEOUT', 10))
+
+# Created/resolved SOS events for /pharmacy/sos/stream
+sos_broker = EventBroker(backlog=app.config.get('SOS_STREAM_BACKLOG', 256))
+# Each open stream holds a worker thread; the cap stays below gunicorn's
+# --threads (Procfile) so searches and SOS requests always find one free
+sos_stream_slots = sos_events.StreamSlots(app.config.get('SOS_STREAM_MAX', 10))
+
+# Background work (SOS dispatch) off the request path; see jobs.py
+job_queue = JobQueue(workers=app.config.get('JOB_WORKERS', 2),
+                     poll_interval=app.config.get('JOB_POLL_INTERVAL', 1),
+                     lease=app.config.get('JOB_LEASE', 60),
+                     backoff=app.config.get('JOB_BACKOFF', 2),
+                     max_attempts=app.config.get('JOB_MAX_ATTEMPTS', 5))
+
+def _publish_expired(sos_ids):
+    for sos_id in sos_ids:
+        sos_broker.publish('resolved', {'id': sos_id, 'status': 'expired'})
+
+# Expires SOS left open longer than SOS_TTL; see sos_sweeper.py
+sos_sweeper = Sweeper(ttl=app.config.get('SOS_TTL', 86400),
+                      interval=app.config.get('SOS_SWEEP_INTERVAL', 60),
+                      batch_size=app.config.get('SOS_SWEEP_BATCH', 500),
+                      max_batches=app.config.get('SOS_SWEEP_MAX_BATCHES', 20),
+                      on_expired=_publish_expired)
+
+def index_medicine(med):
+    """Reflect a newly committed Medicine row in the in-process indexes."""
+    if medicine_index_enabled():
+        medicine_index.add(med.id, med.name, med.pharmacy_id)
+    name_suggestions.add(med.name)
+    fuzzy_index.add(med.name)
+    search_cache.invalidate(medicine_text(med), added=True)
+
+def index_medicines(rows):
+    """index_medicine for a bulk insert (dicts of column values with ids)."""
+    trigrams = medicine_index_enabled()
+    for row in rows:
+        if trigrams:
+            medicine_index.add(row['id'], row['name'], row['pharmacy_id'])
+        name_suggestions.add(row['name'])
+        fuzzy_index.add(row['name'])
+    # Cheaper than matching every cached query against hundreds of new rows
+    search_cache.clear()
+
+def unindex_medicine(medicine_id, name, text):
+    if medicine_index_enabled():
+        medicine_index.remove(medicine_id)
+    name_suggestions.discard(name)
+    fuzzy_index.discard(name)
+    search_cache.invalidate(text)
+
+# Query budget: when QUERY_BUDGET is set (the testing config), any request
+# issuing more statements than that fails, so N+1 regressions surface in tests
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if app.config.get('QUERY_BUDGET') and has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+@app.after_request
+def _check_query_budget(response):
+    budget = app.config.get('QUERY_BUDGET')
+    count = g.get('query_count', 0)
+    if budget and count > budget:
+        raise AssertionError(f'{request.method} {request.path} issued {count} queries (budget {budget})')
+    return response
+
+def versioned_json(tables, build, *vary):
+    """JSON response with a strong ETag derived from table versions.
+
+    The ETag covers the tables the payload is read from, the request URL,
+    the user and anything in vary, so a matching If-None-Match is answered
+    with 304 before build() loads any rows.
+    """
+    etag = table_versions.etag(db.session, tables, request.full_path, current_user.get_id(), *vary)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = json_response(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Workers start with the first request, not at import, so CLI commands
+# (flask db upgrade) never poll a job or SOS table that may not exist yet
+@app.before_request
+def _start_background_workers():
+    job_queue.start(app, db)
+    sos_sweeper.start(app, db)
 
 if not os.environ.get('FLASK_TESTING'):
     db.init_app(app)
@@ -304,6 +482,7 @@ def register():
             )
             db.session.add(new_pharmacy)
             db.session.commit()
+            pharmacy_index.add(new_pharmacy.id, lat, lng)
             
         flash('Registration successful, please login.')
         return redirect(url_for('login'))
@@ -322,49 +501,35 @@ def admin_dashboard():
     if current_user.role not in ['admin', 'sub_admin']:
         return "Access Denied"
     
-    pharmacies = Pharmacy.query.all()
-    hospitals = Hospital.query.all()
-    medicines = Medicine.query.all()
-    ambulances = Ambulance.query.all()
-    emergencies = SOS.query.order_by(SOS.created_at.desc()).all()
-    
-    # Statistics
-    medicines_count = Medicine.query.count()
-    ambulances_count = Ambulance.query.count()
-    
-    sub_admins = []
+    # Only counts and the first page of each tab are rendered; the tabs page,
+    # filter and sort through /admin/api/<listing>
+    listings = ['pharmacies', 'hospitals', 'medicines', 'ambulances', 'sos']
     if current_user.role == 'admin':
-        sub_admins = User.query.filter_by(role='sub_admin').all()
-
-    # Serialize for Alpine.js
-    pharmacies_json = json.dumps([p.to_dict() for p in pharmacies])
-    hospitals_json = json.dumps([h.to_dict() for h in hospitals])
-    medicines_json = json.dumps([m.to_dict() for m in medicines])
-    ambulances_json = json.dumps([a.to_dict() for a in ambulances])
-    emergencies_json = json.dumps([e.to_dict() for e in emergencies])
-    sub_admins_json = json.dumps([sa.to_dict() for sa in sub_admins])
-    
-    # Helper to get pharmacy name for medicine list 
-    # (Medicine.to_dict doesn't include pharmacy name by default, let's add it client side or here)
-    # Actually, let's enrich medicine dicts with pharmacy name here
-    med_list = []
-    for m in medicines:
-        m_dict = m.to_dict()
-        m_dict['pharmacy_name'] = m.pharmacy.shop_name if m.pharmacy else 'Unknown'
-        med_list.append(m_dict)
-    medicines_json = json.dumps(med_list)
+        listings.append('sub_admins')
+    first_pages = {name: fetch_page(name, {}) for name in listings}
+    
+    # Tiles come from the counters table rather than COUNT(*) scans
+    stats = counters.read(db.session)
+    stats['hospitals'] = first_pages['hospitals']['total']
+    stats['pending_pharmacies'] = stats['pharmacies'] - stats['verified_pharmacies']
 
     return render_template('admin_dashboard.html', 
-                           pharmacies_json=pharmacies_json, 
-                           sub_admins_json=sub_admins_json, 
-                           hospitals_json=hospitals_json,
-                           medicines_json=medicines_json,
-                           ambulances_json=ambulances_json,
-                           emergencies_json=emergencies_json,
-                           medicines_count=medicines_count,
-                           ambulances_count=ambulances_count,
-                           pharmacies_count=len(pharmacies),
-                           hospitals_count=len(hospitals))
+                           first_pages_json=serializers.dumps(first_pages),
+                           stats_json=serializers.dumps(stats))
+
+@app.route('/admin/api/<listing>')
+@login_required
+def admin_listing(listing):
+    if current_user.role not in ['admin', 'sub_admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if listing not in LISTINGS or (listing == 'sub_admins' and current_user.role != 'admin'):
+        return jsonify({'error': 'Unknown listing'}), 404
+    try:
+        # 'expiring' filters move with the calendar
+        return versioned_json(LISTINGS[listing]['tables'], lambda: fetch_page(listing, request.args),
+                              datetime.utcnow().date())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/admin/add_hospital_submit', methods=['POST'])
 @login_required
@@ -439,14 +604,21 @@ def reject_pharmacy(id):
     user = User.query.get(pharma.user_id)
     
     # Delete inventory, reviews, alerts first
+    removed_medicines = db.session.query(Medicine.id, Medicine.expiry, *[getattr(Medicine, c) for c in SEARCHABLE_COLUMNS]).filter_by(pharmacy_id=pharma.id).all()
     Medicine.query.filter_by(pharmacy_id=pharma.id).delete()
+    counters.medicines_removed(db.session, [row.expiry for row in removed_medicines])
+    table_versions.bump(db.session, [table_versions.scoped('medicine', pharma.id)])
     Review.query.filter_by(pharmacy_id=pharma.id).delete()
     SystemAlert.query.filter_by(pharmacy_id=pharma.id).delete()
     
+    pharmacy_id = pharma.id
     db.session.delete(pharma)
     if user:
         db.session.delete(user)
     db.session.commit()
+    pharmacy_index.remove(pharmacy_id)
+    for row in removed_medicines:
+        unindex_medicine(row.id, row.name, medicine_text(row))
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json:
         return jsonify({'success': True})
     flash('Pharmacy and associated user removed')
@@ -533,6 +705,7 @@ def add_medicine():
         )
         db.session.add(new_med)
         db.session.commit()
+        index_medicine(new_med)
         flash('Medicine added to system successfully')
         return redirect(url_for('admin_dashboard'))
     return render_template('admin_add_medicine.html')
@@ -543,8 +716,13 @@ def delete_medicine(id):
     if current_user.role not in ['admin', 'sub_admin']:
         return jsonify({'error': 'Unauthorized'}), 403
     med = Medicine.query.get_or_404(id)
+    name, text = med.name, medicine_text(med)
     db.session.delete(med)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except StaleDataError:
+        return medicine_conflict(id)
+    unindex_medicine(id, name, text)
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json:
         return jsonify({'success': True})
     return redirect(url_for('admin_dashboard'))
@@ -600,11 +778,26 @@ def resolve_broadcast(id):
     sos = SOS.query.get_or_404(id)
     sos.status = 'resolved'
     db.session.commit()
+    sos_broker.publish('resolved', {'id': sos.id, 'status': sos.status})
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.is_json or request.method == 'POST':
         return jsonify({'success': True})
     flash('Emergency broadcast marked as resolved')
     return redirect(url_for('admin_dashboard'))
 
+@app.route('/admin/search_cache')
+@login_required
+def search_cache_stats():
+    if current_user.role not in ['admin', 'sub_admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(dict(search_cache.stats(), single_flight=single_flight.stats()))
+
+@app.route('/admin/jobs')
+@login_required
+def job_stats():
+    if current_user.role not in ['admin', 'sub_admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(job_queue.stats(db.session))
+
 @app.route('/admin/add_admin', methods=['GET', 'POST'])
 @login_required
 def add_admin():
@@ -622,17 +815,21 @@ def pharmacy_dashboard():
     if not pharmacy:
         return "Pharmacy profile not found"
         
-    inventory = Medicine.query.filter_by(pharmacy_id=pharmacy.id).all()
+    # Column projections straight to dicts (same shape as to_dict)
+    version = inventory_version(pharmacy.id)
+    inventory = pharmacy_inventory(pharmacy.id)
     reviews = Review.query.filter_by(pharmacy_id=pharmacy.id).all()
-    alerts = SystemAlert.query.filter_by(pharmacy_id=pharmacy.id).order_by(SystemAlert.created_at.desc()).all()
+    alerts = serializers.ALERT.rows(db.session.execute(
+        serializers.ALERT.select().where(SystemAlert.pharmacy_id == pharmacy.id).order_by(SystemAlert.created_at.desc())))
     
-    # Fetch only OPEN SOS requests (last 10)
-    emergencies = SOS.query.filter_by(status='open').order_by(SOS.created_at.desc()).limit(10).all()
+    # Stream position first, so events committed while the page renders are replayed
+    sos_stream_id = sos_broker.event_id(sos_broker.seq)
+    emergencies = open_emergencies(pharmacy.id)
     
     # Serialize for Alpine.js
-    inventory_json = json.dumps([item.to_dict() for item in inventory])
-    alerts_json = json.dumps([item.to_dict() for item in alerts])
-    emergencies_json = json.dumps([item.to_dict() for item in emergencies])
+    inventory_json = serializers.dumps(inventory)
+    alerts_json = serializers.dumps(alerts)
+    emergencies_json = serializers.dumps(emergencies)
     
     return render_template('pharmacy.html', 
                            pharmacy=pharmacy, 
@@ -642,7 +839,118 @@ def pharmacy_dashboard():
                            alerts=alerts,
                            inventory_json=inventory_json,
                            alerts_json=alerts_json,
-                           emergencies_json=emergencies_json)
+                           emergencies_json=emergencies_json,
+                           sos_stream_id=sos_stream_id,
+                           inventory_version=version)
+
+def inventory_version(pharmacy_id):
+    """Counter bumped by every write to this pharmacy's medicines."""
+    name = table_versions.scoped('medicine', pharmacy_id)
+    return table_versions.current(db.session, [name])[name]
+
+def medicine_conflict(medicine_id):
+    """409 with the row as it is now, for a delete that lost a race with a stock edit."""
+    db.session.rollback()
+    row = db.session.execute(serializers.MEDICINE.select().where(Medicine.id == medicine_id)).one_or_none()
+    if row is None:
+        return jsonify({'error': 'Medicine not found'}), 404
+    return json_response({'success': False, 'reason': 'version_conflict', 'medicine': serializers.MEDICINE.row(row)},
+                         status=409)
+
+def pharmacy_inventory(pharmacy_id):
+    return serializers.MEDICINE.rows(db.session.execute(
+        serializers.MEDICINE.select().where(Medicine.pharmacy_id == pharmacy_id)))
+
+@app.route('/pharmacy/inventory')
+@login_required
+def inventory_data():
+    """The pharmacy's inventory and its version, for resyncing the dashboard store."""
+    if current_user.role != 'pharmacy':
+        return jsonify({'error': 'Unauthorized'}), 403
+    pharmacy = Pharmacy.query.filter_by(user_id=current_user.id).first_or_404()
+    return versioned_json([table_versions.scoped('medicine', pharmacy.id)], lambda: {
+        'inventory_version': inventory_version(pharmacy.id),
+        'items': pharmacy_inventory(pharmacy.id),
+    })
+
+def open_emergencies(pharmacy_id):
+    """The last 10 OPEN SOS requests dispatched to this pharmacy, newest first.
+
+    Driven from this pharmacy's dispatch alerts: ix_system_alert_pharmacy_sos
+    is walked newest SOS id first and each SOS is checked by primary key, so
+    the cost follows this pharmacy's alerts, not the number of open SOS.
+    """
+    return serializers.SOS_REQUEST.rows(db.session.execute(
+        serializers.sos_select().join(SystemAlert, SystemAlert.sos_id == SOS.id)
+        .where(SystemAlert.pharmacy_id == pharmacy_id, SystemAlert.sos_id.is_not(None), SOS.status == 'open')
+        .order_by(SystemAlert.sos_id.desc()).limit(10)))
+
+@app.route('/pharmacy/sos/stream')
+@login_required
+def sos_stream():
+    """Server-Sent Events for this pharmacy's SOS, resuming after Last-Event-ID or from a snapshot."""
+    if current_user.role != 'pharmacy':
+        return jsonify({'error': 'Unauthorized'}), 403
+    pharmacy_id = db.session.scalar(select(Pharmacy.id).where(Pharmacy.user_id == current_user.id))
+    if pharmacy_id is None:
+        return jsonify({'error': 'Pharmacy profile not found'}), 404
+    if not sos_stream_slots.acquire():
+        retry_after = app.config.get('SOS_STREAM_RETRY', 30)
+        return Response(sos_events.retry(retry_after * 1000), status=503, mimetype='text/event-stream',
+                        headers={'Retry-After': str(retry_after), 'Cache-Control': 'no-cache'})
+    seq = sos_broker.parse(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    backlog = sos_broker.events_after(seq) if seq is not None else None
+    if backlog is None:
+        seq = sos_broker.seq
+        try:
+            snapshot = open_emergencies(pharmacy_id)
+        except Exception:
+            sos_stream_slots.release()
+            raise
+    heartbeat = app.config.get('SOS_STREAM_HEARTBEAT', 15)
+    lifetime = app.config.get('SOS_STREAM_LIFETIME', 300)
+
+    def generate():
+        yield 'retry: 3000\n\n'
+        if backlog is None:
+            yield sos_events.sse(sos_broker.event_id(seq), 'snapshot', snapshot)
+            events = sos_broker.events_after(seq)
+        else:
+            events = backlog
+        cursor = seq
+        deadline = time.monotonic() + lifetime
+        while events is not None:
+            sent = False
+            for sos_event in events:
+                cursor = sos_event.seq
+                if sos_event.audience is None or pharmacy_id in sos_event.audience:
+                    sent = True
+                    yield sos_events.sse(sos_event.id, sos_event.name, sos_event.data)
+            if not sent:
+                yield sos_events.heartbeat()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = sos_broker.wait(cursor, min(heartbeat, remaining))
+        # Fell behind the backlog: close, and resync with a snapshot on reconnect
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, even if generate() never started
+    response.call_on_close(sos_stream_slots.release)
+    return response
+
+@app.route('/pharmacy/sos/open')
+@login_required
+def open_sos():
+    """Open emergencies as JSON, for dashboards refused a stream slot."""
+    if current_user.role != 'pharmacy':
+        return jsonify({'error': 'Unauthorized'}), 403
+    pharmacy_id = db.session.scalar(select(Pharmacy.id).where(Pharmacy.user_id == current_user.id))
+    if pharmacy_id is None:
+        return jsonify({'error': 'Pharmacy profile not found'}), 404
+    # Polled every SOS_STREAM_RETRY seconds; unchanged lists cost a 304
+    return versioned_json(['sos', 'system_alert'], lambda: open_emergencies(pharmacy_id))
 
 @app.route('/pharmacy/add_stock', methods=['POST'])
 @csrf.exempt
@@ -682,10 +990,15 @@ def add_stock():
         )
         db.session.add(new_med)
         db.session.commit()
+        index_medicine(new_med)
     except (ValueError, TypeError) as e:
         return jsonify({'error': str(e)}), 400
     
-    return jsonify({'success': True}) # Or redirect
+    # The new row and inventory version let the dashboard patch its store in place
+    medicine = serializers.MEDICINE.row(db.session.execute(
+        serializers.MEDICINE.select().where(Medicine.id == new_med.id)).one())
+    return json_response({'success': True, 'medicine': medicine,
+                          'inventory_version': inventory_version(pharmacy.id)})
 
 @app.route('/pharmacy/remove_stock/<int:id>', methods=['POST'])
 @csrf.exempt
@@ -700,9 +1013,94 @@ def remove_stock(id):
     if med.pharmacy_id != pharmacy.id:
          return jsonify({'error': 'Unauthorized'}), 403
          
+    name, text = med.name, medicine_text(med)
     db.session.delete(med)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        return medicine_conflict(id)
+    unindex_medicine(id, name, text)
+    return jsonify({'success': True, 'id': id, 'inventory_version': inventory_version(pharmacy.id)})
+
+@app.route('/pharmacy/adjust_stock', methods=['POST'])
+@csrf.exempt
+@login_required
+def adjust_stock():
+    """Apply a batch of {medicine_id, delta[, version]} lines in one UPDATE.
+
+    Lines that would take stock below zero, or whose version is stale, are
+    reported as conflicts while the rest apply. With ?strict=1 any conflict
+    or invalid line cancels the whole batch (409).
+    """
+    if current_user.role != 'pharmacy':
+        return jsonify({'error': 'Unauthorized'}), 403
+    pharmacy = Pharmacy.query.filter_by(user_id=current_user.id).first_or_404()
+    strict = request.args.get('strict') in ('1', 'true')
+    try:
+        lines, errors = stock_adjust.parse_lines(request.get_json(silent=True),
+                                                 max_lines=app.config.get('ADJUST_MAX_LINES'))
+    except stock_adjust.BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    if strict and errors:
+        return jsonify({'success': False, 'applied': [], 'conflicts': [], 'errors': errors}), 409
+
+    applied, conflicts = stock_adjust.apply(db.session, pharmacy.id, lines)
+    if strict and conflicts:
+        db.session.rollback()
+        return jsonify({'success': False, 'applied': [], 'conflicts': conflicts, 'errors': errors}), 409
+    if applied:
+        table_versions.bump(db.session, [table_versions.scoped('medicine', pharmacy.id)])
     db.session.commit()
-    return jsonify({'success': True})
+
+    # Cached searches only list sellable stock: drop them when a row runs out or comes back
+    for row in applied:
+        before = row.qty - lines[row.id]['delta']
+        if (before > 0) != (row.qty > 0):
+            search_cache.invalidate(medicine_text(row), added=row.qty > 0)
+    return jsonify({
+        'success': not conflicts and not errors,
+        'applied': [{'medicine_id': row.id, 'qty': row.qty, 'version': row.version} for row in applied],
+        'conflicts': conflicts,
+        'errors': errors,
+        'inventory_version': inventory_version(pharmacy.id),
+    })
+
+@app.route('/pharmacy/import_stock', methods=['POST'])
+@csrf.exempt
+@login_required
+def import_stock():
+    """Bulk-add stock from a CSV or JSON array, as a 'file' upload or the raw body.
+
+    Valid rows are inserted in one transaction; invalid ones come back as
+    per-row errors. With ?strict=1 any invalid row cancels the whole import.
+    """
+    if current_user.role != 'pharmacy':
+        return jsonify({'error': 'Unauthorized'}), 403
+    pharmacy = Pharmacy.query.filter_by(user_id=current_user.id).first_or_404()
+
+    upload = request.files.get('file')
+    if upload:
+        rows = stock_import.iter_rows(upload.stream, upload.filename or '', upload.mimetype)
+    else:
+        rows = stock_import.iter_rows(request.stream, '', request.mimetype)
+    try:
+        inserted, errors = stock_import.import_rows(
+            db.session, pharmacy.id, rows,
+            chunk_size=app.config.get('IMPORT_CHUNK_SIZE', 500), max_rows=app.config.get('IMPORT_MAX_ROWS'))
+    except stock_import.UploadError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    if errors and request.args.get('strict') in ('1', 'true'):
+        db.session.rollback()
+        return jsonify({'success': False, 'imported': 0, 'errors': errors}), 422
+
+    # Bulk INSERTs skip the mapper events behind the counters and scoped versions
+    counters.medicines_added(db.session, [row['expiry'] for row in inserted])
+    table_versions.bump(db.session, [table_versions.scoped('medicine', pharmacy.id)])
+    db.session.commit()
+    index_medicines(inserted)
+    return jsonify({'success': True, 'imported': len(inserted), 'errors': errors,
+                    'inventory_version': inventory_version(pharmacy.id)})
 
 
 # Patient Dashboard
@@ -714,6 +1112,19 @@ def patient_dashboard():
     
     return render_template('dashboard_patient.html', user=current_user)
 
+def hospital_json(h, distance):
+    return {
+        'id': h.id,
+        'name': h.name,
+        'phone': h.phone,
+        'ambulance_no': h.ambulance_no,
+        'driver_name': h.driver_name,
+        'driver_no': h.driver_no,
+        'latitude': h.latitude,
+        'longitude': h.longitude,
+        'distance': distance
+    }
+
 @app.route('/patient/nearby_hospitals')
 @login_required
 def nearby_hospitals():
@@ -724,40 +1135,35 @@ def nearby_hospitals():
     lng = request.args.get('lng', type=float)
     radius = request.args.get('radius', default=15.0, type=float) # Default 15km
     
-    hospitals = Hospital.query.all()
-    nearby = []
-    
-    for h in hospitals:
-        dist = 0
-        if lat and lng and h.latitude and h.longitude:
-            dist = haversine(lat, lng, h.latitude, h.longitude)
-            if dist <= radius:
-                nearby.append({
-                    'id': h.id,
-                    'name': h.name,
-                    'phone': h.phone,
-                    'ambulance_no': h.ambulance_no,
-                    'driver_name': h.driver_name,
-                    'driver_no': h.driver_no,
-                    'latitude': h.latitude,
-                    'longitude': h.longitude,
-                    'distance': round(dist, 2)
-                })
-        elif not lat or not lng:
-            # If no location provided, return all but with 0 distance
-            nearby.append({
-                'id': h.id,
-                'name': h.name,
-                'phone': h.phone,
-                'ambulance_no': h.ambulance_no,
-                'driver_name': h.driver_name,
-                'driver_no': h.driver_no,
-                'latitude': h.latitude,
-                'longitude': h.longitude,
-                'distance': 0
-            })
-            
-    return jsonify(nearby)
+    if not lat or not lng:
+        # If no location provided, return all but with 0 distance
+        return versioned_json(['hospital'], lambda: single_flight.do(
+            ('hospitals', None), lambda: [hospital_json(h, 0) for h in Hospital.query.all()]))
+    
+    return versioned_json(['hospital'], lambda: hospitals_near(lat, lng, radius))
+
+def hospitals_near(lat, lng, radius):
+    # Bounding box is applied in SQL (ix_hospital_lat_lng) around the patient's
+    # cache cell, so concurrent patients in the same cell share one query.
+    # Exact distances, radius filter and nearest-first sort are per patient.
+    area = search_area(lat, lng, radius)
+    _, centre_lat, centre_lng, area_radius, _ = area
+    hospitals = single_flight.do(('hospitals', area[0], radius), lambda: [
+        hospital_json(h, None) for h in Hospital.query.filter(bbox_filter(Hospital, centre_lat, centre_lng, area_radius))
+    ])
+    points = PointSet.from_rows((i, h['latitude'], h['longitude']) for i, h in enumerate(hospitals))
+    return [dict(hospitals[i], distance=round(dist, 2)) for i, dist in points.within(lat, lng, radius)]
+
+def record_sos(patient_id, medicine_name, latitude, longitude):
+    """Open or merge a patient's SOS (see sos_dedup) and commit it, with the
+    dispatch job when a new SOS was opened. Returns (sos, created, expired)."""
+    sos, created, expired = sos_dedup.record(db.session, patient_id, medicine_name, latitude, longitude,
+                                             app.config.get('SOS_DEDUP_WINDOW', 600))
+    if created:
+        # Matching and fan-out run on a job worker; the job commits with the SOS
+        job_queue.enqueue(db.session, 'sos.dispatch', {'sos_id': sos.id})
+    db.session.commit()
+    return sos, created, expired
 
 @app.route('/patient/send_sos', methods=['POST'])
 @csrf.exempt
@@ -774,11 +1180,249 @@ def send_sos():
     if not medicine_name:
         return jsonify({'error': 'Medicine name required'}), 400
         
-    new_sos = SOS(patient_id=current_user.id, medicine_name=medicine_name, latitude=latitude, longitude=longitude)
-    db.session.add(new_sos)
-    db.session.commit()
+    try:
+        sos, created, expired = record_sos(current_user.id, medicine_name, latitude, longitude)
+    except IntegrityError:
+        # A concurrent press opened the same SOS first. The retry usually merges
+        # into it, but opens (and dispatches) a new one if it closed meanwhile.
+        db.session.rollback()
+        sos, created, expired = record_sos(current_user.id, medicine_name, latitude, longitude)
+    if expired is not None:
+        sos_broker.publish('resolved', {'id': expired.id, 'status': expired.status})
+    if created:
+        job_queue.notify()
+
+    return jsonify({'success': True, 'sos_id': sos.id, 'merged': not created, 'request_count': sos.request_count})
+
+@job_queue.handler('sos.dispatch')
+def dispatch_sos_job(payload):
+    """Match an open SOS to pharmacies, alert them and publish it to their streams."""
+    sos = db.session.get(SOS, payload['sos_id'])
+    if sos is None or sos.status != 'open':
+        return None
+    # A retry after a committed dispatch must not alert twice
+    if db.session.scalar(select(SystemAlert.id).where(SystemAlert.sos_id == sos.id).limit(1)) is not None:
+        return None
+    targets = dispatch_sos(sos)
+    event = serializers.SOS_REQUEST.row(db.session.execute(serializers.sos_select().where(SOS.id == sos.id)).one())
+    return lambda: sos_broker.publish('created', event, audience=targets)
+
+def dispatch_sos(sos):
+    """Alert the pharmacies that can fill sos; returns their ids.
+
+    Targets pharmacies within SOS_DISPATCH_RADIUS_KM of the patient with
+    sellable (in stock, unexpired) medicine_name or one of its alternatives,
+    nearest first, at most SOS_DISPATCH_LIMIT of them. An SOS without a
+    location goes to stocked pharmacies anywhere, up to the same limit. One
+    bulk INSERT adds a SystemAlert per target, linked by sos_id.
+    """
+    limit = app.config.get('SOS_DISPATCH_LIMIT', 50)
+    nearby = None
+    if sos.latitude is not None and sos.longitude is not None:
+        nearby = get_pharmacy_index().within(sos.latitude, sos.longitude, app.config.get('SOS_DISPATCH_RADIUS_KM', 5))
+        if not nearby:
+            return []
+    terms = [sos.medicine_name, *alternative_names_for(sos.medicine_name)]
+    matches = medicine_search_query(terms, nearby, sellable=True).subquery()
+    stocked = select(matches.c.pharmacy_id).distinct()
+    if nearby is None:
+        targets = db.session.scalars(stocked.limit(limit)).all()
+    else:
+        targets = sorted(db.session.scalars(stocked), key=nearby.get)[:limit]
+    if targets:
+        patient = sos.patient.name if sos.patient else 'A patient'
+        def message(pharmacy_id):
+            away = f' ({nearby[pharmacy_id]:.1f} km away)' if nearby is not None else ''
+            return f'SOS: {patient} urgently needs {sos.medicine_name}{away}'
+        db.session.execute(insert(SystemAlert), [
+            {'pharmacy_id': pharmacy_id, 'sos_id': sos.id, 'type': 'danger', 'message': message(pharmacy_id)}
+            for pharmacy_id in targets
+        ])
+    return targets
+
+def medicine_search_query(terms, pharmacy_ids=None, sellable=False):
+    """Medicine joined to Pharmacy where the name contains any of terms,
+    limited to the given pharmacies when set. Rows carry the medicine columns
+    plus the pharmacy's shop_name, location_address, phone and coordinates."""
+    terms = [terms] if isinstance(terms, str) else terms
+    # Only the columns medicine_result() needs, as plain rows
+    q = db.session.query(
+        Medicine.id, Medicine.name, Medicine.price, Medicine.pharmacy_id,
+        Pharmacy.shop_name, Pharmacy.location_address, Pharmacy.phone, Pharmacy.latitude, Pharmacy.longitude
+    ).select_from(Medicine).join(Pharmacy)
     
-    return jsonify({'success': True})
+    # Ranked full-text match over name, generic name, manufacturer and description
+    matched = search_backend.match(Medicine.__table__, terms)
+    if matched is not None:
+        q = q.join(matched, matched.c.id == Medicine.id).order_by(matched.c.rank)
+        if pharmacy_ids is not None:
+            q = q.filter(Medicine.pharmacy_id.in_(list(pharmacy_ids)))
+        if sellable:
+            q = q.filter(Medicine.qty > 0, Medicine.expiry >= datetime.utcnow().date())
+        return q
+    
+    # Narrow by the trigram index first; a huge candidate set gains nothing
+    # over the plain scan and would overflow SQLite's bound-parameter limit
+    ids = None
+    if medicine_index_enabled():
+        ids = get_medicine_index().search_any(terms, tags=pharmacy_ids)
+        if len(ids) > app.config.get('TRIGRAM_MAX_CANDIDATES', 5000):
+            ids = None
+    if ids is not None:
+        q = q.filter(Medicine.id.in_(ids))
+    else:
+        q = q.filter(or_(*[Medicine.name.ilike(f'%{term}%') for term in terms]))
+        if pharmacy_ids is not None:
+            q = q.filter(Medicine.pharmacy_id.in_(list(pharmacy_ids)))
+    if sellable:
+        q = q.filter(Medicine.qty > 0, Medicine.expiry >= datetime.utcnow().date())
+    return q
+
+def alternative_names_for(query):
+    """Alternative (generic or sibling brand) names for brands matching query."""
+    return get_alternative_graph().alternatives_for(query)
+
+def nearest_stock(terms, nearby, k, slack=0):
+    """The k nearest sellable matches for any of terms.
+
+    nearby maps pharmacy id -> distance, nearest first. Pharmacies are
+    queried in rings of KNN_RING_SIZE. Every pharmacy in a later ring is
+    farther away than all earlier ones, so the search can stop as soon as
+    k hits have been found.
+    
+    With slack, rings continue until the next pharmacy is more than slack km
+    beyond the k-th hit, and every hit found is returned. That superset holds
+    the k nearest for any origin within slack / 2 of the one nearby was
+    measured from.
+    """
+    if nearby is None:
+        return medicine_search_query(terms, sellable=True).limit(k).all()
+    
+    pharmacy_ids = list(nearby)
+    ring_size = app.config.get('KNN_RING_SIZE', 25)
+    found = []
+    for start in range(0, len(pharmacy_ids), ring_size):
+        ring = pharmacy_ids[start:start + ring_size]
+        found.extend(medicine_search_query(terms, ring, sellable=True).all())
+        if len(found) >= k:
+            found.sort(key=lambda row: nearby[row.pharmacy_id])
+            following = pharmacy_ids[start + ring_size:start + ring_size + 1]
+            if not following or nearby[following[0]] > nearby[found[k - 1].pharmacy_id] + slack:
+                break
+    found.sort(key=lambda row: nearby[row.pharmacy_id])
+    return found if slack else found[:k]
+
+def expanding_stock_search(terms, lat, lng, target, deadline):
+    """Search rings of growing radius (SEARCH_RINGS_KM) for sellable stock.
+
+    Each ring only queries pharmacies not covered by the previous one. Stops
+    once target hits are found or time.monotonic() passes deadline. Returns
+    (rows nearest first, {pharmacy_id: distance}, radius reached).
+    """
+    index = get_pharmacy_index()
+    distances = {}
+    found = []
+    radius = None
+    for radius in app.config.get('SEARCH_RINGS_KM', [2, 5, 15, 50]):
+        nearby = index.within(lat, lng, radius)
+        ring = [pid for pid in nearby if pid not in distances]
+        distances.update(nearby)
+        if ring:
+            found.extend(medicine_search_query(terms, ring, sellable=True).all())
+        if len(found) >= target or time.monotonic() >= deadline:
+            break
+    found.sort(key=lambda row: distances[row.pharmacy_id])
+    return found[:target], distances, radius
+
+def find_stock(terms, nearby, k=None, slack=0):
+    if k:
+        return nearest_stock(terms, nearby, k, slack)
+    return medicine_search_query(terms, nearby).all()
+
+def medicine_result(row, nearby, **extra):
+    dist = 'N/A'
+    if nearby is not None:
+        dist = round(nearby[row.pharmacy_id], 2)
+    result = {
+        'name': row.name,
+        'pharmacy': row.shop_name,
+        'price': row.price if row.price else 'N/A',
+        'location': row.location_address,
+        'phone': row.phone,
+        'lat': row.latitude,
+        'lng': row.longitude,
+        'dist': dist,
+        'id': row.id,
+        'is_alternative': False
+    }
+    result.update(extra)
+    return result
+
+def search_area(lat, lng, radius):
+    """Cache cell around a patient: (cell, centre_lat, centre_lng, radius_km, reach_km).
+
+    The radius is widened by the cell's reach so the area covers the search
+    circle of every patient inside the cell.
+    """
+    cell, centre_lat, centre_lng, reach = cell_area(lat, lng, app.config.get('SEARCH_CACHE_PRECISION', 5))
+    return cell, centre_lat, centre_lng, radius + reach, reach
+
+def search_candidates(terms, area, k=None):
+    """Stock matching terms within area (or anywhere when area is None), as
+    result dicts without distances.
+
+    Enough rows are kept to answer the search for any patient in the area's
+    cell; localize_results() narrows them down per request.
+    """
+    nearby = None
+    slack = 0
+    if area is not None:
+        _, lat, lng, radius, reach = area
+        nearby = get_pharmacy_index().within(lat, lng, radius)
+        if not nearby:
+            return []
+        slack = 2 * reach
+    rows = find_stock(terms, nearby, k, slack)
+    return [medicine_result(row, None) for row in rows]
+
+def localize_results(candidates, lat, lng, radius, k=None, **extra):
+    """Per-patient view of cached candidates.
+
+    With a location, keeps candidates within radius and fills in their
+    distance. With k, returns the k nearest; otherwise the candidates' own
+    order is kept.
+    """
+    if not (lat and lng):
+        return [dict(c, **extra) for c in candidates[:k]]
+    points = PointSet.from_rows((i, c['lat'], c['lng']) for i, c in enumerate(candidates))
+    hits = points.within(lat, lng, radius)
+    if k:
+        hits = hits[:k]
+    else:
+        hits.sort()
+    return [dict(candidates[i], dist=round(dist, 2), **extra) for i, dist in hits]
+
+def search_medicine_rings(query, user_lat, user_lng, target):
+    target = max(1, min(target, app.config.get('KNN_MAX_K', 100)))
+    budget_ms = request.args.get('budget_ms', default=app.config.get('SEARCH_BUDGET_MS', 250), type=int)
+    started = time.monotonic()
+    deadline = started + budget_ms / 1000.0
+    
+    rows, distances, radius = expanding_stock_search(query, user_lat, user_lng, target, deadline)
+    extra = {}
+    if not rows:
+        alternative_names = alternative_names_for(query) or get_fuzzy_index().suggest(query, limit=5)
+        if alternative_names:
+            rows, distances, radius = expanding_stock_search(
+                alternative_names, user_lat, user_lng, target, deadline)
+            extra = {'is_alternative': True, 'original_search': query}
+    
+    return {
+        'results': [medicine_result(row, distances, **extra) for row in rows],
+        'radius_km': radius,
+        'target_met': len(rows) >= target,
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1)
+    }
 
 @app.route('/patient/search_medicine')
 @login_required
@@ -786,78 +1430,73 @@ def search_medicine():
     query = request.args.get('query', '')
     user_lat = request.args.get('lat', type=float)
     user_lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', default=app.config.get('SEARCH_RADIUS_KM', 50.0), type=float)
+    # k-nearest mode: only sellable stock, nearest first, at most k rows
+    k = request.args.get('k', type=int)
+    if k is not None:
+        k = max(1, min(k, app.config.get('KNN_MAX_K', 100)))
+    
+    # Progressive mode: expand rings until `target` hits or the latency budget runs out
+    target = request.args.get('target', type=int)
     
     if len(query) < 2:
         return jsonify([])
+    
+    if target is not None and user_lat and user_lng:
+        return json_response(search_medicine_rings(query, user_lat, user_lng, target))
+    
+    # Results are cached per geo cell as distance-free candidates covering every
+    # patient in the cell; distances and the radius cut are applied per request
+    area = search_area(user_lat, user_lng, radius) if user_lat and user_lng else None
+    key = ('search', normalize_query(query), area and area[0], radius if area else None, k)
+    
+    def load_matches():
+        generation = search_cache.generation
+        entry = {'matches': search_candidates(query, area, k)}
+        search_cache.put(key, entry, [query], generation)
+        return entry
+    
+    def load_alternatives():
+        generation = search_cache.generation
+        # First, check database for known alternatives
+        alternative_names = alternative_names_for(query)
+        terms = list(alternative_names)
+        
+        # If no database alternatives, try names within a small edit distance.
+        # Any new stock name may change these, so tag the entry accordingly.
+        if not alternative_names:
+            alternative_names = get_fuzzy_index().suggest(query, limit=5)
+            terms = alternative_names + [ANY_ADDITION]
         
+        # Search for all alternatives in pharmacy inventory in one query
+        alternatives = search_candidates(alternative_names, area, k) if alternative_names else []
+        search_cache.add_terms(key, terms, generation)
+        return alternatives
+    
+    entry = search_cache.get(key) or single_flight.do(key, load_matches)
+    
     # Case insensitive search for exact matches
-    results = db.session.query(Medicine, Pharmacy).join(Pharmacy).filter(
-        Medicine.name.ilike(f'%{query}%')
-    ).all()
-    
-    data = []
-    for med, pharma in results:
-        dist = 'N/A'
-        if user_lat and user_lng and pharma.latitude and pharma.longitude:
-             d = haversine(user_lat, user_lng, pharma.latitude, pharma.longitude)
-             dist = round(d, 2)
-             
-        data.append({
-            'name': med.name,
-            'pharmacy': pharma.shop_name,
-            'price': med.price if med.price else 'N/A',
-            'location': pharma.location_address,
-            'phone': pharma.phone,
-            'lat': pharma.latitude,
-            'lng': pharma.longitude,
-            'dist': dist,
-            'id': med.id,
-            'is_alternative': False
-        })
+    data = localize_results(entry['matches'], user_lat, user_lng, radius, k)
     
     # If no results found, search for alternatives
     if len(data) == 0:
-        # First, check database for known alternatives
-        alternatives = MedicineAlternative.query.filter(
-            MedicineAlternative.medicine_name.ilike(f'%{query}%')
-        ).all()
+        if 'alternatives' not in entry:
+            entry['alternatives'] = single_flight.do(key + ('alternatives',), load_alternatives)
         
-        alternative_names = [alt.alternative_name for alt in alternatives]
-        
-        # If no database alternatives, try fuzzy matching (first 3 characters)
-        if not alternative_names:
-            similar = Medicine.query.filter(
-                Medicine.name.ilike(f'%{query[:3]}%')
-            ).limit(5).all()
-            alternative_names = list(set([med.name for med in similar]))
+        data = localize_results(entry['alternatives'], user_lat, user_lng, radius, k,
+                                is_alternative=True, original_search=query)
         
-        # Search for these alternatives in pharmacy inventory
-        for alt_name in alternative_names:
-            meds = db.session.query(Medicine, Pharmacy).join(Pharmacy).filter(
-                Medicine.name.ilike(f'%{alt_name}%')
-            ).all()
-            
-            for med, pharma in meds:
-                dist = 'N/A'
-                if user_lat and user_lng and pharma.latitude and pharma.longitude:
-                     d = haversine(user_lat, user_lng, pharma.latitude, pharma.longitude)
-                     dist = round(d, 2)
-                
-                data.append({
-                    'name': med.name,
-                    'pharmacy': pharma.shop_name,
-                    'price': med.price if med.price else 'N/A',
-                    'location': pharma.location_address,
-                    'phone': pharma.phone,
-                    'lat': pharma.latitude,
-                    'lng': pharma.longitude,
-                    'dist': dist,
-                    'id': med.id,
-                    'is_alternative': True,
-                    'original_search': query
-                })
-        
-    return jsonify(data)
+    return json_response(data)
+
+@app.route('/patient/suggest')
+@limiter.limit("120 per minute")  # Called on every keystroke
+@login_required
+def suggest():
+    prefix = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', default=8, type=int), 20))
+    
+    suggestions = get_name_suggestions().suggest(prefix, limit)
+    return jsonify([{'name': name, 'popularity': weight} for name, weight in suggestions])
 
 @app.route('/patient/submit_review', methods=['POST'])
 @csrf.exempt
@@ -901,18 +1540,14 @@ def global_expiry_scan():
     
     # Findings expiring in next 30 days
     threshold = datetime.utcnow().date() + timedelta(days=30)
-    expiring = db.session.query(Medicine, Pharmacy).join(Pharmacy).filter(Medicine.expiry <= threshold).all()
-    
-    data = []
-    for med, pharma in expiring:
-        data.append({
-            'med': med.name,
-            'pharma': pharma.shop_name,
-            'pharma_id': pharma.id,
-            'expiry': med.expiry.strftime('%Y-%m-%d'),
-            'qty': med.qty
-        })
-    return jsonify(data)
+    return versioned_json(['medicine', 'pharmacy'],
+                          lambda: single_flight.do(('expiry_scan', threshold), lambda: expiring_stock(threshold)),
+                          threshold)
+
+def expiring_stock(threshold):
+    projection = serializers.EXPIRING_STOCK
+    rows = db.session.execute(projection.select().select_from(Medicine).join(Pharmacy).where(Medicine.expiry <= threshold))
+    return projection.rows(rows)
 
 # Init DB
 # Error handlers
@@ -933,6 +1568,17 @@ def forbidden_error(error):
 def ratelimit_handler(e):
     return render_template('errors/429.html'), 429
 
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recount the admin dashboard counters from the source tables."""
+    for name, value in counters.reconcile(db.session).items():
+        print(f"{name}: {value}")
+
+@app.cli.command('requeue-dead-jobs')
+def requeue_dead_jobs_command():
+    """Retry background jobs that ran out of attempts."""
+    print(f"Requeued {job_queue.requeue_dead(db.session)} dead jobs")
+
 # Health check endpoint
 @app.route('/health')
 @limiter.exempt
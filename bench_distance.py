@@ -0,0 +1,53 @@
+"""Compare the per-row haversine() loop with the batch PointSet engine.
+
+Usage: python bench_distance.py
+"""
+import random
+import time
+
+from distance import HAS_NUMPY, PointSet
+from geo import haversine
+
+SIZES = (1_000, 10_000, 100_000)
+RADIUS_KM = 15.0
+REPEAT = 5
+
+
+def loop_nearby(rows, lat, lng, radius):
+    # Mirrors the original nearby_hospitals loop
+    nearby = []
+    for point_id, p_lat, p_lng in rows:
+        dist = haversine(lat, lng, p_lat, p_lng)
+        if dist <= radius:
+            nearby.append((point_id, dist))
+    nearby.sort(key=lambda item: item[1])
+    return nearby
+
+
+def best_of(fn, *args):
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    rng = random.Random(0)
+    lat, lng = 9.98, 76.58
+    engines = [('python', False)] + ([('numpy', True)] if HAS_NUMPY else [])
+    print(f"{'points':>8} {'loop ms':>10} " + ' '.join(f'{name + " ms":>10}' for name, _ in engines))
+    for size in SIZES:
+        rows = [(i, rng.uniform(8.0, 12.0), rng.uniform(75.0, 78.0)) for i in range(size)]
+        loop_ms = best_of(loop_nearby, rows, lat, lng, RADIUS_KM)
+        timings = []
+        for _, use_numpy in engines:
+            points = PointSet.from_rows(rows, use_numpy=use_numpy)
+            assert [p for p, _ in points.within(lat, lng, RADIUS_KM)] == [p for p, _ in loop_nearby(rows, lat, lng, RADIUS_KM)]
+            timings.append(best_of(points.within, lat, lng, RADIUS_KM))
+        print(f'{size:>8} {loop_ms:>10.2f} ' + ' '.join(f'{t:>10.2f}' for t in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Compare ORM + to_dict() payloads with the column-projected serializers.
+
+Each case builds one JSON response body the way a request handler would.
+Throughput is how many bodies are built per second, which is an upper bound
+on requests/sec for that endpoint. Peak memory is from tracemalloc for a
+single build.
+
+Usage: python bench_serializers.py
+"""
+import json
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from flask import Flask
+from sqlalchemy import insert
+from sqlalchemy.orm import contains_eager
+
+from models import db, User, Pharmacy, Medicine, SOS
+from admin_lists import fetch_page
+import serializers
+
+PHARMACIES = 200
+MEDICINES = 10_000
+SOS_REQUESTS = 2_000
+DURATION = 1.0
+
+
+def seed():
+    rng = random.Random(0)
+    owner = User(username='owner', password='x', role='pharmacy', name='Owner', email='o@example.com')
+    patient = User(username='patient', password='x', role='patient', name='Patient', phone='999')
+    db.session.add_all([owner, patient])
+    db.session.flush()
+    db.session.execute(insert(Pharmacy), [
+        {'user_id': owner.id, 'shop_name': f'Shop {i}', 'phone': '1', 'verified': i % 2 == 0}
+        for i in range(PHARMACIES)
+    ])
+    today = date.today()
+    db.session.execute(insert(Medicine), [
+        {'pharmacy_id': rng.randint(1, PHARMACIES), 'name': f'Medicine {i}', 'qty': rng.randint(0, 50),
+         'price': rng.uniform(1, 500), 'expiry': today + timedelta(days=rng.randint(-30, 720)),
+         'manufacturer': 'Acme', 'description': 'Tablets'}
+        for i in range(MEDICINES)
+    ])
+    db.session.execute(insert(SOS), [
+        {'patient_id': patient.id, 'medicine_name': f'Medicine {i}', 'status': 'open'} for i in range(SOS_REQUESTS)
+    ])
+    db.session.commit()
+
+
+# --- ORM + to_dict() paths (the pre-projection handlers) ---
+
+def orm_all_medicines():
+    rows = []
+    for m in Medicine.query.join(Pharmacy).options(contains_eager(Medicine.pharmacy)).order_by(Medicine.id):
+        row = m.to_dict()
+        row['pharmacy_id'] = m.pharmacy_id
+        row['pharmacy_name'] = m.pharmacy.shop_name
+        rows.append(row)
+    return json.dumps(rows)
+
+
+def orm_medicines_page():
+    query = Medicine.query.join(Pharmacy).options(contains_eager(Medicine.pharmacy)).order_by(Medicine.id)
+    page = query.paginate(page=1, per_page=100, error_out=False)
+    items = []
+    for m in page.items:
+        row = m.to_dict()
+        row['pharmacy_id'] = m.pharmacy_id
+        row['pharmacy_name'] = m.pharmacy.shop_name
+        items.append(row)
+    return json.dumps({'items': items, 'total': page.total, 'page': 1, 'per_page': 100, 'pages': page.pages,
+                       'sort': 'id', 'q': ''})
+
+
+def orm_sos_feed():
+    return json.dumps([e.to_dict() for e in SOS.query.order_by(SOS.created_at.desc(), SOS.id)])
+
+
+def orm_expiry_scan():
+    threshold = date.today() + timedelta(days=30)
+    data = []
+    query = db.session.query(Medicine, Pharmacy).join(Pharmacy).filter(Medicine.expiry <= threshold).order_by(Medicine.id)
+    for med, pharma in query:
+        data.append({'med': med.name, 'pharma': pharma.shop_name, 'pharma_id': pharma.id,
+                     'expiry': med.expiry.strftime('%Y-%m-%d'), 'qty': med.qty})
+    return json.dumps(data)
+
+
+# --- Column-projected paths ---
+
+def projected_all_medicines():
+    projection = serializers.MEDICINE_WITH_PHARMACY
+    statement = serializers.medicines_select().order_by(Medicine.id)
+    return serializers.dumps(projection.rows(db.session.execute(statement)))
+
+
+def projected_medicines_page():
+    return serializers.dumps(fetch_page('medicines', {'per_page': '100'}))
+
+
+def projected_sos_feed():
+    statement = serializers.sos_select().order_by(SOS.created_at.desc(), SOS.id)
+    return serializers.dumps(serializers.SOS_REQUEST.rows(db.session.execute(statement)))
+
+
+def projected_expiry_scan():
+    threshold = date.today() + timedelta(days=30)
+    projection = serializers.EXPIRING_STOCK
+    statement = (projection.select().select_from(Medicine).join(Pharmacy)
+                 .where(Medicine.expiry <= threshold).order_by(Medicine.id))
+    return serializers.dumps(projection.rows(db.session.execute(statement)))
+
+
+CASES = [
+    (f'all medicines ({MEDICINES})', orm_all_medicines, projected_all_medicines),
+    ('medicines page (100)', orm_medicines_page, projected_medicines_page),
+    (f'SOS feed ({SOS_REQUESTS})', orm_sos_feed, projected_sos_feed),
+    ('global expiry scan', orm_expiry_scan, projected_expiry_scan),
+]
+
+
+def throughput(fn):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        fn()
+        db.session.expunge_all()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def peak_kib(fn):
+    db.session.expunge_all()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.expunge_all()
+    return peak / 1024
+
+
+def main():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        seed()
+        encoder = 'orjson' if serializers.HAS_ORJSON else 'json'
+        print(f'encoder: {encoder}')
+        print(f"{'payload':<24} {'to_dict req/s':>14} {'projected req/s':>16} {'to_dict KiB':>12} {'projected KiB':>14}")
+        for name, orm_fn, projected_fn in CASES:
+            assert json.loads(orm_fn()) == json.loads(projected_fn()), name
+            print(f'{name:<24} {throughput(orm_fn):>14.1f} {throughput(projected_fn):>16.1f} '
+                  f'{peak_kib(orm_fn):>12.0f} {peak_kib(projected_fn):>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,17 @@ import os
 import secrets
 from datetime import timedelta
 
+def search_backend_for(database_uri):
+    """Full-text search backend matching the database engine."""
+    override = os.environ.get('SEARCH_BACKEND')
+    if override:
+        return override
+    if database_uri.startswith('sqlite'):
+        return 'fts5'
+    if database_uri.startswith('postgresql'):
+        return 'tsvector'
+    return 'substring'
+
 class Config:
     """Base configuration"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
@@ -21,6 +32,42 @@ class Config:
     # Rate Limiting
     RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'True').lower() == 'true'
     RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
+    
+    # Geo Search
+    SEARCH_RADIUS_KM = float(os.environ.get('SEARCH_RADIUS_KM', 50))
+    GEO_INDEX_MAX_AGE = int(os.environ.get('GEO_INDEX_MAX_AGE', 300))  # seconds before the in-memory index is rebuilt
+    KNN_RING_SIZE = int(os.environ.get('KNN_RING_SIZE', 25))  # pharmacies queried per ring in k-nearest search
+    KNN_MAX_K = int(os.environ.get('KNN_MAX_K', 100))
+    SEARCH_RINGS_KM = [float(r) for r in os.environ.get('SEARCH_RINGS_KM', '2,5,15,50').split(',')]
+    SEARCH_BUDGET_MS = int(os.environ.get('SEARCH_BUDGET_MS', 250))  # default latency budget for ring expansion
+    TRIGRAM_MAX_CANDIDATES = int(os.environ.get('TRIGRAM_MAX_CANDIDATES', 5000))  # above this, fall back to ilike
+    SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 1024))  # cached (query, geo cell) result sets
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 60))  # seconds
+    SEARCH_CACHE_PRECISION = int(os.environ.get('SEARCH_CACHE_PRECISION', 5))  # geohash length of a cache cell (~5 km)
+    SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 10))  # seconds a coalesced request waits on the leader
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))  # rows per bulk INSERT in /pharmacy/import_stock
+    IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', 20000))  # rows accepted per upload
+    ADJUST_MAX_LINES = int(os.environ.get('ADJUST_MAX_LINES', 500))  # lines per /pharmacy/adjust_stock batch
+    SOS_DEDUP_WINDOW = int(os.environ.get('SOS_DEDUP_WINDOW', 600))  # seconds; a repeat SOS within this of the last press merges
+    SOS_DISPATCH_RADIUS_KM = float(os.environ.get('SOS_DISPATCH_RADIUS_KM', 5))  # pharmacies alerted around a patient's SOS
+    SOS_DISPATCH_LIMIT = int(os.environ.get('SOS_DISPATCH_LIMIT', 50))  # most pharmacies alerted per SOS
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # background job threads per process (0 = none)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))  # seconds an idle worker waits between polls
+    JOB_LEASE = int(os.environ.get('JOB_LEASE', 60))  # seconds before a claimed job counts as abandoned
+    JOB_BACKOFF = float(os.environ.get('JOB_BACKOFF', 2))  # first retry delay in seconds, doubled per attempt
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))  # attempts before a job is dead-lettered
+    SOS_TTL = int(os.environ.get('SOS_TTL', 86400))  # seconds an SOS stays open before the sweeper expires it
+    SOS_SWEEP_INTERVAL = int(os.environ.get('SOS_SWEEP_INTERVAL', 60))  # seconds between sweeps (0 = no sweeper thread)
+    SOS_SWEEP_BATCH = int(os.environ.get('SOS_SWEEP_BATCH', 500))  # SOS expired per transaction
+    SOS_SWEEP_MAX_BATCHES = int(os.environ.get('SOS_SWEEP_MAX_BATCHES', 20))  # batches per sweep; the rest wait for the next one
+    SOS_STREAM_BACKLOG = int(os.environ.get('SOS_STREAM_BACKLOG', 256))  # SOS events kept for Last-Event-ID resume
+    SOS_STREAM_HEARTBEAT = float(os.environ.get('SOS_STREAM_HEARTBEAT', 15))  # seconds between keep-alive comments
+    SOS_STREAM_LIFETIME = float(os.environ.get('SOS_STREAM_LIFETIME', 300))  # seconds before a stream closes; clients reconnect
+    SOS_STREAM_MAX = int(os.environ.get('SOS_STREAM_MAX', 10))  # open streams per process; keep below gunicorn --threads
+    SOS_STREAM_RETRY = int(os.environ.get('SOS_STREAM_RETRY', 30))  # seconds refused dashboards poll before retrying a stream
+    
+    # Max SQL statements per request; exceeding it raises. Off unless set.
+    QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 0)) or None
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -31,6 +78,7 @@ class DevelopmentConfig(Config):
         db_url = db_url.replace("postgres://", "postgresql://", 1)
     SQLALCHEMY_DATABASE_URI = db_url or 'sqlite:///medlink.db'
     SQLALCHEMY_ECHO = False  # Set to True to see SQL queries
+    SEARCH_BACKEND = search_backend_for(SQLALCHEMY_DATABASE_URI)
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -42,6 +90,7 @@ class ProductionConfig(Config):
     if db_url and db_url.startswith("postgres://"):
         db_url = db_url.replace("postgres://", "postgresql://", 1)
     SQLALCHEMY_DATABASE_URI = db_url or 'sqlite:///medlink.db'
+    SEARCH_BACKEND = search_backend_for(SQLALCHEMY_DATABASE_URI)
     
     # Force secure cookies in production
     SESSION_COOKIE_SECURE = True
@@ -53,8 +102,10 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SEARCH_BACKEND = search_backend_for(SQLALCHEMY_DATABASE_URI)
     WTF_CSRF_ENABLED = False
     RATELIMIT_ENABLED = False
+    QUERY_BUDGET = 25
 
 # Configuration dictionary
 config = {
@@ -0,0 +1,195 @@
+"""Running totals behind the admin dashboard tiles.
+
+Each tile is a row in the dashboard_counter table. Mapper events adjust the
+rows with ``UPDATE ... SET value = value + :delta`` on the flush connection,
+so a counter moves in the same transaction as the write that changed it.
+Bulk ``Query.delete()`` and ``insert(Medicine)`` calls skip mapper events;
+callers report those with medicines_removed() and medicines_added(). reconcile() recounts everything from the source tables.
+
+'expiring' counts medicines whose expiry falls on or before the row's
+window_end (today + EXPIRY_WINDOW_DAYS when it was last recounted). The
+window moves with the calendar, so read() recounts that one row, over the
+expiry index, whenever its window_end is out of date.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, inspect, select, update
+
+from models import DashboardCounter, Pharmacy, Medicine, Ambulance, SOS
+
+EXPIRY_WINDOW_DAYS = 30
+
+COUNTERS = ('pharmacies', 'verified_pharmacies', 'medicines', 'ambulances', 'open_sos', 'expiring')
+
+_table = DashboardCounter.__table__
+
+
+def expiry_window_end():
+    return datetime.utcnow().date() + timedelta(days=EXPIRY_WINDOW_DAYS)
+
+
+def adjust(connection, name, delta):
+    connection.execute(update(_table).where(_table.c.name == name).values(value=_table.c.value + delta))
+
+
+def adjust_expiring(connection, expiry, delta):
+    """Move 'expiring' when a medicine with this expiry date falls inside its window."""
+    if expiry is None:
+        return
+    connection.execute(
+        update(_table)
+        .where(_table.c.name == 'expiring', _table.c.window_end >= expiry)
+        .values(value=_table.c.value + delta)
+    )
+
+
+def _old_value(target, attr):
+    """Value of attr before the pending flush, or None if it did not change."""
+    history = inspect(target).attrs[attr].history
+    if not history.has_changes():
+        return None
+    return history.deleted[0] if history.deleted else None
+
+
+def _changed(target, attr):
+    return inspect(target).attrs[attr].history.has_changes()
+
+
+@event.listens_for(Pharmacy, 'after_insert')
+def _pharmacy_inserted(mapper, connection, target):
+    adjust(connection, 'pharmacies', 1)
+    if target.verified:
+        adjust(connection, 'verified_pharmacies', 1)
+
+
+@event.listens_for(Pharmacy, 'after_update')
+def _pharmacy_updated(mapper, connection, target):
+    if _changed(target, 'verified') and bool(_old_value(target, 'verified')) != bool(target.verified):
+        adjust(connection, 'verified_pharmacies', 1 if target.verified else -1)
+
+
+@event.listens_for(Pharmacy, 'after_delete')
+def _pharmacy_deleted(mapper, connection, target):
+    adjust(connection, 'pharmacies', -1)
+    if target.verified:
+        adjust(connection, 'verified_pharmacies', -1)
+
+
+@event.listens_for(Medicine, 'after_insert')
+def _medicine_inserted(mapper, connection, target):
+    adjust(connection, 'medicines', 1)
+    adjust_expiring(connection, target.expiry, 1)
+
+
+@event.listens_for(Medicine, 'after_update')
+def _medicine_updated(mapper, connection, target):
+    if _changed(target, 'expiry'):
+        adjust_expiring(connection, _old_value(target, 'expiry'), -1)
+        adjust_expiring(connection, target.expiry, 1)
+
+
+@event.listens_for(Medicine, 'after_delete')
+def _medicine_deleted(mapper, connection, target):
+    adjust(connection, 'medicines', -1)
+    adjust_expiring(connection, target.expiry, -1)
+
+
+@event.listens_for(Ambulance, 'after_insert')
+def _ambulance_inserted(mapper, connection, target):
+    adjust(connection, 'ambulances', 1)
+
+
+@event.listens_for(Ambulance, 'after_delete')
+def _ambulance_deleted(mapper, connection, target):
+    adjust(connection, 'ambulances', -1)
+
+
+@event.listens_for(SOS, 'after_insert')
+def _sos_inserted(mapper, connection, target):
+    if (target.status or 'open') == 'open':
+        adjust(connection, 'open_sos', 1)
+
+
+@event.listens_for(SOS, 'after_update')
+def _sos_updated(mapper, connection, target):
+    if _changed(target, 'status'):
+        was_open = _old_value(target, 'status') == 'open'
+        if was_open != (target.status == 'open'):
+            adjust(connection, 'open_sos', -1 if was_open else 1)
+
+
+@event.listens_for(SOS, 'after_delete')
+def _sos_deleted(mapper, connection, target):
+    if target.status == 'open':
+        adjust(connection, 'open_sos', -1)
+
+
+def _medicines_changed(session, expiries, sign):
+    # One UPDATE per distinct expiry date, not per row
+    per_date = Counter(expiries)
+    if not per_date:
+        return
+    connection = session.connection()
+    adjust(connection, 'medicines', sign * sum(per_date.values()))
+    for expiry, count in per_date.items():
+        adjust_expiring(connection, expiry, sign * count)
+
+
+def medicines_added(session, expiries):
+    """Record a bulk insert of medicines with the given expiry dates."""
+    _medicines_changed(session, expiries, 1)
+
+
+def medicines_removed(session, expiries):
+    """Record a bulk delete of medicines with the given expiry dates."""
+    _medicines_changed(session, expiries, -1)
+
+
+def _count_queries(window_end):
+    return {
+        'pharmacies': select(func.count(Pharmacy.id)),
+        'verified_pharmacies': select(func.count(Pharmacy.id)).where(Pharmacy.verified.is_(True)),
+        'medicines': select(func.count(Medicine.id)),
+        'ambulances': select(func.count(Ambulance.id)),
+        'open_sos': select(func.count(SOS.id)).where(SOS.status == 'open'),
+        'expiring': select(func.count(Medicine.id)).where(Medicine.expiry <= window_end),
+    }
+
+
+def reconcile(session, names=COUNTERS):
+    """Recount the named counters from the source tables and commit.
+
+    Returns {name: value}.
+    """
+    window_end = expiry_window_end()
+    queries = _count_queries(window_end)
+    counts = {name: session.scalar(queries[name]) for name in names}
+    rows = {row.name: row for row in session.scalars(
+        select(DashboardCounter).where(DashboardCounter.name.in_(list(counts))).with_for_update())}
+    for name, value in counts.items():
+        row = rows.get(name)
+        if row is None:
+            row = DashboardCounter(name=name)
+            session.add(row)
+        row.value = value
+        row.window_end = window_end if name == 'expiring' else None
+    session.commit()
+    return counts
+
+
+def read(session):
+    """All counters as {name: value}, read with one SELECT of a handful of rows.
+
+    Missing rows (a fresh database) trigger a full reconcile. A stale
+    expiry window only recounts 'expiring'.
+    """
+    # dashboard_counter also holds a version row per table and per pharmacy (table_versions)
+    rows = {row.name: row for row in session.scalars(
+        select(DashboardCounter).where(DashboardCounter.name.in_(COUNTERS)))}
+    if any(name not in rows for name in COUNTERS):
+        return reconcile(session)
+    values = {name: rows[name].value for name in COUNTERS}
+    if rows['expiring'].window_end != expiry_window_end():
+        values.update(reconcile(session, ['expiring']))
+    return values
@@ -0,0 +1,124 @@
+"""Batch great-circle distance engine.
+
+Coordinates are held in contiguous float arrays so the distance, radius
+filter and sort for a whole candidate set run in one pass. NumPy is used when
+it is installed; otherwise the same maths runs over array('d') buffers.
+"""
+import heapq
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when NumPy is absent
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+
+HAS_NUMPY = np is not None
+
+
+class PointSet:
+    """Immutable set of (id, lat, lng) points stored column-wise."""
+
+    def __init__(self, ids, lats, lngs, use_numpy=HAS_NUMPY):
+        self.ids = list(ids)
+        self.use_numpy = use_numpy and HAS_NUMPY
+        if self.use_numpy:
+            self._lat = np.radians(np.asarray(lats, dtype=np.float64))
+            self._lng = np.radians(np.asarray(lngs, dtype=np.float64))
+            self._cos_lat = np.cos(self._lat)
+        else:
+            self._lat = array('d', (math.radians(v) for v in lats))
+            self._lng = array('d', (math.radians(v) for v in lngs))
+            self._cos_lat = array('d', (math.cos(v) for v in self._lat))
+
+    @classmethod
+    def from_rows(cls, rows, use_numpy=HAS_NUMPY):
+        """Build from (id, lat, lng) rows, skipping rows without coordinates."""
+        ids, lats, lngs = [], [], []
+        for point_id, lat, lng in rows:
+            if lat is None or lng is None:
+                continue
+            ids.append(point_id)
+            lats.append(lat)
+            lngs.append(lng)
+        return cls(ids, lats, lngs, use_numpy=use_numpy)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, lat, lng, ranges=None):
+        """Distances in km from (lat, lng) to every point, or to the given slices.
+
+        Returns (positions, distances) where positions index into self.ids.
+        """
+        lat_r = math.radians(lat)
+        lng_r = math.radians(lng)
+        cos_lat = math.cos(lat_r)
+        if self.use_numpy:
+            if ranges is None:
+                positions = np.arange(len(self.ids))
+            elif ranges:
+                positions = np.concatenate([np.arange(lo, hi) for lo, hi in ranges])
+            else:
+                positions = np.empty(0, dtype=np.intp)
+            dlat = self._lat[positions] - lat_r
+            dlng = self._lng[positions] - lng_r
+            a = np.sin(dlat / 2) ** 2 + cos_lat * self._cos_lat[positions] * np.sin(dlng / 2) ** 2
+            return positions, 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        if ranges is None:
+            ranges = [(0, len(self.ids))]
+        positions = []
+        dists = []
+        sin = math.sin
+        p_lat, p_lng, p_cos = self._lat, self._lng, self._cos_lat
+        for lo, hi in ranges:
+            for i in range(lo, hi):
+                a = sin((p_lat[i] - lat_r) / 2) ** 2 + cos_lat * p_cos[i] * sin((p_lng[i] - lng_r) / 2) ** 2
+                positions.append(i)
+                dists.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+        return positions, dists
+
+    def within(self, lat, lng, radius_km=None, limit=None, ranges=None):
+        """Return [(id, distance_km), ...] inside radius_km, nearest first."""
+        if not self.use_numpy:
+            pairs = self._within_python(lat, lng, radius_km, ranges)
+            pairs = heapq.nsmallest(limit, pairs) if limit is not None else sorted(pairs)
+            return [(self.ids[p], d) for d, p in pairs]
+
+        positions, dists = self.distances(lat, lng, ranges)
+        if radius_km is not None:
+            mask = dists <= radius_km
+            positions, dists = positions[mask], dists[mask]
+        if limit is not None and limit < len(dists):
+            top = np.argpartition(dists, limit)[:limit]
+            positions, dists = positions[top], dists[top]
+        order = np.argsort(dists, kind='stable')
+        ids = self.ids
+        return [(ids[p], float(d)) for p, d in zip(positions[order].tolist(), dists[order].tolist())]
+
+    def _within_python(self, lat, lng, radius_km, ranges):
+        """(distance, position) pairs inside radius_km, filtered in the same pass as the maths."""
+        lat_r = math.radians(lat)
+        lng_r = math.radians(lng)
+        cos_lat = math.cos(lat_r)
+        # A point is at least |dlat| * R away, so most points outside the radius
+        # are rejected before any trigonometry
+        max_dlat = radius_km / EARTH_RADIUS_KM if radius_km is not None else math.inf
+        radius = radius_km if radius_km is not None else math.inf
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+        p_lat, p_lng, p_cos = self._lat, self._lng, self._cos_lat
+        pairs = []
+        for lo, hi in ranges if ranges is not None else [(0, len(self.ids))]:
+            for i in range(lo, hi):
+                dlat = p_lat[i] - lat_r
+                if dlat > max_dlat or -dlat > max_dlat:
+                    continue
+                a = sin(dlat / 2) ** 2 + cos_lat * p_cos[i] * sin((p_lng[i] - lng_r) / 2) ** 2
+                d = 2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0)))
+                if d <= radius:
+                    pairs.append((d, i))
+        return pairs
+
@@ -0,0 +1,287 @@
+"""Geospatial helpers: distance, geohash encoding and an in-memory cell index."""
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+
+from sqlalchemy import and_, or_
+
+from distance import EARTH_RADIUS_KM, PointSet
+
+# Length of one degree of latitude on the same sphere haversine() uses
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+# Points are stored at full precision; queries pick a coarser prefix length
+INDEX_PRECISION = 9
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Radius of the Earth in km
+    R = EARTH_RADIUS_KM
+
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+
+    a = math.sin(dlat / 2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    distance = R * c
+    return distance
+
+
+def bounding_box(lat, lng, radius_km):
+    """Lat/lng box enclosing a search circle: (min_lat, max_lat, min_lng, max_lng).
+
+    The box is clamped at the poles. When it crosses the antimeridian,
+    min_lng is greater than max_lng.
+    """
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    min_lat = max(lat - dlat, -90.0)
+    max_lat = min(lat + dlat, 90.0)
+    # Widest point of the circle is at the latitude closest to a pole
+    widest = max(abs(min_lat), abs(max_lat))
+    cos_lat = math.cos(math.radians(widest))
+    if min_lat <= -90.0 or max_lat >= 90.0 or cos_lat <= 0:
+        return min_lat, max_lat, -180.0, 180.0
+    dlng = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+    if dlng >= 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+    min_lng = (lng - dlng + 180) % 360 - 180
+    max_lng = (lng + dlng + 180) % 360 - 180
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def bbox_filter(model, lat, lng, radius_km):
+    """SQL criterion keeping rows of model whose latitude/longitude fall in the box.
+
+    Works for any model with latitude and longitude columns (Hospital,
+    Pharmacy, SOS) and can use a composite (latitude, longitude) index.
+    Rows without coordinates never match.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    lat_clause = model.latitude.between(min_lat, max_lat)
+    if min_lng <= max_lng:
+        lng_clause = model.longitude.between(min_lng, max_lng)
+    else:
+        lng_clause = or_(model.longitude >= min_lng, model.longitude <= max_lng)
+    return and_(lat_clause, lng_clause)
+
+
+def geohash_encode(lat, lng, precision=INDEX_PRECISION):
+    """Encode a coordinate as a base32 geohash string."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                value = (value << 1) | 1
+                lng_lo = mid
+            else:
+                value <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(cell):
+    """Return (lat_lo, lat_hi, lng_lo, lng_hi) for a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for ch in cell:
+        value = _DECODE[ch]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def cell_size_degrees(precision):
+    """Height and width in degrees of a geohash cell of the given length."""
+    total_bits = precision * 5
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def precision_for_radius(lat, radius_km):
+    """Longest geohash length whose cells are at least radius_km across at lat.
+
+    With cells that large, the centre cell plus its eight neighbours always
+    covers the full search circle.
+    """
+    poleward = min(abs(lat) + radius_km / KM_PER_DEGREE_LAT, 89.9)
+    cos_lat = math.cos(math.radians(poleward))
+    for precision in range(INDEX_PRECISION, 0, -1):
+        height, width = cell_size_degrees(precision)
+        if height * KM_PER_DEGREE_LAT >= radius_km and width * KM_PER_DEGREE_LAT * cos_lat >= radius_km:
+            return precision
+    return 0
+
+
+def cell_area(lat, lng, precision):
+    """Geohash cell containing a point: (cell, centre_lat, centre_lng, reach_km).
+
+    reach_km is the distance from the centre to the farthest corner, so a
+    circle of radius r around any point in the cell lies inside the circle of
+    radius r + reach_km around the centre.
+    """
+    cell = geohash_encode(lat, lng, precision)
+    lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds(cell)
+    centre_lat = (lat_lo + lat_hi) / 2
+    centre_lng = (lng_lo + lng_hi) / 2
+    reach = max(haversine(centre_lat, centre_lng, c_lat, c_lng)
+                for c_lat in (lat_lo, lat_hi) for c_lng in (lng_lo, lng_hi))
+    return cell, centre_lat, centre_lng, reach
+
+
+def covering_cells(lat, lng, radius_km):
+    """Geohash prefixes (centre cell and neighbours) that cover a search circle."""
+    precision = precision_for_radius(lat, radius_km)
+    if precision == 0:
+        return ['']
+    height, width = cell_size_degrees(precision)
+    lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds(geohash_encode(lat, lng, precision))
+    centre_lat = (lat_lo + lat_hi) / 2
+    centre_lng = (lng_lo + lng_hi) / 2
+
+    cells = set()
+    for dlat in (-height, 0, height):
+        cell_lat = centre_lat + dlat
+        if cell_lat < -90 or cell_lat > 90:
+            continue
+        for dlng in (-width, 0, width):
+            cell_lng = (centre_lng + dlng + 180) % 360 - 180
+            cells.add(geohash_encode(cell_lat, cell_lng, precision))
+    return sorted(cells)
+
+
+class GeoIndex:
+    """In-memory geohash index mapping point ids to coordinates.
+
+    Points are kept in a sorted list of (geohash, id) pairs so each covering
+    cell is a contiguous prefix range found with bisect. A radius query
+    therefore only touches the points in the nine cells around the centre,
+    regardless of how many points are indexed overall. Coordinates are mirrored
+    into a PointSet in the same order, so distances for those ranges are worked
+    out in one batch.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.built_at = None
+        self._entries = []
+        self._points = {}
+        self._array = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, point_id):
+        return point_id in self._points
+
+    @property
+    def is_stale(self):
+        if self.built_at is None:
+            return True
+        return self.max_age is not None and time.monotonic() - self.built_at > self.max_age
+
+    def rebuild(self, rows):
+        """Replace the index contents with (id, lat, lng) rows."""
+        points = {}
+        for point_id, lat, lng in rows:
+            if lat is None or lng is None:
+                continue
+            points[point_id] = (geohash_encode(lat, lng), lat, lng)
+        entries = sorted((gh, point_id) for point_id, (gh, _, _) in points.items())
+        with self._lock:
+            self._points = points
+            self._entries = entries
+            self._array = None
+            self.built_at = time.monotonic()
+
+    def add(self, point_id, lat, lng):
+        """Insert or move a point. Points without coordinates are dropped."""
+        with self._lock:
+            self._discard(point_id)
+            if lat is None or lng is None:
+                return
+            gh = geohash_encode(lat, lng)
+            self._points[point_id] = (gh, lat, lng)
+            insort(self._entries, (gh, point_id))
+            self._array = None
+
+    def remove(self, point_id):
+        with self._lock:
+            self._discard(point_id)
+
+    def _discard(self, point_id):
+        existing = self._points.pop(point_id, None)
+        if existing is None:
+            return
+        pos = bisect_left(self._entries, (existing[0], point_id))
+        if pos < len(self._entries) and self._entries[pos] == (existing[0], point_id):
+            del self._entries[pos]
+        self._array = None
+
+    def candidates(self, lat, lng, radius_km):
+        """Ids of points in the cells covering the circle (may include points outside it)."""
+        with self._lock:
+            return [self._entries[i][1] for lo, hi in self._ranges(lat, lng, radius_km) for i in range(lo, hi)]
+
+    def within(self, lat, lng, radius_km, limit=None):
+        """Return {id: distance_km} for indexed points inside the circle, nearest first."""
+        with self._lock:
+            ranges = self._ranges(lat, lng, radius_km)
+            if self._array is None:
+                self._array = PointSet(
+                    [point_id for _, point_id in self._entries],
+                    [self._points[point_id][1] for _, point_id in self._entries],
+                    [self._points[point_id][2] for _, point_id in self._entries],
+                )
+            points = self._array
+        return dict(points.within(lat, lng, radius_km, limit=limit, ranges=ranges))
+
+    def _ranges(self, lat, lng, radius_km):
+        ranges = []
+        for prefix in covering_cells(lat, lng, radius_km):
+            # '~' sorts after every base32 character, closing the prefix range
+            lo = bisect_left(self._entries, (prefix,))
+            hi = bisect_left(self._entries, (prefix + '~',))
+            if lo < hi:
+                ranges.append((lo, hi))
+        return ranges
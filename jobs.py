@@ -0,0 +1,208 @@
+"""Durable background jobs: a database job table worked by in-process threads.
+
+enqueue() adds a Job row in the caller's transaction, so a job exists if and
+only if the work that asked for it was committed. Worker threads claim due
+jobs with a compare-and-set UPDATE that also takes a lease (locked_until).
+That is safe across threads and across worker processes without row locks.
+A job whose worker died or hung is picked up again once its lease runs out,
+as long as it has attempts left; otherwise it is dead-lettered.
+
+A handler's writes and the job's 'done' mark commit together; it may return
+a callable to run after that commit, e.g. to publish an event. The 'done'
+mark only matches while the job is still on the claiming attempt, so a run
+that outlived its lease and was reclaimed rolls back instead of committing
+alongside the new run. A handler that raises is rolled back and retried with
+exponential backoff until max_attempts is reached. The job is then left as
+'dead' with its last error, for inspection and requeue_dead().
+"""
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_, select, update
+
+from models import Job
+
+log = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, workers=2, poll_interval=1.0, lease=60, backoff=2.0, max_attempts=5):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        self._handlers = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def handler(self, kind):
+        """Register fn(payload) as the handler for jobs of this kind.
+
+        fn runs in an app context and writes through db.session. It may
+        return a callable to be run once its writes are committed.
+        """
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def enqueue(self, session, kind, payload, delay=0):
+        """Add a job to session; it runs once the session commits."""
+        if kind not in self._handlers:
+            raise KeyError(f'No handler for job kind {kind!r}')
+        job = Job(kind=kind, payload=payload, max_attempts=self.max_attempts,
+                  run_at=datetime.utcnow() + timedelta(seconds=delay))
+        session.add(job)
+        return job
+
+    def notify(self):
+        """Wake idle workers now rather than at their next poll."""
+        self._wake.set()
+
+    # --- workers ---
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self, app, db):
+        """Start the worker threads once per process."""
+        if self._threads and self.running:
+            return
+        with self._lock:
+            if self.running or self.workers <= 0:
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._work, args=(app, db), name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self, app, db):
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    ran = self.run_next(db.session)
+                    db.session.remove()
+            except Exception:
+                log.exception('Job worker loop failed')
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _due(self, now):
+        return or_(
+            and_(Job.status == 'pending', Job.run_at <= now),
+            and_(Job.status == 'running', Job.locked_until < now, Job.attempts < Job.max_attempts),
+        )
+
+    def _dead_letter_expired(self, session, now):
+        """Kill jobs whose lease ran out on their last attempt."""
+        dead = session.execute(
+            update(Job)
+            .where(Job.status == 'running', Job.locked_until < now, Job.attempts >= Job.max_attempts)
+            .values(status='dead', locked_until=None, finished_at=now,
+                    last_error='Lease expired on the last attempt (worker died or handler hung)')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if dead:
+            session.commit()
+            log.error('%s job(s) dead after their last lease expired', dead)
+
+    def claim(self, session):
+        """Lease one due job and return it, or None. Commits the claim."""
+        now = datetime.utcnow()
+        self._dead_letter_expired(session, now)
+        candidates = session.scalars(select(Job.id).where(self._due(now)).order_by(Job.run_at, Job.id).limit(5)).all()
+        for job_id in candidates:
+            claimed = session.execute(
+                update(Job)
+                .where(Job.id == job_id, self._due(now))
+                .values(status='running', attempts=Job.attempts + 1,
+                        locked_until=now + timedelta(seconds=self.lease))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            session.commit()
+            if claimed:
+                return session.get(Job, job_id, populate_existing=True)
+        return None
+
+    def run_next(self, session):
+        """Claim and run one job. Returns False when nothing was due."""
+        job = self.claim(session)
+        if job is None:
+            return False
+        job_id, kind, payload, attempt = job.id, job.kind, dict(job.payload or {}), job.attempts
+        try:
+            handler = self._handlers.get(kind)
+            if handler is None:
+                raise KeyError(f'No handler for job kind {kind!r}')
+            after_commit = handler(payload)
+            finished = session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == 'running', Job.attempts == attempt)
+                .values(status='done', locked_until=None, finished_at=datetime.utcnow(), last_error=None)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not finished:
+                # The lease ran out and another run owns the job now; drop this run's writes
+                session.rollback()
+                log.warning('Job %s (%s) attempt %s lost its lease; discarded', job_id, kind, attempt)
+                return True
+            session.commit()
+        except Exception:
+            session.rollback()
+            self._failed(session, job_id, attempt, traceback.format_exc(limit=5))
+            return True
+        if callable(after_commit):
+            try:
+                after_commit()
+            except Exception:
+                log.exception('After-commit hook of job %s (%s) failed', job_id, kind)
+        return True
+
+    def _failed(self, session, job_id, attempt, error):
+        job = session.get(Job, job_id, populate_existing=True)
+        if job.status != 'running' or job.attempts != attempt:
+            return  # reclaimed after the lease ran out; the newer run decides
+        if job.attempts >= job.max_attempts:
+            job.status, job.finished_at = 'dead', datetime.utcnow()
+            log.error('Job %s (%s) is dead after %s attempts', job.id, job.kind, job.attempts)
+        else:
+            job.status = 'pending'
+            job.run_at = datetime.utcnow() + timedelta(seconds=self.backoff * 2 ** (job.attempts - 1))
+        job.locked_until = None
+        job.last_error = error[-4000:]
+        session.commit()
+
+    # --- inspection ---
+
+    def stats(self, session):
+        counts = dict(session.execute(select(Job.status, func.count(Job.id)).group_by(Job.status)).all())
+        return {'workers': self.workers, 'running': self.running, 'jobs': counts}
+
+    def requeue_dead(self, session, kind=None):
+        """Give dead jobs a fresh set of attempts. Returns how many."""
+        statement = update(Job).where(Job.status == 'dead')
+        if kind:
+            statement = statement.where(Job.kind == kind)
+        count = session.execute(statement.values(status='pending', attempts=0, run_at=datetime.utcnow(),
+                                                 finished_at=None)
+                                .execution_options(synchronize_session=False)).rowcount
+        session.commit()
+        self.notify()
+        return count
@@ -0,0 +1,28 @@
+"""Composite (latitude, longitude) index on hospital
+
+Revision ID: 3f1c2a9b7d10
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables are created by db.create_all(); databases created after this
+    # index was added to the model already have it.
+    with op.batch_alter_table('hospital', schema=None) as batch_op:
+        batch_op.create_index('ix_hospital_lat_lng', ['latitude', 'longitude'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    with op.batch_alter_table('hospital', schema=None) as batch_op:
+        batch_op.drop_index('ix_hospital_lat_lng', if_exists=True)
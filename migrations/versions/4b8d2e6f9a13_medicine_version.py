@@ -0,0 +1,50 @@
+"""Medicine.version for optimistic locking; FTS update trigger on text columns only
+
+Revision ID: 4b8d2e6f9a13
+Revises: e2b7f3a91c64
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8d2e6f9a13'
+down_revision = 'e2b7f3a91c64'
+branch_labels = None
+depends_on = None
+
+FTS_COLUMNS = ('name', 'generic_name', 'manufacturer', 'description')
+
+
+def fts_update_trigger(columns=None):
+    cols = ', '.join(FTS_COLUMNS)
+    new_cols = ', '.join(f'new.{c}' for c in FTS_COLUMNS)
+    old_cols = ', '.join(f'old.{c}' for c in FTS_COLUMNS)
+    of = f' OF {", ".join(columns)}' if columns else ''
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS medicine_fts_au AFTER UPDATE{of} ON medicine BEGIN "
+        f"INSERT INTO medicine_fts(medicine_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+        f"INSERT INTO medicine_fts(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+    )
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Tables made by db.create_all() already have the column
+    if 'version' not in {c['name'] for c in sa.inspect(bind).get_columns('medicine')}:
+        op.add_column('medicine', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    if bind.dialect.name == 'sqlite':
+        # Stock adjustments only touch qty/version; keep them from rewriting the FTS row
+        op.execute('DROP TRIGGER IF EXISTS medicine_fts_au')
+        op.execute(fts_update_trigger(FTS_COLUMNS))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS medicine_fts_au')
+        op.execute(fts_update_trigger())
+    # Plain ALTER TABLE: a batch table rebuild would drop the FTS triggers
+    op.drop_column('medicine', 'version')
@@ -0,0 +1,34 @@
+"""SystemAlert.sos_id for geo-targeted SOS dispatch
+
+Revision ID: 7d3a5c1e8b42
+Revises: 4b8d2e6f9a13
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3a5c1e8b42'
+down_revision = '4b8d2e6f9a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables made by db.create_all() already have the column
+    if 'sos_id' not in {c['name'] for c in sa.inspect(op.get_bind()).get_columns('system_alert')}:
+        # Batch mode: SQLite cannot add a foreign key with ALTER TABLE
+        with op.batch_alter_table('system_alert', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('sos_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key('fk_system_alert_sos_id', 'sos', ['sos_id'], ['id'])
+    op.create_index('ix_system_alert_pharmacy_sos', 'system_alert', ['pharmacy_id', 'sos_id'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_system_alert_pharmacy_sos', table_name='system_alert', if_exists=True)
+    with op.batch_alter_table('system_alert', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_system_alert_sos_id', type_='foreignkey')
+        batch_op.drop_column('sos_id')
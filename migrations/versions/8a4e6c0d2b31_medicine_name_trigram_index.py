@@ -0,0 +1,30 @@
+"""pg_trgm GIN index on medicine.name for substring search
+
+Revision ID: 8a4e6c0d2b31
+Revises: 3f1c2a9b7d10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6c0d2b31'
+down_revision = '3f1c2a9b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite deployments use the in-process TrigramIndex instead
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_medicine_name_trgm ON medicine USING gin (name gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX IF EXISTS ix_medicine_name_trgm')
@@ -0,0 +1,41 @@
+"""Background job table
+
+Revision ID: a6e4c2b9d805
+Revises: 7d3a5c1e8b42
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e4c2b9d805'
+down_revision = '7d3a5c1e8b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_job_status_run_at', 'job', ['status', 'run_at'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_job_status_run_at', table_name='job', if_exists=True)
+    op.drop_table('job', if_exists=True)
@@ -0,0 +1,72 @@
+"""SOS.medicine_key/request_count/updated_at; one open SOS per patient and medicine
+
+Revision ID: b3f7d9a1c6e0
+Revises: a6e4c2b9d805
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f7d9a1c6e0'
+down_revision = 'a6e4c2b9d805'
+branch_labels = None
+depends_on = None
+
+OPEN = sa.text("status = 'open'")
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def medicine_key(name):
+    # Same as result_cache.normalize_query, frozen here
+    return ' '.join(_TOKEN.findall((name or '').lower()))[:100]
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Tables made by db.create_all() already have the columns
+    columns = {c['name'] for c in sa.inspect(bind).get_columns('sos')}
+    if 'medicine_key' not in columns:
+        op.add_column('sos', sa.Column('medicine_key', sa.String(length=100), nullable=True))
+    if 'request_count' not in columns:
+        op.add_column('sos', sa.Column('request_count', sa.Integer(), nullable=False, server_default='1'))
+    if 'updated_at' not in columns:
+        op.add_column('sos', sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    sos = sa.table('sos', sa.column('id', sa.Integer), sa.column('patient_id', sa.Integer),
+                   sa.column('medicine_name', sa.String), sa.column('medicine_key', sa.String),
+                   sa.column('status', sa.String), sa.column('request_count', sa.Integer),
+                   sa.column('created_at', sa.DateTime), sa.column('updated_at', sa.DateTime))
+    bind.execute(sos.update().where(sos.c.updated_at.is_(None)).values(updated_at=sos.c.created_at))
+    rows = bind.execute(sa.select(sos.c.id, sos.c.medicine_name)
+                        .where(sos.c.medicine_key.is_(None))).all()
+    for row in rows:
+        bind.execute(sos.update().where(sos.c.id == row.id).values(medicine_key=medicine_key(row.medicine_name)))
+
+    # Collapse existing duplicate open SOS into the newest one so the unique index can be built
+    duplicates = bind.execute(
+        sa.select(sos.c.patient_id, sos.c.medicine_key, sa.func.max(sos.c.id), sa.func.sum(sos.c.request_count))
+        .where(OPEN).group_by(sos.c.patient_id, sos.c.medicine_key).having(sa.func.count(sos.c.id) > 1)
+    ).all()
+    for patient_id, key, keep_id, total in duplicates:
+        bind.execute(sos.update().where(sos.c.id == keep_id).values(request_count=total))
+        bind.execute(sos.update().where(OPEN, sos.c.patient_id == patient_id, sos.c.medicine_key == key,
+                                        sos.c.id != keep_id).values(status='expired'))
+    if duplicates:
+        # The open SOS count changed behind the ORM; a missing row makes counters.read() reconcile
+        op.execute("DELETE FROM dashboard_counter WHERE name = 'open_sos'")
+
+    op.create_index('uq_sos_open_patient_medicine', 'sos', ['patient_id', 'medicine_key'], unique=True,
+                    sqlite_where=OPEN, postgresql_where=OPEN, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('uq_sos_open_patient_medicine', table_name='sos', if_exists=True)
+    # Plain ALTER TABLE DROP COLUMN (SQLite 3.35+), as for medicine.version
+    op.drop_column('sos', 'updated_at')
+    op.drop_column('sos', 'request_count')
+    op.drop_column('sos', 'medicine_key')
@@ -0,0 +1,66 @@
+"""Full-text search indexes (SQLite FTS5 tables / Postgres tsvector GIN)
+
+Revision ID: c5d9e1f4a7b2
+Revises: 8a4e6c0d2b31
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d9e1f4a7b2'
+down_revision = '8a4e6c0d2b31'
+branch_labels = None
+depends_on = None
+
+FTS_TABLES = {
+    'medicine': ('name', 'generic_name', 'manufacturer', 'description'),
+    'medicine_alternative': ('medicine_name',),
+}
+
+
+def sqlite_statements(table, columns):
+    fts = f'{table}_fts'
+    cols = ', '.join(columns)
+    new_cols = ', '.join(f'new.{c}' for c in columns)
+    old_cols = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, "
+        f"content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        # Index rows that existed before the table was created
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def postgres_document(columns):
+    return "to_tsvector('simple', " + " || ' ' || ".join(f"coalesce({c}, '')" for c in columns) + ")"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table, columns in FTS_TABLES.items():
+        if dialect == 'sqlite':
+            for statement in sqlite_statements(table, columns):
+                op.execute(statement)
+        elif dialect == 'postgresql':
+            op.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_fts ON {table} USING gin (({postgres_document(columns)}))')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in FTS_TABLES:
+        if dialect == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+            op.execute(f'DROP TABLE IF EXISTS {table}_fts')
+        elif dialect == 'postgresql':
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_fts')
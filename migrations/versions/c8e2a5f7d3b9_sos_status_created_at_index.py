@@ -0,0 +1,24 @@
+"""Composite sos(status, created_at) index for the SOS expiry sweep
+
+Revision ID: c8e2a5f7d3b9
+Revises: b3f7d9a1c6e0
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e2a5f7d3b9'
+down_revision = 'b3f7d9a1c6e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_sos_status_created_at', 'sos', ['status', 'created_at'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_sos_status_created_at', table_name='sos', if_exists=True)
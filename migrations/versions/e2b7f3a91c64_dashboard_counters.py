@@ -0,0 +1,37 @@
+"""Dashboard counters table and medicine expiry index
+
+Revision ID: e2b7f3a91c64
+Revises: c5d9e1f4a7b2
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7f3a91c64'
+down_revision = 'c5d9e1f4a7b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are filled by `flask reconcile-counters` (or on the first dashboard read)
+    op.create_table(
+        'dashboard_counter',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.Column('window_end', sa.Date(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+        if_not_exists=True,
+    )
+    # Keeps the daily recount of the 'expiring' counter to an index range scan
+    with op.batch_alter_table('medicine', schema=None) as batch_op:
+        batch_op.create_index('ix_medicine_expiry', ['expiry'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    with op.batch_alter_table('medicine', schema=None) as batch_op:
+        batch_op.drop_index('ix_medicine_expiry', if_exists=True)
+    op.drop_table('dashboard_counter', if_exists=True)
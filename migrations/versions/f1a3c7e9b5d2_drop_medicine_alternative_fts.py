@@ -0,0 +1,47 @@
+"""Drop the medicine_alternative full-text index; alternatives are matched in memory
+
+Revision ID: f1a3c7e9b5d2
+Revises: c8e2a5f7d3b9
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a3c7e9b5d2'
+down_revision = 'c8e2a5f7d3b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f'DROP TRIGGER IF EXISTS medicine_alternative_fts_{suffix}')
+        op.execute('DROP TABLE IF EXISTS medicine_alternative_fts')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_medicine_alternative_fts')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS medicine_alternative_fts USING fts5(medicine_name, "
+                   "content='medicine_alternative', content_rowid='id', "
+                   "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        op.execute("CREATE TRIGGER IF NOT EXISTS medicine_alternative_fts_ai AFTER INSERT ON medicine_alternative BEGIN "
+                   "INSERT INTO medicine_alternative_fts(rowid, medicine_name) VALUES (new.id, new.medicine_name); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS medicine_alternative_fts_ad AFTER DELETE ON medicine_alternative BEGIN "
+                   "INSERT INTO medicine_alternative_fts(medicine_alternative_fts, rowid, medicine_name) "
+                   "VALUES ('delete', old.id, old.medicine_name); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS medicine_alternative_fts_au AFTER UPDATE ON medicine_alternative BEGIN "
+                   "INSERT INTO medicine_alternative_fts(medicine_alternative_fts, rowid, medicine_name) "
+                   "VALUES ('delete', old.id, old.medicine_name); "
+                   "INSERT INTO medicine_alternative_fts(rowid, medicine_name) VALUES (new.id, new.medicine_name); END")
+        op.execute("INSERT INTO medicine_alternative_fts(medicine_alternative_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute("CREATE INDEX IF NOT EXISTS ix_medicine_alternative_fts ON medicine_alternative "
+                   "USING gin ((to_tsvector('simple', coalesce(medicine_name, ''))))")
@@ -66,8 +66,12 @@ class Medicine(db.Model):
     manufacturer = db.Column(db.String(100), nullable=True)
     description = db.Column(db.String(500), nullable=True)
     qty = db.Column(db.Integer, nullable=False)
-    expiry = db.Column(db.Date, nullable=False)
+    expiry = db.Column(db.Date, nullable=False, index=True)
     price = db.Column(db.Float, nullable=True)
+    # Optimistic lock: ORM flushes check and bump it, adjust_stock does the same in SQL
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
 
     def to_dict(self):
         return {
@@ -77,7 +81,8 @@ class Medicine(db.Model):
             'price': self.price,
             'expiry': self.expiry.strftime('%Y-%m-%d') if self.expiry else None,
             'description': self.description,
-            'manufacturer': self.manufacturer
+            'manufacturer': self.manufacturer,
+            'version': self.version
         }
 
 class Review(db.Model):
@@ -98,6 +103,10 @@ class Review(db.Model):
         }
 
 class Hospital(db.Model):
+    __table_args__ = (
+        db.Index('ix_hospital_lat_lng', 'latitude', 'longitude'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     address = db.Column(db.String(255), nullable=True)
@@ -122,13 +131,25 @@ class Hospital(db.Model):
         }
 
 class SOS(db.Model):
+    __table_args__ = (
+        # At most one open SOS per patient and medicine; repeat presses merge into it (send_sos)
+        db.Index('uq_sos_open_patient_medicine', 'patient_id', 'medicine_key', unique=True,
+                 sqlite_where=db.text("status = 'open'"), postgresql_where=db.text("status = 'open'")),
+        # Open SOS by age for the expiry sweep (oldest first); the status prefix serves open_sos counts.
+        # Pharmacy dashboards go through ix_system_alert_pharmacy_sos instead (open_emergencies)
+        db.Index('ix_sos_status_created_at', 'status', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     medicine_name = db.Column(db.String(100), nullable=False)
+    medicine_key = db.Column(db.String(100), nullable=True)  # normalized medicine_name, for deduplication
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
-    status = db.Column(db.String(20), default='open') # 'open', 'resolved'
+    status = db.Column(db.String(20), default='open') # 'open', 'resolved', 'expired'
+    request_count = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # presses merged into this SOS
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # last press
     
     patient = db.relationship('User', backref='sos_requests')
 
@@ -142,7 +163,8 @@ class SOS(db.Model):
             'phone': self.patient.phone or self.patient.username if self.patient else '',
             'status': self.status,
             'latitude': self.latitude,
-            'longitude': self.longitude
+            'longitude': self.longitude,
+            'request_count': self.request_count
         }
 
 class Ambulance(db.Model):
@@ -165,12 +187,18 @@ class Ambulance(db.Model):
         }
 
 class SystemAlert(db.Model):
+    __table_args__ = (
+        # A pharmacy's targeted SOS (pharmacy_dashboard)
+        db.Index('ix_system_alert_pharmacy_sos', 'pharmacy_id', 'sos_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     pharmacy_id = db.Column(db.Integer, db.ForeignKey('pharmacy.id'), nullable=False)
     message = db.Column(db.String(500), nullable=False)
     type = db.Column(db.String(50), default='info') # 'info', 'warning', 'danger'
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sos_id = db.Column(db.Integer, db.ForeignKey('sos.id'), nullable=True)  # set on SOS dispatch alerts
     
     pharmacy = db.relationship('Pharmacy', backref='alerts')
 
@@ -187,3 +215,28 @@ class MedicineAlternative(db.Model):
     medicine_name = db.Column(db.String(100), nullable=False)  # Brand name (e.g., "Dolo")
     alternative_name = db.Column(db.String(100), nullable=False)  # Generic/Alternative (e.g., "Paracetamol")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DashboardCounter(db.Model):
+    """Running total shown on an admin dashboard tile (maintained by counters.py)"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    window_end = db.Column(db.Date, nullable=True)  # 'expiring' only: last expiry date counted
+
+class Job(db.Model):
+    """Unit of background work run by jobs.JobQueue"""
+    __table_args__ = (
+        # Workers poll for due pending jobs and expired leases
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'running', 'done', 'dead'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not before; pushed back on retry
+    locked_until = db.Column(db.DateTime, nullable=True)  # lease of the worker running it
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
@@ -4,9 +4,6 @@ set -o errexit
 
 pip install -r requirements.txt
 
-# Database initialization (Uncomment if you want to automate the first-time setup)
-# if [ ! -d "migrations" ]; then
-#     flask db init
-#     flask db migrate -m "Initial migration"
-#     flask db upgrade
-# fi
+# Create any missing tables, then apply schema migrations (indexes, new columns)
+python init_db.py
+flask db upgrade
@@ -0,0 +1,175 @@
+"""Bounded in-process result cache with LRU eviction, a TTL and term-based invalidation."""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Entries tagged with this term are dropped whenever any stock row is added
+ANY_ADDITION = '*'
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so trivially different spellings share a key."""
+    return ' '.join(_TOKEN.findall(query.lower()))
+
+
+def term_matches(term, text):
+    """True when every token of term occurs somewhere in text.
+
+    This is deliberately looser than any search backend (substring, trigram
+    or full-text prefix), so a row a backend could match for term always
+    invalidates the entries searched with it.
+    """
+    text = text.lower()
+    tokens = _TOKEN.findall(term.lower())
+    return bool(tokens) and all(tok in text for tok in tokens)
+
+
+class ResultCache:
+    """LRU cache of search results, each entry tagged with the terms it searched.
+
+    Entries expire after ttl seconds and the least recently used entry is
+    evicted once max_entries is reached. invalidate() drops only the entries
+    whose terms match a changed row, so unrelated searches stay warm.
+
+    Every invalidation bumps generation. A caller reads it before computing a
+    value and passes it to put(), which then refuses to store a result that a
+    concurrent write may already have made stale.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> [expires_at, value, terms]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, terms, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = [time.monotonic() + self.ttl, value, set(terms)]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def add_terms(self, key, terms, generation=None):
+        """Tag an existing entry with more terms (e.g. after a fallback search).
+
+        The entry is dropped instead if an invalidation ran since generation.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                self._entries.pop(key, None)
+                return
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[2].update(terms)
+
+    def invalidate(self, text, added=False):
+        """Drop entries with a term matching text; return how many were dropped."""
+        with self._lock:
+            stale = [key for key, (_, _, terms) in self._entries.items()
+                     if (added and ANY_ADDITION in terms)
+                     or any(term_matches(term, text) for term in terms if term != ANY_ADDITION)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            self.generation += 1
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running wait and receive the same result, or the
+    same exception. Nothing is kept once the leader finishes, so later calls
+    always run afresh. A follower that waits longer than timeout seconds
+    stops waiting and runs the function itself.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        return {'in_flight': len(self._calls), 'leaders': self.leaders, 'coalesced': self.followers}
@@ -0,0 +1,139 @@
+"""Pluggable full-text search backends for medicine lookups.
+
+A backend turns a free-text query into a subquery of (id, rank) rows for a
+registered table, where a lower rank is a better match. Callers join it to
+the model and order by rank. The substring backend has no such subquery
+(match() returns None) and callers keep their ILIKE/trigram path.
+"""
+import re
+import sqlite3
+
+from sqlalchemy import DDL, event, func, literal_column, select, text
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return _TOKEN.findall(query.lower())
+
+
+def sqlite_has_fts5():
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute('CREATE VIRTUAL TABLE probe USING fts5(body)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+class SubstringBackend:
+    """No full-text index: callers fall back to ILIKE (or the trigram index)."""
+
+    name = 'substring'
+
+    def register(self, table, columns):
+        pass
+
+    def match(self, table, queries):
+        return None
+
+
+class SqliteFTS5Backend(SubstringBackend):
+    """External-content FTS5 tables kept in sync with triggers, ranked by bm25()."""
+
+    name = 'fts5'
+
+    def __init__(self):
+        self.columns = {}
+
+    def register(self, table, columns):
+        self.columns[table.name] = columns
+        for statement in self.create_statements(table.name, columns):
+            event.listen(table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+        event.listen(table, 'before_drop', DDL(f'DROP TABLE IF EXISTS {table.name}_fts').execute_if(dialect='sqlite'))
+
+    @staticmethod
+    def create_statements(table_name, columns):
+        """DDL for the FTS table and sync triggers (also used by the migration)."""
+        fts = f'{table_name}_fts'
+        cols = ', '.join(columns)
+        new_cols = ', '.join(f'new.{c}' for c in columns)
+        old_cols = ', '.join(f'old.{c}' for c in columns)
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, "
+            f"content='{table_name}', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} BEGIN "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table_name} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        ]
+
+    def match(self, table, queries):
+        groups = [tokenize(q) for q in queries]
+        groups = [g for g in groups if g]
+        if not groups:
+            return None
+        # Every token of a query must match (as a prefix); any query may match
+        expression = ' OR '.join('(' + ' '.join(f'"{tok}"*' for tok in g) + ')' for g in groups)
+        fts = f'{table.name}_fts'
+        return (
+            select(literal_column('rowid').label('id'), literal_column(f'bm25({fts})').label('rank'))
+            .select_from(text(fts))
+            .where(text(f'{fts} MATCH :fts_query').bindparams(fts_query=expression))
+            .subquery()
+        )
+
+
+class PostgresTsvectorBackend(SubstringBackend):
+    """tsvector expression over the registered columns, backed by a GIN index."""
+
+    name = 'tsvector'
+
+    def __init__(self):
+        self.columns = {}
+
+    def register(self, table, columns):
+        self.columns[table.name] = columns
+        event.listen(table, 'after_create', DDL(self.create_index_statement(table.name, columns)).execute_if(dialect='postgresql'))
+
+    @staticmethod
+    def document_sql(columns):
+        return "to_tsvector('simple', " + " || ' ' || ".join(f"coalesce({c}, '')" for c in columns) + ")"
+
+    @classmethod
+    def create_index_statement(cls, table_name, columns):
+        # Must stay textually identical to the expression used in match()
+        return f'CREATE INDEX IF NOT EXISTS ix_{table_name}_fts ON {table_name} USING gin (({cls.document_sql(columns)}))'
+
+    def match(self, table, queries):
+        groups = [tokenize(q) for q in queries]
+        groups = [g for g in groups if g]
+        if not groups:
+            return None
+        expression = ' | '.join('(' + ' & '.join(f'{tok}:*' for tok in g) + ')' for g in groups)
+        document = literal_column(self.document_sql(self.columns[table.name]))
+        query = func.to_tsquery(literal_column("'simple'"), expression)
+        return (
+            select(table.c.id.label('id'), (-func.ts_rank(document, query)).label('rank'))
+            .where(document.op('@@')(query))
+            .subquery()
+        )
+
+
+BACKENDS = {
+    'substring': SubstringBackend,
+    'fts5': SqliteFTS5Backend,
+    'tsvector': PostgresTsvectorBackend,
+}
+
+
+def create_backend(name):
+    """Instantiate a backend by name, falling back to substring when unsupported."""
+    if name == 'fts5' and not sqlite_has_fts5():
+        name = 'substring'
+    return BACKENDS.get(name, SubstringBackend)()
@@ -0,0 +1,455 @@
+"""In-process text indexes over medicine names."""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+_WORD = re.compile(r'[^\W\d_]+', re.UNICODE)
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Trigram posting lists for case-insensitive substring search.
+
+    Every document is an (id, text, tag) triple; the tag lets callers narrow
+    results to a subset (e.g. medicines stocked by nearby pharmacies) without
+    going back to the database. A substring of three or more characters is
+    answered by intersecting the postings of its trigrams, smallest first,
+    and confirming the survivors with a plain `in` check.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.built_at = None
+        self._docs = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    @property
+    def is_stale(self):
+        if self.built_at is None:
+            return True
+        return self.max_age is not None and time.monotonic() - self.built_at > self.max_age
+
+    def rebuild(self, rows):
+        """Replace the index contents with (id, text, tag) rows."""
+        docs = {}
+        postings = {}
+        for doc_id, text, tag in rows:
+            if not text:
+                continue
+            lowered = text.lower()
+            docs[doc_id] = (lowered, tag)
+            for gram in trigrams(lowered):
+                postings.setdefault(gram, set()).add(doc_id)
+        with self._lock:
+            self._docs = docs
+            self._postings = postings
+            self.built_at = time.monotonic()
+
+    def add(self, doc_id, text, tag=None):
+        with self._lock:
+            self._discard(doc_id)
+            if not text:
+                return
+            lowered = text.lower()
+            self._docs[doc_id] = (lowered, tag)
+            for gram in trigrams(lowered):
+                self._postings.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._discard(doc_id)
+
+    def _discard(self, doc_id):
+        existing = self._docs.pop(doc_id, None)
+        if existing is None:
+            return
+        for gram in trigrams(existing[0]):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def search(self, text, tags=None):
+        """Ids of documents containing text (case-insensitive), optionally limited to tags."""
+        needle = text.lower()
+        if tags is not None and not isinstance(tags, (set, frozenset, dict)):
+            tags = set(tags)
+        with self._lock:
+            docs = self._docs
+            grams = trigrams(needle)
+            if grams:
+                postings = sorted((self._postings.get(g, ()) for g in grams), key=len)
+                if not postings[0]:
+                    return set()
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                # Shorter than a trigram: nothing to intersect, scan names in memory
+                candidates = docs.keys()
+            return {
+                doc_id for doc_id in candidates
+                if needle in docs[doc_id][0] and (tags is None or docs[doc_id][1] in tags)
+            }
+
+    def search_any(self, texts, tags=None):
+        """Union of search() over several substrings."""
+        found = set()
+        for text in texts:
+            found |= self.search(text, tags)
+        return found
+
+
+class AlternativeGraph:
+    """Brand <-> generic name graph built from MedicineAlternative rows.
+
+    Edges are undirected, so every name in a connected component is an
+    alternative for every other one: "Dolo -> Paracetamol <- Crocin" makes
+    Crocin and Paracetamol alternatives for Dolo. Names are compared
+    case-insensitively; the first spelling seen is the one returned.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.built_at = None
+        self._display = {}
+        self._neighbours = {}
+        self._component = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._display)
+
+    @property
+    def is_stale(self):
+        if self.built_at is None:
+            return True
+        return self.max_age is not None and time.monotonic() - self.built_at > self.max_age
+
+    def invalidate(self):
+        self.built_at = None
+
+    def rebuild(self, pairs):
+        """Replace the graph with (medicine_name, alternative_name) pairs."""
+        display = {}
+        neighbours = {}
+        for brand, generic in pairs:
+            if not brand or not generic:
+                continue
+            a, b = brand.strip().lower(), generic.strip().lower()
+            display.setdefault(a, brand.strip())
+            display.setdefault(b, generic.strip())
+            neighbours.setdefault(a, set()).add(b)
+            neighbours.setdefault(b, set()).add(a)
+
+        component = {}
+        for start in neighbours:
+            if start in component:
+                continue
+            members = frozenset(self._walk(start, neighbours))
+            for name in members:
+                component[name] = members
+
+        with self._lock:
+            self._display = display
+            self._neighbours = neighbours
+            self._component = component
+            self.built_at = time.monotonic()
+
+    @staticmethod
+    def _walk(start, neighbours):
+        seen = {start}
+        stack = [start]
+        while stack:
+            for nxt in neighbours[stack.pop()]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return seen
+
+    def alternatives_for(self, query):
+        """Alternative names for every graph name containing query.
+
+        Direct neighbours come first, then the rest of the component.
+        """
+        needle = query.strip().lower()
+        if not needle:
+            return []
+        with self._lock:
+            matched = [name for name in self._display if needle in name]
+            direct = []
+            rest = []
+            seen = set(matched)
+            for name in matched:
+                for nxt in sorted(self._neighbours[name]):
+                    if nxt not in seen:
+                        seen.add(nxt)
+                        direct.append(nxt)
+            for name in matched:
+                for nxt in sorted(self._component[name]):
+                    if nxt not in seen:
+                        seen.add(nxt)
+                        rest.append(nxt)
+            return [self._display[name] for name in direct + rest]
+
+
+class PrefixIndex:
+    """Sorted array of distinct names for prefix autocomplete.
+
+    Keys are lowercased names in a sorted list, so a prefix is the range
+    [bisect_left(prefix), bisect_left(prefix + max char)). Each name carries a
+    popularity weight (how many stock rows use it). Pinned names, such as
+    MedicineAlternative brands and generics, stay suggestable at weight 0.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.built_at = None
+        self._keys = []
+        self._display = {}
+        self._weights = {}
+        self._pinned = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def is_stale(self):
+        if self.built_at is None:
+            return True
+        return self.max_age is not None and time.monotonic() - self.built_at > self.max_age
+
+    def invalidate(self):
+        self.built_at = None
+
+    def rebuild(self, weighted_names, pinned=()):
+        """Replace contents with (name, weight) pairs plus pinned names."""
+        display = {}
+        weights = {}
+        for name, weight in weighted_names:
+            if not name or not name.strip():
+                continue
+            key = name.strip().lower()
+            display.setdefault(key, name.strip())
+            weights[key] = weights.get(key, 0) + weight
+        pinned_keys = set()
+        for name in pinned:
+            if not name or not name.strip():
+                continue
+            key = name.strip().lower()
+            display.setdefault(key, name.strip())
+            weights.setdefault(key, 0)
+            pinned_keys.add(key)
+        with self._lock:
+            self._display = display
+            self._weights = weights
+            self._pinned = pinned_keys
+            self._keys = sorted(weights)
+            self.built_at = time.monotonic()
+
+    def add(self, name, weight=1):
+        if not name or not name.strip():
+            return
+        key = name.strip().lower()
+        with self._lock:
+            if key not in self._weights:
+                insort(self._keys, key)
+                self._weights[key] = 0
+                self._display[key] = name.strip()
+            self._weights[key] += weight
+
+    def discard(self, name, weight=1):
+        """Lower a name's weight, dropping it once unused and not pinned."""
+        if not name or not name.strip():
+            return
+        key = name.strip().lower()
+        with self._lock:
+            if key not in self._weights:
+                return
+            self._weights[key] = max(self._weights[key] - weight, 0)
+            if self._weights[key] == 0 and key not in self._pinned:
+                del self._weights[key]
+                del self._display[key]
+                pos = bisect_left(self._keys, key)
+                if pos < len(self._keys) and self._keys[pos] == key:
+                    del self._keys[pos]
+
+    def suggest(self, prefix, limit=10):
+        """Up to limit (name, weight) pairs starting with prefix, most popular first."""
+        key = prefix.strip().lower()
+        if not key:
+            return []
+        with self._lock:
+            lo = bisect_left(self._keys, key)
+            hi = bisect_left(self._keys, key + '\U0010ffff')
+            weights = self._weights
+            top = heapq.nsmallest(limit, self._keys[lo:hi], key=lambda k: (-weights[k], k))
+            return [(self._display[k], weights[k]) for k in top]
+
+
+def edit_distance(a, b, limit=None):
+    """Levenshtein distance, or limit + 1 as soon as it must exceed limit."""
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """Burkhard-Keller tree over words for bounded edit-distance lookup."""
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, word):
+        if self._root is None:
+            self._root = (word, {})
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            dist = edit_distance(word, node[0])
+            if dist == 0:
+                return
+            child = node[1].get(dist)
+            if child is None:
+                node[1][dist] = (word, {})
+                self._size += 1
+                return
+            node = child
+
+    def search(self, word, max_dist):
+        """[(distance, word)] for every stored word within max_dist."""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node_word, children = stack.pop()
+            dist = edit_distance(word, node_word)
+            if dist <= max_dist:
+                found.append((dist, node_word))
+            for edge in range(dist - max_dist, dist + max_dist + 1):
+                child = children.get(edge)
+                if child is not None:
+                    stack.append(child)
+        return found
+
+
+class FuzzyIndex:
+    """Misspelling-tolerant lookup of medicine names.
+
+    Words of three or more letters from every name go into a BK-tree.
+    Each query word is matched within edit distance 1 (2 for words of six
+    or more letters). Names are ranked by how many query words they
+    matched, then by total distance, then by popularity weight. Words are
+    never removed from the tree; words whose names have all gone are
+    skipped at query time until the next rebuild.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.built_at = None
+        self._tree = BKTree()
+        self._display = {}
+        self._weights = {}
+        self._word_names = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_stale(self):
+        if self.built_at is None:
+            return True
+        return self.max_age is not None and time.monotonic() - self.built_at > self.max_age
+
+    def invalidate(self):
+        self.built_at = None
+
+    @staticmethod
+    def words(text):
+        return [w for w in _WORD.findall(text.lower()) if len(w) >= 3]
+
+    def rebuild(self, weighted_names):
+        """Replace contents with (name, weight) pairs."""
+        with self._lock:
+            self._tree = BKTree()
+            self._display = {}
+            self._weights = {}
+            self._word_names = {}
+            for name, weight in weighted_names:
+                self._add(name, weight)
+            self.built_at = time.monotonic()
+
+    def add(self, name, weight=1):
+        with self._lock:
+            self._add(name, weight)
+
+    def _add(self, name, weight):
+        if not name or not name.strip():
+            return
+        key = name.strip().lower()
+        if key not in self._weights:
+            self._display[key] = name.strip()
+            self._weights[key] = 0
+            for word in self.words(key):
+                self._tree.add(word)
+                self._word_names.setdefault(word, set()).add(key)
+        self._weights[key] += weight
+
+    def discard(self, name, weight=1):
+        if not name or not name.strip():
+            return
+        key = name.strip().lower()
+        with self._lock:
+            if key not in self._weights:
+                return
+            self._weights[key] -= weight
+            if self._weights[key] <= 0:
+                del self._weights[key]
+                del self._display[key]
+                for word in self.words(key):
+                    names = self._word_names.get(word)
+                    if names is not None:
+                        names.discard(key)
+
+    def suggest(self, query, limit=5):
+        """Up to limit names close to query, best first."""
+        scores = {}
+        with self._lock:
+            for word in self.words(query):
+                max_dist = 2 if len(word) >= 6 else 1
+                best = {}
+                for dist, match in self._tree.search(word, max_dist):
+                    for key in self._word_names.get(match, ()):
+                        if dist < best.get(key, max_dist + 1):
+                            best[key] = dist
+                for key, dist in best.items():
+                    matched, total = scores.get(key, (0, 0))
+                    scores[key] = (matched + 1, total + dist)
+            ranked = sorted(scores, key=lambda k: (-scores[k][0], scores[k][1], -self._weights[k], k))
+            return [self._display[key] for key in ranked[:limit]]
@@ -0,0 +1,189 @@
+"""Column-projected serializers for read-only JSON payloads.
+
+Hot read paths select only the columns a payload needs and turn the result
+rows straight into dicts. That skips ORM instances, the identity map and
+to_dict(). Each projection yields the same keys as the matching to_dict(),
+so clients see no difference. JSON is encoded with orjson when it is
+installed, otherwise with the standard library.
+"""
+import json
+
+from flask import Response
+from sqlalchemy import func, select
+
+from models import User, Pharmacy, Medicine, SOS, SystemAlert, Hospital, Ambulance
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised when orjson is absent
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+
+def dumps(data):
+    """Encode data as a JSON string (for inlining into templates)."""
+    if HAS_ORJSON:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, separators=(',', ':'))
+
+
+def json_response(data, status=200):
+    body = orjson.dumps(data) if HAS_ORJSON else json.dumps(data, separators=(',', ':'))
+    return Response(body, status=status, mimetype='application/json')
+
+
+def _date(value):
+    return value.strftime('%Y-%m-%d') if value else None
+
+
+def _clock(value):
+    return value.strftime('%H:%M')
+
+
+def _stamp(value):
+    return value.strftime('%Y-%m-%d %H:%M')
+
+
+def _alert_time(value):
+    return value.strftime('%b %d, %H:%M')
+
+
+class Projection:
+    """An ordered set of (key, column[, formatter]) fields.
+
+    ``select()`` builds a Core SELECT of exactly those columns (labelled by
+    key) and ``rows()`` turns result rows into dicts, applying formatters.
+    """
+
+    def __init__(self, *fields):
+        self.keys = [field[0] for field in fields]
+        self.columns = [field[1].label(field[0]) for field in fields]
+        self._formatters = [(i, field[2]) for i, field in enumerate(fields) if len(field) > 2]
+
+    def select(self):
+        return select(*self.columns)
+
+    def row(self, row):
+        values = list(row)
+        for i, formatter in self._formatters:
+            values[i] = formatter(values[i])
+        return dict(zip(self.keys, values))
+
+    def rows(self, rows):
+        keys = self.keys
+        if not self._formatters:
+            return [dict(zip(keys, row)) for row in rows]
+        return [self.row(row) for row in rows]
+
+
+# Same keys as Pharmacy.to_dict()
+PHARMACY = Projection(
+    ('id', Pharmacy.id),
+    ('shop_name', Pharmacy.shop_name),
+    ('phone', Pharmacy.phone),
+    ('email', User.email),
+    ('dl_no', Pharmacy.dl_no),
+    ('prc_no', Pharmacy.prc_no),
+    ('verified', Pharmacy.verified),
+    ('license_doc', Pharmacy.license_doc),
+    ('latitude', Pharmacy.latitude),
+    ('longitude', Pharmacy.longitude),
+    ('location_address', Pharmacy.location_address),
+)
+
+# Same keys as Medicine.to_dict()
+MEDICINE_FIELDS = (
+    ('id', Medicine.id),
+    ('name', Medicine.name),
+    ('qty', Medicine.qty),
+    ('price', Medicine.price),
+    ('expiry', Medicine.expiry, _date),
+    ('description', Medicine.description),
+    ('manufacturer', Medicine.manufacturer),
+    ('version', Medicine.version),
+)
+MEDICINE = Projection(*MEDICINE_FIELDS)
+
+# Medicine.to_dict() plus the owning pharmacy, for the admin inventory tab
+MEDICINE_WITH_PHARMACY = Projection(
+    *MEDICINE_FIELDS,
+    ('pharmacy_id', Medicine.pharmacy_id),
+    ('pharmacy_name', func.coalesce(Pharmacy.shop_name, 'Unknown')),
+)
+
+# Same keys as SOS.to_dict(); select with an outer join to User
+SOS_REQUEST = Projection(
+    ('id', SOS.id),
+    ('medicine_name', SOS.medicine_name),
+    ('patient_name', func.coalesce(User.name, 'Unknown')),
+    ('time', SOS.created_at, _clock),
+    ('time_ago', SOS.created_at, _stamp),
+    ('phone', func.coalesce(func.nullif(User.phone, ''), User.username, '')),
+    ('status', SOS.status),
+    ('latitude', SOS.latitude),
+    ('longitude', SOS.longitude),
+    ('request_count', SOS.request_count),
+)
+
+# Same keys as Hospital.to_dict()
+HOSPITAL = Projection(
+    ('id', Hospital.id),
+    ('name', Hospital.name),
+    ('phone', Hospital.phone),
+    ('address', Hospital.address),
+    ('ambulance_no', Hospital.ambulance_no),
+    ('driver_name', Hospital.driver_name),
+    ('driver_no', Hospital.driver_no),
+    ('latitude', Hospital.latitude),
+    ('longitude', Hospital.longitude),
+)
+
+# Same keys as Ambulance.to_dict()
+AMBULANCE = Projection(
+    ('id', Ambulance.id),
+    ('vehicle_number', Ambulance.vehicle_number),
+    ('driver_name', Ambulance.driver_name),
+    ('driver_phone', Ambulance.driver_phone),
+    ('address', Ambulance.address),
+    ('area', Ambulance.area),
+)
+
+# Same keys as User.to_dict()
+USER = Projection(
+    ('id', User.id),
+    ('name', User.name),
+    ('username', User.username),
+    ('role', User.role),
+    ('email', User.email),
+    ('phone', User.phone),
+)
+
+# Same keys as SystemAlert.to_dict()
+ALERT = Projection(
+    ('id', SystemAlert.id),
+    ('msg', SystemAlert.message),
+    ('type', SystemAlert.type),
+    ('time', SystemAlert.created_at, _alert_time),
+)
+
+# Rows of global_expiry_scan
+EXPIRING_STOCK = Projection(
+    ('med', Medicine.name),
+    ('pharma', Pharmacy.shop_name),
+    ('pharma_id', Pharmacy.id),
+    ('expiry', Medicine.expiry, _date),
+    ('qty', Medicine.qty),
+)
+
+
+def pharmacies_select():
+    return PHARMACY.select().select_from(Pharmacy).outerjoin(User, Pharmacy.user_id == User.id)
+
+
+def medicines_select():
+    return MEDICINE_WITH_PHARMACY.select().select_from(Medicine).join(Pharmacy)
+
+
+def sos_select():
+    return SOS_REQUEST.select().select_from(SOS).outerjoin(User, SOS.patient_id == User.id)
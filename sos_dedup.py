@@ -0,0 +1,60 @@
+"""Coalesce repeat SOS presses into the patient's open SOS.
+
+A patient pressing SOS again for the same medicine within the dedup window
+of their last press gets the existing open SOS back, with request_count and
+updated_at bumped, instead of a new row that would alert every nearby
+pharmacy again. Medicine names are compared by normalize_query, so
+'Dolo 650' and ' dolo  650' are the same request. A press after the window
+has passed expires the stale SOS and opens a fresh one, which is dispatched
+anew.
+
+The partial unique index uq_sos_open_patient_medicine allows one open SOS
+per (patient_id, medicine_key), so this holds under concurrent presses too:
+the request that loses the insert race gets an IntegrityError, rolls back
+and merges into the winner's row on retry.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import SOS
+from result_cache import normalize_query
+
+
+def medicine_key(medicine_name):
+    return normalize_query(medicine_name)[:100]
+
+
+def record(session, patient_id, medicine_name, latitude=None, longitude=None, window=600):
+    """Open a new SOS or merge into the open one, without committing.
+
+    Returns (sos, created, expired): created is False for a merge, and
+    expired is the stale SOS closed to make way for a new one, if any.
+    Raises IntegrityError when a concurrent request opened the same SOS
+    first; roll back and call again to merge into it.
+    """
+    key = medicine_key(medicine_name)
+    now = datetime.utcnow()
+    existing = session.scalars(
+        select(SOS).where(SOS.patient_id == patient_id, SOS.medicine_key == key, SOS.status == 'open')
+    ).first()
+
+    if existing is not None and existing.updated_at and existing.updated_at >= now - timedelta(seconds=window):
+        # Incremented in SQL so concurrent merges don't lose presses
+        existing.request_count = SOS.request_count + 1
+        existing.updated_at = now
+        if latitude is not None and longitude is not None:
+            existing.latitude, existing.longitude = latitude, longitude
+        session.flush()
+        return existing, False, None
+
+    if existing is not None:
+        existing.status = 'expired'
+        # Leave the index slot free before the new row is inserted
+        session.flush()
+
+    sos = SOS(patient_id=patient_id, medicine_name=medicine_name, medicine_key=key,
+              latitude=latitude, longitude=longitude, created_at=now, updated_at=now)
+    session.add(sos)
+    session.flush()
+    return sos, True, existing
@@ -0,0 +1,111 @@
+"""In-process publish/subscribe of SOS events for Server-Sent Events streams.
+
+Publishers (send_sos, resolve_broadcast) append events to a bounded backlog
+and wake every waiting stream. Event ids are '<stream>-<seq>'. The stream
+part is fixed for the life of the process, so a Last-Event-ID from another
+process or from before a restart is never mistaken for a position in this
+backlog. A subscriber resumes from its last id while the backlog still holds
+the following events; otherwise it has to resync from the database.
+
+An event may name its audience (e.g. the pharmacies an SOS was dispatched
+to); streams skip events addressed to others.
+
+Only subscribers in the publishing process see an event, so SSE needs a
+single worker process (with threads for the open streams). Every open stream
+holds one of those threads, so StreamSlots caps them below the thread count.
+Refused dashboards poll until a slot frees up, and the remaining threads keep
+serving ordinary requests.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+import serializers
+
+# audience: the subscriber keys the event is for, or None for everyone
+Event = namedtuple('Event', 'seq id name data audience')
+
+
+class EventBroker:
+    """Bounded backlog of events with blocking waits for new ones."""
+
+    def __init__(self, backlog=256):
+        self.stream = format(time.time_ns(), 'x')
+        self._events = deque(maxlen=backlog)
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def event_id(self, seq):
+        return f'{self.stream}-{seq}'
+
+    def parse(self, event_id):
+        """Sequence number of an id from this stream, else None."""
+        stream, _, seq = (event_id or '').rpartition('-')
+        if stream != self.stream or not seq.isdigit():
+            return None
+        seq = int(seq)
+        return seq if seq <= self._seq else None
+
+    def publish(self, name, data, audience=None):
+        with self._cond:
+            self._seq += 1
+            audience = frozenset(audience) if audience is not None else None
+            event = Event(self._seq, self.event_id(self._seq), name, data, audience)
+            self._events.append(event)
+            self._cond.notify_all()
+        return event.id
+
+    def events_after(self, seq):
+        """Events published after seq, or None if some were already dropped."""
+        with self._cond:
+            if seq >= self._seq:
+                return []
+            if not self._events or self._events[0].seq > seq + 1:
+                return None
+            return [event for event in self._events if event.seq > seq]
+
+    def wait(self, seq, timeout):
+        """Block until there are events after seq or timeout passes."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+        return self.events_after(seq)
+
+
+class StreamSlots:
+    """Counts open streams against a fixed limit."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a slot; False when all are in use."""
+        with self._lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+def sse(event_id, name, data):
+    """One Server-Sent Events message."""
+    return f'id: {event_id}\nevent: {name}\ndata: {serializers.dumps(data)}\n\n'
+
+
+def retry(milliseconds):
+    """Reconnection delay for EventSource clients."""
+    return f'retry: {milliseconds}\n\n'
+
+
+def heartbeat():
+    # A comment line: keeps proxies from closing an idle connection
+    return ': heartbeat\n\n'
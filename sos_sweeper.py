@@ -0,0 +1,99 @@
+"""Expire SOS requests left open longer than a TTL.
+
+An SOS that nobody resolved would otherwise stay on pharmacy dashboards and
+in the open_sos counter indefinitely. A daemon thread per process wakes every
+`interval` seconds and expires them in batches of at most `batch_size` rows,
+one short transaction per batch, so a large backlog never holds the write
+lock for long and drains over several batches (and runs) instead.
+
+Each batch is one ``UPDATE ... WHERE id IN (oldest open ids) RETURNING id``.
+The inner SELECT is a range scan of ix_sos_status_created_at
+(status = 'open' AND created_at < cutoff, oldest first). The outer WHERE
+re-checks status, so an SOS resolved meanwhile, or already swept by another
+process, is left alone. Running the sweeper in every process is therefore
+safe, only redundant.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+import counters
+from models import SOS
+
+log = logging.getLogger(__name__)
+
+
+class Sweeper:
+    def __init__(self, ttl=86400, interval=60, batch_size=500, max_batches=20, on_expired=None):
+        self.ttl = ttl
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        # Called with the ids of each batch once it is committed
+        self.on_expired = on_expired
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def batch(self, cutoff):
+        """Ids of the oldest open SOS created before cutoff, at most batch_size."""
+        return (select(SOS.id).where(SOS.status == 'open', SOS.created_at < cutoff)
+                .order_by(SOS.created_at).limit(self.batch_size))
+
+    def sweep(self, session, now=None):
+        """Expire open SOS older than the TTL, committing per batch. Returns their ids."""
+        cutoff = (now or datetime.utcnow()) - timedelta(seconds=self.ttl)
+        swept = []
+        for _ in range(self.max_batches):
+            ids = session.scalars(
+                update(SOS)
+                .where(SOS.id.in_(self.batch(cutoff).scalar_subquery()), SOS.status == 'open')
+                .values(status='expired', updated_at=datetime.utcnow())
+                .returning(SOS.id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            if ids:
+                # Bulk UPDATE skips the mapper events that keep open_sos current
+                counters.adjust(session.connection(), 'open_sos', -len(ids))
+            session.commit()
+            if ids and self.on_expired:
+                self.on_expired(ids)
+            swept.extend(ids)
+            if len(ids) < self.batch_size:
+                break
+        return swept
+
+    # --- thread ---
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app, db):
+        """Start the sweeper thread once per process."""
+        if self.running:
+            return
+        with self._lock:
+            if self.running or self.interval <= 0:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(app, db), name='sos-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, app, db):
+        while not self._stop.wait(self.interval):
+            try:
+                with app.app_context():
+                    swept = self.sweep(db.session)
+                    db.session.remove()
+                if swept:
+                    log.info('Expired %s SOS older than %ss', len(swept), self.ttl)
+            except Exception:
+                log.exception('SOS sweep failed')
@@ -0,0 +1,102 @@
+"""Batched stock adjustments (sales, returns, corrections) in one UPDATE.
+
+A batch is a list of {medicine_id, delta[, version]} lines. Lines for the same
+medicine are merged. The whole batch is applied by a single
+``UPDATE medicine SET qty = qty + CASE id ... END, version = version + 1``
+whose WHERE clause keeps stock from going negative and, for lines that carry
+a version, requires the row to still be at that version (optimistic locking).
+RETURNING reports the lines that were applied. One SELECT of the remaining
+ids then explains each conflict.
+"""
+from sqlalchemy import and_, case, false, or_, select, update
+
+from models import Medicine
+
+SEARCHABLE = (Medicine.name, Medicine.generic_name, Medicine.manufacturer, Medicine.description)
+
+
+class BatchError(ValueError):
+    """The request body is not a batch of adjustment lines."""
+
+
+def _int(line, key, required=True):
+    value = line.get(key)
+    if value is None and not required:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f'{key} must be an integer')
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{key} must be an integer')
+
+
+def parse_lines(payload, max_lines=None):
+    """Merge a request body into {medicine_id: {'delta', 'version'}} plus line errors.
+
+    The body is a list of lines or {'lines': [...]}. Errors are
+    {'line': n, 'error': ...} with 1-based line numbers.
+    """
+    lines = payload.get('lines') if isinstance(payload, dict) else payload
+    if not isinstance(lines, list) or not lines:
+        raise BatchError('Expected a non-empty list of {medicine_id, delta} lines')
+    if max_lines and len(lines) > max_lines:
+        raise BatchError(f'A batch is limited to {max_lines} lines')
+
+    merged, errors = {}, []
+    for number, line in enumerate(lines, start=1):
+        try:
+            if not isinstance(line, dict):
+                raise ValueError('Line must be an object')
+            medicine_id = _int(line, 'medicine_id')
+            delta = _int(line, 'delta')
+            version = _int(line, 'version', required=False)
+            entry = merged.setdefault(medicine_id, {'delta': 0, 'version': version})
+            if version is not None and entry['version'] not in (None, version):
+                raise ValueError(f'Conflicting versions for medicine {medicine_id}')
+            entry['delta'] += delta
+            entry['version'] = entry['version'] if version is None else version
+        except ValueError as e:
+            errors.append({'line': number, 'error': str(e)})
+    return merged, errors
+
+
+def apply(session, pharmacy_id, lines):
+    """Apply merged lines to pharmacy_id's stock, without committing.
+
+    Returns (applied, conflicts). applied rows carry id, qty, version and the
+    searchable text columns. conflicts are {'medicine_id', 'reason'} dicts;
+    reason is 'not_found', 'version_conflict' or 'insufficient_stock', and the
+    current qty and version are included when the row exists.
+    """
+    if not lines:
+        return [], []
+    delta = case({medicine_id: line['delta'] for medicine_id, line in lines.items()}, value=Medicine.id)
+    versioned = [and_(Medicine.id == medicine_id, Medicine.version == line['version'])
+                 for medicine_id, line in lines.items() if line['version'] is not None]
+    unversioned = [medicine_id for medicine_id, line in lines.items() if line['version'] is None]
+    statement = (
+        update(Medicine)
+        .where(Medicine.pharmacy_id == pharmacy_id, Medicine.id.in_(list(lines)), Medicine.qty + delta >= 0,
+               or_(Medicine.id.in_(unversioned) if unversioned else false(), *versioned))
+        .values(qty=Medicine.qty + delta, version=Medicine.version + 1)
+        .returning(Medicine.id, Medicine.qty, Medicine.version, *SEARCHABLE)
+        .execution_options(synchronize_session=False)
+    )
+    applied = session.execute(statement).all()
+
+    rejected = set(lines) - {row.id for row in applied}
+    conflicts = []
+    if rejected:
+        current = {row.id: row for row in session.execute(
+            select(Medicine.id, Medicine.qty, Medicine.version)
+            .where(Medicine.pharmacy_id == pharmacy_id, Medicine.id.in_(list(rejected))))}
+        for medicine_id in sorted(rejected):
+            row = current.get(medicine_id)
+            if row is None:
+                conflicts.append({'medicine_id': medicine_id, 'reason': 'not_found'})
+                continue
+            version = lines[medicine_id]['version']
+            reason = 'version_conflict' if version is not None and version != row.version else 'insufficient_stock'
+            conflicts.append({'medicine_id': medicine_id, 'reason': reason, 'qty': row.qty, 'version': row.version})
+    return applied, conflicts
@@ -0,0 +1,181 @@
+"""Bulk inventory import from CSV or JSON uploads.
+
+The upload is parsed as a stream, one row at a time, so memory does not grow
+with the file. CSV must have a header row. JSON must be an array of objects,
+read in chunks with a raw_decode loop. Valid rows are inserted in chunks of
+executemany INSERTs in the caller's transaction. Invalid rows are reported by
+their 1-based position among the data rows and never abort the import.
+"""
+import codecs
+import csv
+import json
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from models import Medicine
+
+MAX_LENGTHS = {'name': 100, 'generic_name': 100, 'manufacturer': 100, 'description': 500}
+
+
+class UploadError(ValueError):
+    """The upload as a whole cannot be read (bad format, not an array...)."""
+
+
+def iter_csv(stream):
+    reader = csv.DictReader(codecs.getreader('utf-8-sig')(stream))
+    if reader.fieldnames is None:
+        return
+    missing = {'name', 'expiry'} - {(f or '').strip().lower() for f in reader.fieldnames}
+    if missing:
+        raise UploadError(f"CSV header is missing {', '.join(sorted(missing))}")
+    for row in reader:
+        yield {(key or '').strip().lower(): value for key, value in row.items()}
+
+
+def iter_json_array(stream, chunk_size=64 * 1024):
+    """Yield the elements of a top-level JSON array without reading it all."""
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, pos, eof = '', 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + text.decode(chunk or b'', final=eof)
+        pos = 0
+
+    def skip_space():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip_space()
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise UploadError('JSON upload must be an array of objects')
+    pos += 1
+    expect_value = True
+    while True:
+        skip_space()
+        if pos >= len(buffer):
+            raise UploadError('JSON upload ends before the closing ]')
+        char = buffer[pos]
+        if char == ']':
+            return
+        if char == ',' and not expect_value:
+            pos += 1
+            expect_value = True
+            continue
+        if not expect_value:
+            raise UploadError(f'Expected , or ] in JSON upload, got {char!r}')
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise UploadError('JSON upload is malformed')
+                fill()
+                continue
+            # A value running to the end of the buffer (a bare number) may continue
+            if end == len(buffer) and not eof:
+                fill()
+                continue
+            break
+        pos = end
+        expect_value = False
+        yield value
+
+
+def iter_rows(stream, filename='', mimetype=''):
+    """Rows of an upload as dicts, picking the parser from name or type."""
+    if filename.lower().endswith('.json') or 'json' in (mimetype or ''):
+        return iter_json_array(stream)
+    return iter_csv(stream)
+
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    if len(value) > MAX_LENGTHS[field]:
+        raise ValueError(f'{field} is longer than {MAX_LENGTHS[field]} characters')
+    return value or None
+
+
+def validate(row):
+    """Medicine column values for one row, or ValueError naming the problem."""
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+    values = {field: _text(row, field) for field in MAX_LENGTHS}
+    if not values['name']:
+        raise ValueError('name is required')
+
+    qty = row.get('qty')
+    if qty in (None, ''):
+        values['qty'] = 0
+    else:
+        try:
+            values['qty'] = int(str(qty).strip())
+        except ValueError:
+            raise ValueError(f'qty {qty!r} is not a whole number')
+        if values['qty'] < 0:
+            raise ValueError('qty cannot be negative')
+
+    price = row.get('price')
+    if price in (None, '') or not str(price).strip():
+        values['price'] = None
+    else:
+        try:
+            values['price'] = float(str(price).strip())
+        except ValueError:
+            raise ValueError(f'price {price!r} is not a number')
+        if values['price'] < 0:
+            raise ValueError('price cannot be negative')
+
+    expiry = row.get('expiry')
+    if not expiry:
+        raise ValueError('expiry is required')
+    try:
+        values['expiry'] = datetime.strptime(str(expiry).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'expiry {expiry!r} is not in YYYY-MM-DD format')
+    return values
+
+
+def import_rows(session, pharmacy_id, rows, chunk_size=500, max_rows=None):
+    """Validate rows and insert the valid ones for pharmacy_id, without committing.
+
+    Returns (inserted, errors). inserted holds the column values of each new
+    row, including its id. errors is a list of {'row', 'error'} dicts.
+    """
+    inserted, errors, chunk = [], [], []
+    statement = insert(Medicine).returning(Medicine.id, sort_by_parameter_order=True)
+
+    def flush():
+        ids = session.scalars(statement, chunk).all()
+        for medicine_id, values in zip(ids, chunk):
+            inserted.append(dict(values, id=medicine_id))
+        chunk.clear()
+
+    for number, row in enumerate(rows, start=1):
+        if max_rows and number > max_rows:
+            errors.append({'row': number, 'error': f'Import is limited to {max_rows} rows'})
+            break
+        try:
+            values = validate(row)
+        except ValueError as e:
+            errors.append({'row': number, 'error': str(e)})
+            continue
+        values['pharmacy_id'] = pharmacy_id
+        chunk.append(values)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return inserted, errors
@@ -0,0 +1,114 @@
+"""Per-table write versions for conditional GETs.
+
+Every table has a 'version:<table>' row in dashboard_counter. The row is
+bumped in the same transaction as any write to the table. Flushes and bulk
+insert/update/delete statements only note the tables they wrote; the noted
+rows are bumped once, in sorted order, just before the commit. Counter rows
+(counters.py) move earlier in the transaction, so every writer locks
+counters before versions, and version rows are only held for the commit.
+etag() hashes the versions of the tables behind a payload, plus whatever else
+the payload varies on. Endpoints can therefore answer If-None-Match with 304
+after one small SELECT, without loading or hashing any rows.
+
+Tables listed in SCOPES also keep a version per owner, e.g.
+'medicine:<pharmacy_id>' for one pharmacy's inventory. Unit-of-work writes
+bump these automatically. Bulk statements cannot tell which owners they
+touched, so their callers note the scoped versions themselves with bump().
+"""
+import hashlib
+import random
+
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import DashboardCounter, Job
+
+PREFIX = 'version:'
+
+# session.info key of the tables to bump at commit
+_PENDING = 'table_versions.pending'
+
+_table = DashboardCounter.__table__
+
+# Writes to these tables never invalidate a payload
+IGNORED_TABLES = {DashboardCounter.__tablename__, Job.__tablename__}
+
+# table -> owning column with its own per-owner version
+SCOPES = {'medicine': 'pharmacy_id'}
+
+
+def scoped(table, owner_id):
+    return f'{table}:{owner_id}'
+
+
+def bump(session, tables):
+    """Bump the versions of tables when the session's transaction commits."""
+    session.info.setdefault(_PENDING, set()).update(set(tables) - IGNORED_TABLES)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed(session, flush_context):
+    tables = set()
+    changed = [*session.new, *session.deleted, *(obj for obj in session.dirty if session.is_modified(obj))]
+    for obj in changed:
+        table = obj.__table__.name
+        tables.add(table)
+        if table in SCOPES:
+            tables.add(scoped(table, getattr(obj, SCOPES[table])))
+    bump(session, tables)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_bulk(orm_execute_state):
+    # Query.delete(), session.execute(insert(Model), rows) and friends skip the flush
+    state = orm_execute_state
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+        bump(state.session, [state.bind_mapper.local_table.name])
+
+
+@event.listens_for(Session, 'before_commit')
+def _apply_bumps(session):
+    if session.in_nested_transaction():
+        return
+    # Flush first: its mapper events move counters and note more tables
+    session.flush()
+    names = sorted(PREFIX + t for t in session.info.pop(_PENDING, ()))
+    if names:
+        session.connection().execute(update(_table).where(_table.c.name.in_(names)).values(value=_table.c.value + 1))
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _drop_bumps(session, transaction):
+    # Rolled back or closed without committing: nothing was written
+    if transaction.parent is None:
+        session.info.pop(_PENDING, None)
+
+
+def current(session, tables):
+    """{table: version}, creating rows for tables not seen before.
+
+    New rows start at a random value so a recreated row cannot repeat a
+    version an old ETag was built from.
+    """
+    names = {PREFIX + t: t for t in tables}
+    rows = dict(session.execute(select(_table.c.name, _table.c.value).where(_table.c.name.in_(list(names)))).all())
+    missing = [name for name in names if name not in rows]
+    if missing:
+        for name in missing:
+            rows[name] = random.randrange(1 << 30)
+            session.add(DashboardCounter(name=name, value=rows[name]))
+        try:
+            session.commit()
+        except IntegrityError:
+            # Another worker created them first; use its values
+            session.rollback()
+            return current(session, tables)
+    return {names[name]: value for name, value in rows.items()}
+
+
+def etag(session, tables, *vary):
+    """Strong ETag for a payload built from tables and varying on vary."""
+    versions = current(session, tables)
+    key = '|'.join([f'{t}={versions[t]}' for t in sorted(versions)] + [str(v) for v in vary])
+    return hashlib.sha1(key.encode()).hexdigest()[:32]
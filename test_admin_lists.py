@@ -0,0 +1,81 @@
+import unittest
+from datetime import date, timedelta
+from sqlalchemy import event
+from models import db, User, Pharmacy, Medicine, SOS
+from test_support import DatabaseTestCase
+from admin_lists import MAX_PER_PAGE, fetch_page
+
+
+class AdminListsTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = User(username='owner', password='x', role='pharmacy', name='Owner')
+        db.session.add(owner)
+        db.session.flush()
+        self.pharmacies = []
+        for i in range(30):
+            pharma = Pharmacy(user_id=owner.id, shop_name=f'Shop {i:02d}', phone='1', verified=i % 3 == 0)
+            db.session.add(pharma)
+            self.pharmacies.append(pharma)
+        db.session.flush()
+        soon = date.today() + timedelta(days=5)
+        later = date.today() + timedelta(days=400)
+        for i, pharma in enumerate(self.pharmacies[:4]):
+            db.session.add(Medicine(pharmacy_id=pharma.id, name=f'Dolo {i}', qty=i, expiry=soon if i % 2 else later))
+        db.session.commit()
+
+    def test_first_page_and_totals(self):
+        page = fetch_page('pharmacies', {})
+        self.assertEqual(page['total'], 30)
+        self.assertEqual(page['pages'], 2)
+        self.assertEqual(len(page['items']), 25)
+        self.assertEqual(page['items'][0]['shop_name'], 'Shop 00')
+
+    def test_pages_do_not_overlap(self):
+        first = fetch_page('pharmacies', {'per_page': '7', 'sort': '-verified'})
+        second = fetch_page('pharmacies', {'per_page': '7', 'sort': '-verified', 'page': '2'})
+        ids = {p['id'] for p in first['items']} | {p['id'] for p in second['items']}
+        self.assertEqual(len(ids), 14)
+        self.assertTrue(all(p['verified'] for p in first['items']))
+
+    def test_search_filter_and_sort(self):
+        page = fetch_page('pharmacies', {'q': 'shop 1', 'verified': 'false', 'sort': '-shop_name'})
+        self.assertEqual([p['shop_name'] for p in page['items']],
+                         ['Shop 19', 'Shop 17', 'Shop 16', 'Shop 14', 'Shop 13', 'Shop 11', 'Shop 10'])
+
+    def test_medicines_carry_pharmacy_and_filter_expiring(self):
+        page = fetch_page('medicines', {'expiring': '1', 'sort': 'name'})
+        self.assertEqual([m['name'] for m in page['items']], ['Dolo 1', 'Dolo 3'])
+        self.assertEqual(page['items'][0]['pharmacy_name'], 'Shop 01')
+        page = fetch_page('medicines', {'q': 'shop 02'})
+        self.assertEqual([m['name'] for m in page['items']], ['Dolo 2'])
+
+    def test_page_query_count_is_constant(self):
+        for i, pharma in enumerate(self.pharmacies):
+            db.session.add(SOS(patient_id=pharma.user_id, medicine_name=f'Dolo {i}'))
+            db.session.add(Medicine(pharmacy_id=pharma.id, name=f'Crocin {i}', qty=1, expiry=date.today()))
+        db.session.commit()
+        db.session.expunge_all()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            for name in ('pharmacies', 'medicines', 'sos'):
+                del statements[:]
+                fetch_page(name, {'per_page': '100'})
+                # One COUNT and one SELECT, no lazy loads from to_dict()
+                self.assertEqual(len(statements), 2, name)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+    def test_per_page_is_capped(self):
+        self.assertEqual(fetch_page('pharmacies', {'per_page': '5000'})['per_page'], MAX_PER_PAGE)
+
+    def test_bad_sort_column(self):
+        with self.assertRaises(ValueError):
+            fetch_page('pharmacies', {'sort': 'password'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,508 @@
+import os
+import io
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime, timedelta
+from unittest import mock
+import sqlalchemy as sa
+from flask import has_app_context
+from flask.globals import app_ctx
+from flask.testing import FlaskClient
+from werkzeug.security import generate_password_hash
+import app as main
+from models import db, User, Pharmacy, SOS, Job, Medicine
+
+
+class Client(FlaskClient):
+    """Test client whose requests get their own app context, as in production.
+
+    Otherwise a request reuses the test's pushed context, and with it g (the
+    logged-in user cached by Flask-Login) and the test's database session.
+    """
+
+    def open(self, *args, **kwargs):
+        if not has_app_context():
+            return super().open(*args, **kwargs)
+        ctx = app_ctx._get_current_object()
+        ctx.pop()
+        try:
+            return super().open(*args, **kwargs)
+        finally:
+            ctx.push()
+
+
+class RouteTestCase(unittest.TestCase):
+    """Requests against the real app, on a throwaway SQLite file.
+
+    The app may already be bound to its configured database by an earlier
+    import, so the default engine is swapped for the test's own and put back
+    afterwards. Job workers and the SOS sweeper stay off.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        if 'sqlalchemy' not in main.app.extensions:
+            db.init_app(main.app)
+        cls.db_fd, cls.db_path = tempfile.mkstemp()
+        with main.app.app_context():
+            cls.engine = db.engines[None]
+            db.engines[None] = sa.create_engine('sqlite:///' + cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        with main.app.app_context():
+            db.engines[None].dispose()
+            db.engines[None] = cls.engine
+        os.close(cls.db_fd)
+        os.unlink(cls.db_path)
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.dict(main.app.config, {'TESTING': True, 'WTF_CSRF_ENABLED': False, 'QUERY_BUDGET': None}),
+            mock.patch.object(main.limiter, 'enabled', False),
+            mock.patch.object(main.job_queue, 'workers', 0),
+            mock.patch.object(main.sos_sweeper, 'interval', 0),
+            mock.patch.object(main.app, 'test_client_class', Client),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.ctx = main.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.roles = {}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def user(self, username, role, **kwargs):
+        user = User(username=username, password=generate_password_hash('pass'), role=role, name=username, **kwargs)
+        db.session.add(user)
+        db.session.commit()
+        self.roles[username] = role
+        return user
+
+    def pharmacy(self, username, lat=12.0, lng=77.0):
+        pharmacy = Pharmacy(owner=self.user(username, 'pharmacy'), shop_name=username, phone='1',
+                            latitude=lat, longitude=lng)
+        db.session.add(pharmacy)
+        db.session.commit()
+        return pharmacy
+
+    def client(self, username):
+        client = main.app.test_client()
+        if self.roles[username] in ('admin', 'sub_admin'):
+            response = client.post('/admin_login', data={'username': username, 'password': 'pass'})
+        else:
+            response = client.post('/login', data={'identifier': username, 'password': 'pass'})
+        self.assertEqual(response.status_code, 302)
+        return client
+
+
+class SOSStreamTestCase(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.object(main.sos_stream_slots, 'limit', 1),
+            mock.patch.dict(main.app.config, {'SOS_STREAM_HEARTBEAT': 0.05, 'SOS_STREAM_RETRY': 30}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.pharmacy('shop1')
+        self.pharmacy('shop2')
+        self.user('patient', 'patient')
+
+    def test_requests_are_served_while_streams_are_at_the_cap(self):
+        # One dashboard holds the only stream slot, blocked in a request thread
+        opened, finish = threading.Event(), threading.Event()
+
+        def hold_stream():
+            response = self.client('shop1').get('/pharmacy/sos/stream', buffered=False)
+            chunks = iter(response.response)
+            next(chunks)
+            opened.set()
+            while not finish.is_set():
+                next(chunks)
+            response.close()
+
+        holder = threading.Thread(target=hold_stream)
+        holder.start()
+        self.assertTrue(opened.wait(5))
+        try:
+            self.assertEqual(main.sos_stream_slots.active, 1)
+            refused = self.client('shop2').get('/pharmacy/sos/stream')
+            self.assertEqual(refused.status_code, 503)
+            self.assertEqual(refused.headers['Retry-After'], '30')
+            self.assertEqual(refused.get_data(as_text=True), 'retry: 30000\n\n')
+
+            self.assertEqual(self.client('shop2').get('/pharmacy/sos/open').get_json(), [])
+            patient = self.client('patient')
+            self.assertEqual(patient.get('/patient/search_medicine?query=dolo').status_code, 200)
+            self.assertTrue(patient.post('/patient/send_sos', json={'medicine_name': 'Dolo'}).get_json()['success'])
+        finally:
+            finish.set()
+            holder.join(5)
+
+        self.assertEqual(main.sos_stream_slots.active, 0)
+        response = self.client('shop2').get('/pharmacy/sos/stream', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(main.sos_stream_slots.active, 0)
+
+
+class SendSOSTestCase(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = self.user('patient', 'patient').id
+
+    def race(self, updated_at):
+        """Have another request open the same SOS just before send_sos inserts its own."""
+        competitor = {}
+
+        def open_first(session, flush_context, instances):
+            engine = sa.create_engine('sqlite:///' + self.db_path)
+            with engine.begin() as conn:
+                competitor['id'] = conn.execute(SOS.__table__.insert().values(
+                    patient_id=self.patient, medicine_name='Dolo', medicine_key='dolo', status='open',
+                    request_count=1, created_at=updated_at, updated_at=updated_at)).inserted_primary_key[0]
+            engine.dispose()
+
+        client = self.client('patient')
+        sa.event.listen(db.session, 'before_flush', open_first, once=True)
+        response = client.post('/patient/send_sos', json={'medicine_name': 'Dolo'}).get_json()
+        db.session.expire_all()
+        return response, competitor['id']
+
+    def test_lost_insert_race_merges_into_the_winner(self):
+        response, winner = self.race(datetime.utcnow())
+        self.assertEqual(response, {'success': True, 'sos_id': winner, 'merged': True, 'request_count': 2})
+        self.assertEqual(Job.query.count(), 0)  # the winner dispatches its own SOS
+
+    def test_lost_insert_race_against_a_stale_sos_opens_and_dispatches_a_new_one(self):
+        response, stale = self.race(datetime.utcnow() - timedelta(hours=1))
+        self.assertFalse(response['merged'])
+        self.assertNotEqual(response['sos_id'], stale)
+        self.assertEqual(db.session.get(SOS, stale).status, 'expired')
+        job, = Job.query.all()
+        self.assertEqual((job.kind, job.payload), ('sos.dispatch', {'sos_id': response['sos_id']}))
+
+
+class StockRouteTestCase(RouteTestCase):
+    """Stock edits through the pharmacy routes; 'other' is a second pharmacy with its own row."""
+
+    def setUp(self):
+        super().setUp()
+        self.shop_id = self.pharmacy('shop').id
+        other = self.pharmacy('other')
+        foreign = Medicine(pharmacy_id=other.id, name='Foreign', qty=5, expiry=date(2030, 1, 1))
+        db.session.add(foreign)
+        db.session.commit()
+        self.foreign_id = foreign.id
+        self.shop = self.client('shop')
+
+    def inventory_version(self):
+        return self.shop.get('/pharmacy/inventory').get_json()['inventory_version']
+
+    def add(self, name='Dolo', qty=5):
+        return self.shop.post('/pharmacy/add_stock', json={'name': name, 'qty': qty, 'expiry': '2030-01-01'}).get_json()
+
+
+class AddRemoveStockTestCase(StockRouteTestCase):
+    def test_add_returns_the_row_and_the_next_version(self):
+        version = self.inventory_version()
+        body = self.add()
+        medicine_id = body['medicine']['id']
+        self.assertEqual(body, {'success': True, 'inventory_version': version + 1, 'medicine': {
+            'id': medicine_id, 'name': 'Dolo', 'qty': 5, 'price': None, 'expiry': '2030-01-01',
+            'description': None, 'manufacturer': None, 'version': 1}})
+        self.assertEqual(self.inventory_version(), version + 1)
+
+    def test_remove_bumps_the_version_once(self):
+        medicine_id = self.add()['medicine']['id']
+        version = self.inventory_version()
+        body = self.shop.post(f'/pharmacy/remove_stock/{medicine_id}').get_json()
+        self.assertEqual(body, {'success': True, 'id': medicine_id, 'inventory_version': version + 1})
+        self.assertIsNone(db.session.get(Medicine, medicine_id))
+
+    def test_edits_leave_other_pharmacies_alone(self):
+        other = self.client('other')
+        version = other.get('/pharmacy/inventory').get_json()['inventory_version']
+        self.add()
+        self.assertEqual(other.get('/pharmacy/inventory').get_json()['inventory_version'], version)
+
+    def test_another_pharmacys_medicine_is_refused(self):
+        version = self.inventory_version()
+        self.assertEqual(self.shop.post(f'/pharmacy/remove_stock/{self.foreign_id}').status_code, 403)
+        self.assertIsNotNone(db.session.get(Medicine, self.foreign_id))
+        self.assertEqual(self.inventory_version(), version)
+
+
+class ImportStockTestCase(StockRouteTestCase):
+    CSV = 'name,qty,expiry\nDolo,5,2030-01-01\nCrocin,x,2030-01-01\nCalpol,2,2030-02-01\n'
+
+    def names(self):
+        return sorted(name for name, in db.session.query(Medicine.name).filter_by(pharmacy_id=self.shop_id))
+
+    def test_multipart_upload(self):
+        version = self.inventory_version()
+        response = self.shop.post('/pharmacy/import_stock',
+                                  data={'file': (io.BytesIO(self.CSV.encode()), 'stock.csv')})
+        self.assertEqual(response.get_json(), {
+            'success': True, 'imported': 2, 'inventory_version': version + 1,
+            'errors': [{'row': 2, 'error': "qty 'x' is not a whole number"}]})
+        self.assertEqual(self.names(), ['Calpol', 'Dolo'])
+
+    def test_raw_csv_body(self):
+        version = self.inventory_version()
+        response = self.shop.post('/pharmacy/import_stock', data=self.CSV, content_type='text/csv')
+        self.assertEqual((response.get_json()['imported'], response.get_json()['inventory_version']), (2, version + 1))
+        self.assertEqual(self.names(), ['Calpol', 'Dolo'])
+
+    def test_raw_json_body(self):
+        rows = [{'name': 'Dolo', 'qty': 1, 'expiry': '2030-01-01'}, {'name': 'Crocin', 'expiry': '2030-01-01'}]
+        response = self.shop.post('/pharmacy/import_stock', json=rows)
+        self.assertEqual((response.get_json()['imported'], response.get_json()['errors']), (2, []))
+
+    def test_strict_rolls_back_on_any_invalid_row(self):
+        version = self.inventory_version()
+        response = self.shop.post('/pharmacy/import_stock?strict=1', data=self.CSV, content_type='text/csv')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.get_json()['imported'], 0)
+        self.assertEqual(self.names(), [])
+        self.assertEqual(self.inventory_version(), version)
+
+    def test_unreadable_upload(self):
+        response = self.shop.post('/pharmacy/import_stock', data='qty,price\n1,2\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.names(), [])
+
+
+class AdjustStockTestCase(StockRouteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dolo, self.crocin = (self.add(name, qty=5)['medicine']['id'] for name in ('Dolo', 'Crocin'))
+
+    def adjust(self, lines, query=''):
+        return self.shop.post('/pharmacy/adjust_stock' + query, json={'lines': lines})
+
+    def qty(self, medicine_id):
+        return db.session.get(Medicine, medicine_id).qty
+
+    def test_applies_lines_in_one_edit(self):
+        version = self.inventory_version()
+        body = self.adjust([{'medicine_id': self.dolo, 'delta': -2}, {'medicine_id': self.crocin, 'delta': 3},
+                            {'medicine_id': self.dolo, 'delta': -1}]).get_json()
+        self.assertEqual(body, {'success': True, 'conflicts': [], 'errors': [], 'inventory_version': version + 1,
+                                'applied': [{'medicine_id': self.dolo, 'qty': 2, 'version': 2},
+                                            {'medicine_id': self.crocin, 'qty': 8, 'version': 2}]})
+
+    def test_conflicting_lines_are_reported_while_the_rest_apply(self):
+        body = self.adjust([{'medicine_id': self.dolo, 'delta': -9}, {'medicine_id': self.crocin, 'delta': -1, 'version': 7},
+                            {'medicine_id': self.foreign_id, 'delta': -1}, {'medicine_id': self.crocin},
+                            {'medicine_id': self.dolo, 'delta': 1}]).get_json()
+        self.assertFalse(body['success'])
+        self.assertEqual(body['applied'], [])
+        self.assertEqual(body['conflicts'], [  # by medicine_id
+            {'medicine_id': self.foreign_id, 'reason': 'not_found'},
+            {'medicine_id': self.dolo, 'reason': 'insufficient_stock', 'qty': 5, 'version': 1},
+            {'medicine_id': self.crocin, 'reason': 'version_conflict', 'qty': 5, 'version': 1}])
+        self.assertEqual(body['errors'], [{'line': 4, 'error': 'delta must be an integer'}])
+
+        body = self.adjust([{'medicine_id': self.dolo, 'delta': -1, 'version': 1},
+                            {'medicine_id': self.crocin, 'delta': -6}]).get_json()
+        self.assertEqual(body['applied'], [{'medicine_id': self.dolo, 'qty': 4, 'version': 2}])
+        self.assertEqual(body['conflicts'], [{'medicine_id': self.crocin, 'reason': 'insufficient_stock', 'qty': 5, 'version': 1}])
+
+    def test_another_pharmacys_medicine_is_refused(self):
+        version = self.inventory_version()
+        body = self.adjust([{'medicine_id': self.foreign_id, 'delta': -5}]).get_json()
+        self.assertEqual(body['conflicts'], [{'medicine_id': self.foreign_id, 'reason': 'not_found'}])
+        self.assertEqual((self.qty(self.foreign_id), body['inventory_version']), (5, version))
+
+    def test_strict_rolls_back_the_whole_batch(self):
+        version = self.inventory_version()
+        response = self.adjust([{'medicine_id': self.dolo, 'delta': -1}, {'medicine_id': self.crocin, 'delta': -9}],
+                               '?strict=1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['applied'], [])
+        self.assertEqual((self.qty(self.dolo), self.qty(self.crocin)), (5, 5))
+        self.assertEqual(self.inventory_version(), version)
+
+        response = self.adjust([{'medicine_id': self.dolo, 'delta': -1}, {'medicine_id': 'x', 'delta': 1}], '?strict=1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.qty(self.dolo), 5)
+
+    def test_malformed_batch(self):
+        self.assertEqual(self.adjust([]).status_code, 400)
+
+
+class VersionedJSONTestCase(StockRouteTestCase):
+    """Conditional GETs against the ETags from versioned_json()."""
+
+    def setUp(self):
+        super().setUp()
+        self.user('admin', 'admin')
+        self.user('patient', 'patient')
+        self.admin = self.client('admin')
+
+    def revalidate(self, client, url, etag):
+        return client.get(url, headers={'If-None-Match': etag})
+
+    def test_matching_etag_is_answered_without_building_the_payload(self):
+        for client, url, builder in ((self.shop, '/pharmacy/inventory', 'pharmacy_inventory'),
+                                     (self.admin, '/admin/api/medicines', 'fetch_page')):
+            first = client.get(url)
+            self.assertEqual(first.status_code, 200)
+            with mock.patch.object(main, builder, wraps=getattr(main, builder)) as build:
+                again = self.revalidate(client, url, first.headers['ETag'])
+                self.assertEqual((again.status_code, again.data), (304, b''))
+                self.assertEqual(again.headers['ETag'], first.headers['ETag'])
+                build.assert_not_called()
+                self.assertEqual(self.revalidate(client, url, '"stale"').status_code, 200)
+                build.assert_called_once()
+
+    def test_add_stock_changes_the_inventory_and_admin_etags(self):
+        other = self.client('other')
+        urls = [(self.shop, '/pharmacy/inventory'), (self.admin, '/admin/api/medicines'),
+                (other, '/pharmacy/inventory'), (self.admin, '/admin/api/sos')]
+        etags = [client.get(url).headers['ETag'] for client, url in urls]
+        self.add()
+        statuses = [self.revalidate(client, url, etag).status_code for (client, url), etag in zip(urls, etags)]
+        self.assertEqual(statuses, [200, 200, 304, 304])
+
+    def test_send_sos_changes_the_admin_sos_etag(self):
+        urls = ['/admin/api/sos', '/admin/api/medicines']
+        etags = [self.admin.get(url).headers['ETag'] for url in urls]
+        self.client('patient').post('/patient/send_sos', json={'medicine_name': 'Dolo'})
+        response = self.revalidate(self.admin, urls[0], etags[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['total'], 1)
+        self.assertEqual(self.revalidate(self.admin, urls[1], etags[1]).status_code, 304)
+
+
+class MedicineIndexTestCase(RouteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pharmacy('shop')
+        main.medicine_index.rebuild([])
+
+    def add_and_remove(self):
+        shop = self.client('shop')
+        added = shop.post('/pharmacy/add_stock', json={'name': 'Dolo', 'qty': 5, 'expiry': '2030-01-01'}).get_json()
+        size = len(main.medicine_index)
+        shop.post(f"/pharmacy/remove_stock/{added['medicine']['id']}")
+        return size, len(main.medicine_index)
+
+    def test_trigram_index_is_left_alone_by_other_backends(self):
+        with mock.patch.object(main.search_backend, 'name', 'fts5'):
+            self.assertEqual(self.add_and_remove(), (0, 0))
+
+    def test_trigram_index_follows_writes_for_the_substring_backend(self):
+        with mock.patch.object(main.search_backend, 'name', 'substring'):
+            self.assertEqual(self.add_and_remove(), (1, 0))
+
+
+class LockOrderTestCase(RouteTestCase):
+    """Writers move dashboard_counter rows counters first, versions last (see table_versions)."""
+
+    def setUp(self):
+        super().setUp()
+        self.pharmacy('shop')
+        self.user('patient', 'patient')
+
+    def counter_updates(self, write):
+        """Names of the dashboard_counter rows write() updates, in order; 'version' for version rows."""
+        updates = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE dashboard_counter'):
+                name = next(p for p in parameters if isinstance(p, str))
+                updates.append('version' if name.startswith('version:') else name)
+
+        sa.event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            write()
+        finally:
+            sa.event.remove(db.engine, 'before_cursor_execute', capture)
+        return updates
+
+    def test_stock_edits(self):
+        shop = self.client('shop')
+        medicine = {}
+
+        def add():
+            medicine.update(shop.post('/pharmacy/add_stock', json={'name': 'Dolo', 'qty': 5, 'expiry': '2030-01-01'})
+                            .get_json()['medicine'])
+
+        self.assertEqual(self.counter_updates(add), ['medicines', 'expiring', 'version'])
+        self.assertEqual(self.counter_updates(lambda: shop.post(f"/pharmacy/remove_stock/{medicine['id']}")),
+                         ['medicines', 'expiring', 'version'])
+
+    def test_import_in_several_chunks(self):
+        shop = self.client('shop')
+        csv = 'name,qty,expiry\n' + ''.join(f'Med {i},1,2030-01-01\n' for i in range(5))
+        main.app.config['IMPORT_CHUNK_SIZE'] = 2
+        updates = self.counter_updates(lambda: shop.post(
+            '/pharmacy/import_stock', data={'file': (io.BytesIO(csv.encode()), 'stock.csv')}))
+        self.assertEqual(updates, ['medicines', 'expiring', 'version'])
+        self.assertEqual(Medicine.query.count(), 5)
+
+    def test_send_sos_and_expiry_sweep(self):
+        patient = self.client('patient')
+        self.assertEqual(self.counter_updates(lambda: patient.post('/patient/send_sos', json={'medicine_name': 'Dolo'})),
+                         ['open_sos', 'version'])
+        db.session.execute(sa.update(SOS).values(created_at=datetime.utcnow() - timedelta(days=30)))
+        db.session.commit()
+        self.assertEqual(self.counter_updates(lambda: main.sos_sweeper.sweep(db.session)), ['open_sos', 'version'])
+        self.assertEqual(SOS.query.one().status, 'expired')
+
+
+class DeleteMedicineRaceTestCase(RouteTestCase):
+    """A delete that loses a race with a stock edit answers 409 with the current row."""
+
+    def setUp(self):
+        super().setUp()
+        self.shop = self.pharmacy('shop')
+        self.user('admin', 'admin')
+        medicine = Medicine(pharmacy_id=self.shop.id, name='Dolo', qty=5, expiry=date(2030, 1, 1))
+        db.session.add(medicine)
+        db.session.commit()
+        self.medicine_id = medicine.id
+
+    def race(self, client, url, statement):
+        """Request url, running statement on another connection just before the delete is flushed."""
+        def meanwhile(session, flush_context, instances):
+            engine = sa.create_engine('sqlite:///' + self.db_path)
+            with engine.begin() as conn:
+                conn.execute(statement.where(Medicine.id == self.medicine_id))
+            engine.dispose()
+
+        sa.event.listen(db.session, 'before_flush', meanwhile, once=True)
+        return client.post(url) if url.startswith('/pharmacy') else client.get(url)
+
+    def sale(self):
+        return sa.update(Medicine).values(qty=Medicine.qty - 1, version=Medicine.version + 1)
+
+    def test_remove_stock_after_a_sale(self):
+        response = self.race(self.client('shop'), f'/pharmacy/remove_stock/{self.medicine_id}', self.sale())
+        self.assertEqual(response.status_code, 409)
+        body = response.get_json()
+        self.assertEqual(body['reason'], 'version_conflict')
+        self.assertEqual((body['medicine']['id'], body['medicine']['qty'], body['medicine']['version']),
+                         (self.medicine_id, 4, 2))
+        self.assertIsNotNone(db.session.get(Medicine, self.medicine_id))
+
+    def test_admin_delete_after_a_sale(self):
+        response = self.race(self.client('admin'), f'/admin/delete_medicine/{self.medicine_id}', self.sale())
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['medicine']['qty'], 4)
+
+    def test_row_deleted_meanwhile(self):
+        response = self.race(self.client('shop'), f'/pharmacy/remove_stock/{self.medicine_id}', sa.delete(Medicine))
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from datetime import date, timedelta
+from sqlalchemy import event
+from models import db, DashboardCounter, User, Pharmacy, Medicine, Ambulance, SOS
+from test_support import DatabaseTestCase
+import counters
+import table_versions
+
+
+class CountersTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User(username='owner', password='x', role='pharmacy', name='Owner')
+        db.session.add(self.user)
+        db.session.commit()
+        counters.reconcile(db.session)
+
+    def assert_consistent(self):
+        maintained = counters.read(db.session)
+        self.assertEqual(maintained, counters.reconcile(db.session))
+        return maintained
+
+    def add_pharmacy(self, verified=False):
+        pharma = Pharmacy(user_id=self.user.id, shop_name='Shop', phone='1', verified=verified)
+        db.session.add(pharma)
+        db.session.commit()
+        return pharma
+
+    def test_writes_move_counters(self):
+        pharma = self.add_pharmacy()
+        self.add_pharmacy(verified=True)
+        soon = date.today() + timedelta(days=3)
+        later = date.today() + timedelta(days=300)
+        med_soon = Medicine(pharmacy_id=pharma.id, name='Dolo', qty=1, expiry=soon)
+        med_later = Medicine(pharmacy_id=pharma.id, name='Crocin', qty=1, expiry=later)
+        db.session.add_all([med_soon, med_later, Ambulance(vehicle_number='A1', driver_name='D', driver_phone='1'),
+                            SOS(patient_id=self.user.id, medicine_name='Dolo')])
+        db.session.commit()
+        self.assertEqual(self.assert_consistent(), {'pharmacies': 2, 'verified_pharmacies': 1, 'medicines': 2,
+                                                    'ambulances': 1, 'open_sos': 1, 'expiring': 1})
+
+        pharma.verified = True
+        med_later.expiry = soon
+        SOS.query.first().status = 'resolved'
+        db.session.commit()
+        self.assertEqual(self.assert_consistent()['expiring'], 2)
+
+        db.session.delete(med_soon)
+        db.session.delete(Ambulance.query.first())
+        db.session.commit()
+        self.assertEqual(self.assert_consistent(), {'pharmacies': 2, 'verified_pharmacies': 2, 'medicines': 1,
+                                                    'ambulances': 0, 'open_sos': 0, 'expiring': 1})
+
+    def test_rollback_discards_adjustment(self):
+        self.add_pharmacy()
+        db.session.add(Ambulance(vehicle_number='A1', driver_name='D', driver_phone='1'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(counters.read(db.session)['ambulances'], 0)
+
+    def test_bulk_delete(self):
+        pharma = self.add_pharmacy()
+        soon = date.today()
+        db.session.add_all([Medicine(pharmacy_id=pharma.id, name=f'M{i}', qty=1, expiry=soon) for i in range(3)])
+        db.session.commit()
+        expiries = [m.expiry for m in Medicine.query.all()]
+        Medicine.query.filter_by(pharmacy_id=pharma.id).delete()
+        counters.medicines_removed(db.session, expiries)
+        db.session.commit()
+        self.assertEqual(self.assert_consistent()['medicines'], 0)
+
+    def test_missing_rows_and_stale_window_are_recounted(self):
+        pharma = self.add_pharmacy()
+        db.session.add(Medicine(pharmacy_id=pharma.id, name='Dolo', qty=1, expiry=date.today() + timedelta(days=40)))
+        db.session.commit()
+        db.session.get(DashboardCounter, 'expiring').window_end = date.today() + timedelta(days=50)
+        db.session.get(DashboardCounter, 'expiring').value = 1
+        db.session.commit()
+        self.assertEqual(counters.read(db.session)['expiring'], 0)
+
+        DashboardCounter.query.delete()
+        db.session.commit()
+        self.assertEqual(counters.read(db.session)['pharmacies'], 1)
+
+    def test_read_loads_only_counter_rows(self):
+        table_versions.current(db.session, [table_versions.scoped('medicine', i) for i in range(50)])
+        db.session.expunge_all()
+        loaded = []
+        listener = lambda target, context: loaded.append(target.name)
+        event.listen(DashboardCounter, 'load', listener)
+        try:
+            counters.read(db.session)
+        finally:
+            event.remove(DashboardCounter, 'load', listener)
+        self.assertEqual(sorted(loaded), sorted(counters.COUNTERS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import random
+from distance import HAS_NUMPY, PointSet
+from geo import haversine
+
+
+class PointSetTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.rows = [(i, rng.uniform(8.0, 12.0), rng.uniform(75.0, 78.0)) for i in range(500)]
+        self.engines = [False] + ([True] if HAS_NUMPY else [])
+
+    def expected(self, lat, lng, radius):
+        dists = [(haversine(lat, lng, p_lat, p_lng), pid) for pid, p_lat, p_lng in self.rows]
+        return [pid for d, pid in sorted(dists) if d <= radius]
+
+    def test_within_matches_scalar_haversine(self):
+        for use_numpy in self.engines:
+            points = PointSet.from_rows(self.rows, use_numpy=use_numpy)
+            found = points.within(9.98, 76.58, 40)
+            self.assertEqual([pid for pid, _ in found], self.expected(9.98, 76.58, 40))
+            for pid, dist in found:
+                _, p_lat, p_lng = self.rows[pid]
+                self.assertAlmostEqual(dist, haversine(9.98, 76.58, p_lat, p_lng), places=6)
+
+    def test_limit_returns_nearest(self):
+        for use_numpy in self.engines:
+            points = PointSet.from_rows(self.rows, use_numpy=use_numpy)
+            self.assertEqual([pid for pid, _ in points.within(9.98, 76.58, limit=5)],
+                             self.expected(9.98, 76.58, float('inf'))[:5])
+
+    def test_ranges_and_missing_coordinates(self):
+        for use_numpy in self.engines:
+            points = PointSet.from_rows([(1, 10.0, 76.0), (2, None, 76.0), (3, 10.01, 76.0)], use_numpy=use_numpy)
+            self.assertEqual(len(points), 2)
+            self.assertEqual([pid for pid, _ in points.within(10.0, 76.0, ranges=[(1, 2)])], [3])
+            self.assertEqual(points.within(10.0, 76.0, ranges=[]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import random
+from geo import GeoIndex, bounding_box, cell_area, geohash_encode, geohash_bounds, covering_cells, haversine
+
+
+class GeohashTestCase(unittest.TestCase):
+    def test_encode_known_value(self):
+        # Reference value from the original geohash spec
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_bounds_contain_point(self):
+        lat, lng = 9.9816, 76.5796
+        lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds(geohash_encode(lat, lng, 6))
+        self.assertTrue(lat_lo <= lat <= lat_hi)
+        self.assertTrue(lng_lo <= lng <= lng_hi)
+
+    def test_cell_area_reach_covers_cell(self):
+        rng = random.Random(5)
+        cell, c_lat, c_lng, reach = cell_area(9.9816, 76.5796, 5)
+        lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds(cell)
+        for _ in range(500):
+            p_lat, p_lng = rng.uniform(lat_lo, lat_hi), rng.uniform(lng_lo, lng_hi)
+            self.assertLessEqual(haversine(c_lat, c_lng, p_lat, p_lng), reach + 1e-9)
+
+    def test_covering_cells_wrap_antimeridian(self):
+        cells = covering_cells(0.0, 179.99, 5)
+        self.assertTrue(any(geohash_bounds(c)[2] < 0 for c in cells))
+
+
+class BoundingBoxTestCase(unittest.TestCase):
+    def test_box_contains_circle(self):
+        rng = random.Random(3)
+        for lat, lng, radius in [(9.98, 76.58, 15), (60.0, 10.0, 200), (-45.0, -70.0, 50)]:
+            min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius)
+            for _ in range(2000):
+                p_lat = lat + rng.uniform(-5, 5)
+                p_lng = lng + rng.uniform(-10, 10)
+                if haversine(lat, lng, p_lat, p_lng) <= radius:
+                    self.assertTrue(min_lat <= p_lat <= max_lat)
+                    self.assertTrue(min_lng <= p_lng <= max_lng)
+
+    def test_box_across_antimeridian(self):
+        min_lat, max_lat, min_lng, max_lng = bounding_box(0.0, 179.95, 20)
+        self.assertGreater(min_lng, max_lng)
+
+    def test_box_at_pole_spans_all_longitudes(self):
+        self.assertEqual(bounding_box(89.95, 0.0, 50)[2:], (-180.0, 180.0))
+
+
+class GeoIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.points = [(i, rng.uniform(8.0, 12.0), rng.uniform(75.0, 78.0)) for i in range(2000)]
+        self.index = GeoIndex()
+        self.index.rebuild(self.points + [(9999, None, None)])
+
+    def brute_force(self, lat, lng, radius):
+        return {pid for pid, p_lat, p_lng in self.points if haversine(lat, lng, p_lat, p_lng) <= radius}
+
+    def test_within_matches_brute_force(self):
+        for lat, lng, radius in [(9.98, 76.58, 5), (10.5, 76.0, 15), (8.1, 77.9, 50), (11.0, 75.5, 120)]:
+            found = self.index.within(lat, lng, radius)
+            self.assertEqual(set(found), self.brute_force(lat, lng, radius))
+
+    def test_points_without_coordinates_are_skipped(self):
+        self.assertNotIn(9999, self.index)
+        self.assertEqual(len(self.index), 2000)
+
+    def test_add_and_remove(self):
+        self.index.add(5000, 9.98, 76.58)
+        self.assertIn(5000, self.index.within(9.98, 76.58, 1))
+        self.index.add(5000, 11.9, 77.9)
+        self.assertNotIn(5000, self.index.within(9.98, 76.58, 1))
+        self.index.remove(5000)
+        self.assertNotIn(5000, self.index.within(11.9, 77.9, 1))
+
+    def test_staleness(self):
+        self.assertTrue(GeoIndex().is_stale)
+        self.assertFalse(self.index.is_stale)
+        self.assertTrue(GeoIndex(max_age=-1).is_stale)
+
+
+if __name__ == '__main__':
+    unittest.main()
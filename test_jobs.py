@@ -0,0 +1,114 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from models import db, Job, Hospital
+from test_support import DatabaseTestCase
+from jobs import JobQueue
+
+
+class JobQueueTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.queue = JobQueue(workers=0, backoff=10, max_attempts=2)
+        self.calls = []
+
+        @self.queue.handler('add_hospital')
+        def add_hospital(payload):
+            self.calls.append(payload)
+            db.session.add(Hospital(name=payload['name'], phone='1', address='A'))
+            if payload.get('fail'):
+                raise RuntimeError('boom')
+            return lambda: self.calls.append('committed')
+
+    def enqueue(self, **payload):
+        job = self.queue.enqueue(db.session, 'add_hospital', payload)
+        db.session.commit()
+        return job.id
+
+    def job(self, job_id):
+        db.session.expire_all()
+        return db.session.get(Job, job_id)
+
+    def test_runs_job_and_commits_with_it(self):
+        job_id = self.enqueue(name='H1')
+        self.assertTrue(self.queue.run_next(db.session))
+        self.assertFalse(self.queue.run_next(db.session))
+        job = self.job(job_id)
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertEqual(self.calls, [{'name': 'H1'}, 'committed'])
+        self.assertEqual(Hospital.query.count(), 1)
+
+    def test_failures_roll_back_retry_then_dead_letter(self):
+        job_id = self.enqueue(name='H1', fail=True)
+        self.queue.run_next(db.session)
+        job = self.job(job_id)
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertGreater(job.run_at, datetime.utcnow() + timedelta(seconds=5))
+        self.assertIn('boom', job.last_error)
+        self.assertEqual(Hospital.query.count(), 0)
+        self.assertFalse(self.queue.run_next(db.session))  # backing off
+
+        job.run_at = datetime.utcnow()
+        db.session.commit()
+        self.queue.run_next(db.session)
+        job = self.job(job_id)
+        self.assertEqual((job.status, job.attempts), ('dead', 2))
+        self.assertNotIn('committed', self.calls)
+
+        self.assertEqual(self.queue.requeue_dead(db.session), 1)
+        job = self.job(job_id)
+        self.assertEqual((job.status, job.attempts), ('pending', 0))
+
+    def test_expired_lease_is_reclaimed(self):
+        job_id = self.enqueue(name='H1')
+        self.assertIsNotNone(self.queue.claim(db.session))
+        self.assertIsNone(self.queue.claim(db.session))
+        job = self.job(job_id)
+        job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        self.assertEqual(self.queue.claim(db.session).attempts, 2)
+
+    def expire_lease(self, job_id):
+        job = self.job(job_id)
+        job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+    def test_expired_lease_on_last_attempt_is_dead_lettered(self):
+        job_id = self.enqueue(name='H1')
+        self.queue.claim(db.session)
+        self.expire_lease(job_id)
+        self.queue.claim(db.session)
+        self.expire_lease(job_id)
+        self.assertIsNone(self.queue.claim(db.session))
+        job = self.job(job_id)
+        self.assertEqual((job.status, job.attempts, job.locked_until), ('dead', 2, None))
+        self.assertIn('Lease expired', job.last_error)
+
+    def test_run_that_lost_its_lease_is_discarded(self):
+        @self.queue.handler('slow')
+        def slow(payload):
+            db.session.add(Hospital(name='Slow', phone='1', address='A'))
+            # Meanwhile the lease ran out and another worker reclaimed the job
+            db.session.execute(update(Job).values(attempts=Job.attempts + 1))
+            return lambda: self.calls.append('committed')
+
+        job = self.queue.enqueue(db.session, 'slow', {})
+        db.session.commit()
+        job_id = job.id
+        self.assertTrue(self.queue.run_next(db.session))
+        self.assertEqual(Hospital.query.count(), 0)
+        self.assertEqual(self.calls, [])
+        job = self.job(job_id)
+        self.assertEqual((job.status, job.attempts), ('running', 1))
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(KeyError):
+            self.queue.enqueue(db.session, 'nope', {})
+
+    def test_stats(self):
+        self.enqueue(name='H1')
+        self.assertEqual(self.queue.stats(db.session)['jobs'], {'pending': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
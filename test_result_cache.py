@@ -0,0 +1,136 @@
+import threading
+import unittest
+from unittest import mock
+from result_cache import ANY_ADDITION, ResultCache, SingleFlight, normalize_query, term_matches
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResultCache(max_entries=3, ttl=60)
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query('  Dolo   650 '), 'dolo 650')
+
+    def test_term_matches(self):
+        self.assertTrue(term_matches('dolo', 'Dolo 650 Micro Labs'))
+        self.assertTrue(term_matches('para cipla', 'Paracetamol 500 Cipla'))
+        self.assertFalse(term_matches('crocin', 'Dolo 650'))
+
+    def test_hits_and_misses(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', [1], ['dolo'])
+        self.assertEqual(self.cache.get('a'), [1])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        for key in 'abc':
+            self.cache.put(key, key, [key])
+        self.cache.get('a')
+        self.cache.put('d', 'd', ['d'])
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 'a')
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_ttl(self):
+        self.cache.put('a', 1, ['dolo'])
+        with mock.patch('result_cache.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(self.cache.get('a'))
+
+    def test_invalidate_only_matching_terms(self):
+        self.cache.put('dolo', 1, ['dolo'])
+        self.cache.put('crocin', 2, ['crocin'])
+        self.assertEqual(self.cache.invalidate('Dolo 650'), 1)
+        self.assertIsNone(self.cache.get('dolo'))
+        self.assertEqual(self.cache.get('crocin'), 2)
+
+    def test_any_addition_tag(self):
+        self.cache.put('crosin', [], ['crosin', ANY_ADDITION])
+        self.cache.invalidate('Zzz')
+        self.assertEqual(self.cache.get('crosin'), [])
+        self.cache.invalidate('Zzz', added=True)
+        self.assertIsNone(self.cache.get('crosin'))
+
+    def test_put_after_invalidation_is_dropped(self):
+        generation = self.cache.generation
+        self.cache.invalidate('Dolo 650')
+        self.cache.put('dolo', 1, ['dolo'], generation)
+        self.assertIsNone(self.cache.get('dolo'))
+
+    def test_add_terms(self):
+        generation = self.cache.generation
+        self.cache.put('azitral', 1, ['azitral'], generation)
+        self.cache.add_terms('azitral', ['azithral 500'], generation)
+        self.cache.invalidate('Azithral 500')
+        self.assertIsNone(self.cache.get('azitral'))
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def run_concurrently(self, flight, key, fn, count=8):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.call(flight, key, fn))) for _ in range(count)]
+        for t in threads:
+            t.start()
+        return threads, results
+
+    @staticmethod
+    def call(flight, key, fn):
+        try:
+            return flight.do(key, fn)
+        except ValueError as e:
+            return str(e)
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight(timeout=5)
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            return ['result']
+
+        threads, results = self.run_concurrently(flight, 'dolo', slow)
+        while flight.stats()['coalesced'] < 7:
+            threading.Event().wait(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['result']] * 8)
+        self.assertEqual(flight.stats(), {'in_flight': 0, 'leaders': 1, 'coalesced': 7})
+
+    def test_errors_are_shared(self):
+        flight = SingleFlight(timeout=5)
+        release = threading.Event()
+
+        def failing():
+            release.wait(5)
+            raise ValueError('boom')
+
+        threads, results = self.run_concurrently(flight, 'dolo', failing, count=3)
+        while flight.stats()['coalesced'] < 2:
+            threading.Event().wait(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ['boom'] * 3)
+
+    def test_sequential_calls_run_afresh(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('a', lambda: 1), 1)
+        self.assertEqual(flight.do('a', lambda: 2), 2)
+
+    def test_follower_times_out(self):
+        flight = SingleFlight(timeout=0.01)
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=('a', lambda: release.wait(5)))
+        leader.start()
+        while flight.stats()['in_flight'] == 0:
+            threading.Event().wait(0.01)
+        self.assertEqual(flight.do('a', lambda: 'own'), 'own')
+        release.set()
+        leader.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
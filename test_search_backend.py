@@ -0,0 +1,59 @@
+import unittest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, insert, select, update
+from search_backend import SqliteFTS5Backend, SubstringBackend, create_backend, sqlite_has_fts5, tokenize
+
+
+@unittest.skipUnless(sqlite_has_fts5(), 'SQLite built without FTS5')
+class SqliteFTS5BackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.metadata = MetaData()
+        self.table = Table('medicine', self.metadata,
+                           Column('id', Integer, primary_key=True),
+                           Column('name', String(100)),
+                           Column('manufacturer', String(100)))
+        self.backend = SqliteFTS5Backend()
+        self.backend.register(self.table, ('name', 'manufacturer'))
+        self.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.table), [
+                {'id': 1, 'name': 'Paracetamol 650', 'manufacturer': 'Cipla'},
+                {'id': 2, 'name': 'Paracetamol 500', 'manufacturer': 'GSK'},
+                {'id': 3, 'name': 'Dolo 650', 'manufacturer': 'Micro Labs'},
+            ])
+
+    def search(self, *queries):
+        matched = self.backend.match(self.table, list(queries))
+        q = select(self.table.c.id).join(matched, matched.c.id == self.table.c.id).order_by(matched.c.rank)
+        with self.engine.connect() as conn:
+            return [row.id for row in conn.execute(q)]
+
+    def test_multi_word_query_matches_across_columns(self):
+        self.assertEqual(self.search('paracetamol 650 cipla'), [1])
+        self.assertEqual(sorted(self.search('650')), [1, 3])
+
+    def test_prefix_and_alternative_queries(self):
+        self.assertEqual(sorted(self.search('para')), [1, 2])
+        self.assertEqual(sorted(self.search('dolo', 'gsk')), [2, 3])
+
+    def test_triggers_follow_updates_and_deletes(self):
+        with self.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.id == 3).values(manufacturer='Cipla'))
+            conn.execute(self.table.delete().where(self.table.c.id == 1))
+        self.assertEqual(self.search('cipla'), [3])
+
+    def test_query_without_tokens(self):
+        self.assertIsNone(self.backend.match(self.table, ['%%']))
+
+
+class BackendSelectionTestCase(unittest.TestCase):
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Dolo-650, Micro'), ['dolo', '650', 'micro'])
+
+    def test_unknown_backend_falls_back_to_substring(self):
+        self.assertIsInstance(create_backend('elastic'), SubstringBackend)
+        self.assertIsNone(create_backend('substring').match(None, ['dolo']))
+
+
+if __name__ == '__main__':
+    unittest.main()
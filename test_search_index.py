@@ -0,0 +1,129 @@
+import unittest
+from search_index import AlternativeGraph, BKTree, FuzzyIndex, PrefixIndex, TrigramIndex, edit_distance
+
+
+class TrigramIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = TrigramIndex()
+        self.index.rebuild([
+            (1, 'Dolo 650', 10),
+            (2, 'Paracetamol 500', 10),
+            (3, 'Crocin Advance', 20),
+            (4, 'Azithral 500', 20),
+            (5, None, 20),
+        ])
+
+    def test_substring_search_is_case_insensitive(self):
+        self.assertEqual(self.index.search('DOLO'), {1})
+        self.assertEqual(self.index.search('500'), {2, 4})
+        self.assertEqual(self.index.search('cetam'), {2})
+        self.assertEqual(self.index.search('xyz'), set())
+
+    def test_trigrams_must_be_contiguous(self):
+        # 'dolo' and 'olo6' share trigrams with 'Dolo 650' only in order
+        self.assertEqual(self.index.search('olo 6'), {1})
+        self.assertEqual(self.index.search('lod'), set())
+
+    def test_short_terms_scan(self):
+        self.assertEqual(self.index.search('az'), {4})
+
+    def test_tag_filter(self):
+        self.assertEqual(self.index.search('500', tags=[20]), {4})
+        self.assertEqual(self.index.search_any(['dolo', 'crocin'], tags={10}), {1})
+
+    def test_add_and_remove(self):
+        self.index.add(6, 'Dolo 1000', 30)
+        self.assertEqual(self.index.search('dolo'), {1, 6})
+        self.index.add(6, 'Calpol', 30)
+        self.assertEqual(self.index.search('dolo'), {1})
+        self.index.remove(1)
+        self.assertEqual(self.index.search('dolo'), set())
+        self.assertNotIn(5, self.index)
+
+
+class AlternativeGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.graph = AlternativeGraph()
+        self.graph.rebuild([
+            ('Dolo', 'Paracetamol'),
+            ('Crocin', 'Paracetamol'),
+            ('Brufen', 'Ibuprofen'),
+            ('Combiflam', 'ibuprofen'),
+            ('Mox', None),
+        ])
+
+    def test_closure_in_both_directions(self):
+        self.assertEqual(self.graph.alternatives_for('dolo'), ['Paracetamol', 'Crocin'])
+        self.assertEqual(self.graph.alternatives_for('PARACETAMOL'), ['Crocin', 'Dolo'])
+        self.assertEqual(self.graph.alternatives_for('Combiflam'), ['Ibuprofen', 'Brufen'])
+
+    def test_substring_match_and_unknown_names(self):
+        self.assertEqual(self.graph.alternatives_for('rocin'), ['Paracetamol', 'Dolo'])
+        self.assertEqual(self.graph.alternatives_for('mox'), [])
+        self.assertEqual(self.graph.alternatives_for('  '), [])
+
+    def test_staleness(self):
+        self.assertFalse(self.graph.is_stale)
+        self.graph.invalidate()
+        self.assertTrue(self.graph.is_stale)
+
+
+class PrefixIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.rebuild([('Dolo 650', 3), ('dolo 650', 2), ('Dolonex', 1), ('Paracetamol', 4)], pinned=['Dolobid', 'Crocin'])
+
+    def test_prefix_lookup_ranked_by_popularity(self):
+        self.assertEqual(self.index.suggest('DOL'), [('Dolo 650', 5), ('Dolonex', 1), ('Dolobid', 0)])
+        self.assertEqual(self.index.suggest('dolo 6'), [('Dolo 650', 5)])
+        self.assertEqual(self.index.suggest('dol', limit=1), [('Dolo 650', 5)])
+        self.assertEqual(self.index.suggest('x'), [])
+        self.assertEqual(self.index.suggest(''), [])
+
+    def test_incremental_updates(self):
+        self.index.add('Dolo 1000')
+        self.assertIn(('Dolo 1000', 1), self.index.suggest('dolo'))
+        self.index.discard('Dolonex')
+        self.assertNotIn('Dolonex', [name for name, _ in self.index.suggest('dolo')])
+        # Pinned names survive at weight zero
+        self.index.add('Crocin')
+        self.index.discard('Crocin')
+        self.assertEqual(self.index.suggest('cro'), [('Crocin', 0)])
+
+
+class FuzzyIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.index = FuzzyIndex()
+        self.index.rebuild([('Azithral 500', 3), ('Azee 500', 5), ('Dolo 650', 9), ('Paracetamol 500', 2), ('Crocin', 1)])
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(edit_distance('azitral', 'azithral'), 1)
+        self.assertEqual(edit_distance('abc', 'xyzxyz', limit=1), 2)
+
+    def test_bk_tree_search(self):
+        tree = BKTree()
+        for word in ['book', 'books', 'cake', 'boo', 'cape', 'cart']:
+            tree.add(word)
+        self.assertEqual(sorted(w for _, w in tree.search('book', 1)), ['boo', 'book', 'books'])
+        self.assertEqual(sorted(w for _, w in tree.search('cake', 1)), ['cake', 'cape'])
+
+    def test_misspellings(self):
+        self.assertEqual(self.index.suggest('Azitral'), ['Azithral 500'])
+        self.assertEqual(self.index.suggest('parcetamol'), ['Paracetamol 500'])
+        self.assertEqual(self.index.suggest('crosin'), ['Crocin'])
+        self.assertEqual(self.index.suggest('zzz'), [])
+
+    def test_ranked_by_popularity(self):
+        self.index.add('Azeer', 20)
+        self.assertEqual(self.index.suggest('azee'), ['Azee 500', 'Azeer'])
+        self.index.add('Azed', 50)
+        self.assertEqual(self.index.suggest('azex'), ['Azed', 'Azee 500'])
+
+    def test_discard(self):
+        self.index.discard('Crocin')
+        self.assertEqual(self.index.suggest('crosin'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
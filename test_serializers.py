@@ -0,0 +1,64 @@
+import json
+import unittest
+from datetime import date, datetime
+from unittest import mock
+from models import db, User, Pharmacy, Medicine, SOS, SystemAlert, Hospital, Ambulance
+from test_support import DatabaseTestCase
+import serializers
+
+
+class ProjectionTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = User(username='owner', password='x', role='pharmacy', name='Owner', email='o@example.com')
+        patient = User(username='pat', password='x', role='patient', name='Pat', phone='')
+        db.session.add_all([owner, patient])
+        db.session.flush()
+        pharma = Pharmacy(user_id=owner.id, shop_name='Shop', phone='1', dl_no='DL1', latitude=9.9, longitude=76.5)
+        db.session.add(pharma)
+        db.session.flush()
+        created = datetime(2026, 3, 4, 5, 6)
+        db.session.add_all([
+            Medicine(pharmacy_id=pharma.id, name='Dolo 650', qty=4, price=12.5, expiry=date(2027, 1, 2), manufacturer='Micro'),
+            SOS(patient_id=patient.id, medicine_name='Dolo', latitude=9.9, created_at=created),
+            SystemAlert(pharmacy_id=pharma.id, message='Check stock', created_at=created),
+            Hospital(name='General', phone='2', latitude=9.8),
+            Ambulance(vehicle_number='KL01', driver_name='D', driver_phone='3'),
+        ])
+        db.session.commit()
+
+    def project(self, projection, statement=None):
+        return projection.rows(db.session.execute(statement if statement is not None else projection.select()))
+
+    def test_projections_match_to_dict(self):
+        cases = [
+            (serializers.PHARMACY, serializers.pharmacies_select(), Pharmacy),
+            (serializers.MEDICINE, None, Medicine),
+            (serializers.SOS_REQUEST, serializers.sos_select(), SOS),
+            (serializers.ALERT, None, SystemAlert),
+            (serializers.HOSPITAL, None, Hospital),
+            (serializers.AMBULANCE, None, Ambulance),
+            (serializers.USER, None, User),
+        ]
+        for projection, statement, model in cases:
+            expected = [obj.to_dict() for obj in model.query.order_by(model.id)]
+            self.assertEqual(self.project(projection, statement), expected, model.__name__)
+
+    def test_medicine_with_pharmacy(self):
+        row, = self.project(serializers.MEDICINE_WITH_PHARMACY, serializers.medicines_select())
+        self.assertEqual(row['pharmacy_name'], 'Shop')
+        self.assertEqual(row['expiry'], '2027-01-02')
+
+    def test_dumps_with_and_without_orjson(self):
+        data = [{'name': 'Dolo', 'price': 1.5, 'qty': None}]
+        self.assertEqual(json.loads(serializers.dumps(data)), data)
+        with mock.patch.object(serializers, 'HAS_ORJSON', False):
+            self.assertEqual(json.loads(serializers.dumps(data)), data)
+            with self.app.test_request_context():
+                response = serializers.json_response(data, status=201)
+        self.assertEqual((response.status_code, response.mimetype), (201, 'application/json'))
+        self.assertEqual(response.get_json(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
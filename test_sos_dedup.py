@@ -0,0 +1,56 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import db, User, SOS
+from test_support import DatabaseTestCase
+import sos_dedup
+
+
+class SOSDedupTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = User(username='patient', password='x', role='patient', name='Patient')
+        db.session.add(self.patient)
+        db.session.commit()
+
+    def record(self, name, **kwargs):
+        result = sos_dedup.record(db.session, self.patient.id, name, **kwargs)
+        db.session.commit()
+        return result
+
+    def test_repeat_press_merges_into_open_sos(self):
+        first, created, _ = self.record('Dolo 650')
+        self.assertTrue(created)
+        merged, created, expired = self.record('  dolo   650', latitude=1.0, longitude=2.0)
+        self.assertFalse(created)
+        self.assertIsNone(expired)
+        self.assertEqual(merged.id, first.id)
+        self.assertEqual((merged.request_count, merged.latitude), (2, 1.0))
+        self.assertEqual(SOS.query.count(), 1)
+
+        _, created, _ = self.record('Crocin')
+        self.assertTrue(created)
+
+    def test_press_after_window_expires_stale_sos(self):
+        first, _, _ = self.record('Dolo 650')
+        first.updated_at = datetime.utcnow() - timedelta(seconds=601)
+        db.session.commit()
+        second, created, expired = self.record('Dolo 650', window=600)
+        self.assertTrue(created)
+        self.assertEqual(expired.id, first.id)
+        self.assertEqual([s.status for s in SOS.query.order_by(SOS.id)], ['expired', 'open'])
+
+        # A resolved SOS frees the slot too
+        second.status = 'resolved'
+        db.session.commit()
+        self.assertTrue(self.record('Dolo 650')[1])
+
+    def test_unique_index_rejects_a_second_open_sos(self):
+        self.record('Dolo 650')
+        db.session.add(SOS(patient_id=self.patient.id, medicine_name='Dolo 650', medicine_key='dolo 650'))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
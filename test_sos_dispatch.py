@@ -0,0 +1,147 @@
+import unittest
+from datetime import date, timedelta
+from sqlalchemy import event
+from models import db, User, SOS, SystemAlert, MedicineAlternative
+from test_stock_search import ORIGIN, StockSearchTestCase, north
+import app as main
+
+
+class SOSTestCase(StockSearchTestCase):
+    config = {'SOS_DISPATCH_RADIUS_KM': 5, 'SOS_DISPATCH_LIMIT': 50}
+
+    def setUp(self):
+        super().setUp()
+        self.patient = User(username='patient', password='x', role='patient', name='Asha')
+        db.session.add(self.patient)
+        db.session.commit()
+
+    def sos(self, medicine_name='Dolo 650', located=True):
+        sos = SOS(patient_id=self.patient.id, medicine_name=medicine_name,
+                  latitude=ORIGIN[0] if located else None, longitude=ORIGIN[1] if located else None)
+        db.session.add(sos)
+        db.session.commit()
+        return sos
+
+
+class DispatchSOSTestCase(SOSTestCase):
+    def dispatch(self, sos):
+        targets = main.dispatch_sos(sos)
+        db.session.commit()
+        return targets
+
+    def alerts(self, sos):
+        return {a.pharmacy_id: a for a in SystemAlert.query.filter_by(sos_id=sos.id)}
+
+    def test_nearest_stocked_pharmacies_within_radius(self):
+        near = [self.pharmacy(north(km)) for km in (3, 1)]
+        self.pharmacy(north(6))
+        self.pharmacy(north(2), qty=0)
+        self.pharmacy(north(2.5), expiry=date.today() - timedelta(days=1))
+        self.pharmacy(north(0.5), name='Crocin')
+        self.index()
+        sos = self.sos()
+        self.assertEqual(self.dispatch(sos), [near[1], near[0]])
+
+        alerts = self.alerts(sos)
+        self.assertEqual(set(alerts), set(near))
+        self.assertEqual(alerts[near[0]].type, 'danger')
+        self.assertEqual(alerts[near[0]].message, 'SOS: Asha urgently needs Dolo 650 (3.0 km away)')
+
+    def test_alternative_names_are_matched(self):
+        db.session.add(MedicineAlternative(medicine_name='Calpol', alternative_name='Dolo 650'))
+        db.session.commit()
+        stocked = self.pharmacy(north(1))
+        self.index()
+        self.assertEqual(self.dispatch(self.sos('Calpol')), [stocked])
+
+    def test_limit_keeps_the_nearest(self):
+        ids = {km: self.pharmacy(north(km)) for km in (4, 1, 3, 2)}
+        self.index()
+        main.app.config['SOS_DISPATCH_LIMIT'] = 2
+        sos = self.sos()
+        self.assertEqual(self.dispatch(sos), [ids[1], ids[2]])
+        self.assertEqual(set(self.alerts(sos)), {ids[1], ids[2]})
+
+    def test_no_pharmacy_in_range(self):
+        self.pharmacy(north(8))
+        self.index()
+        sos = self.sos()
+        self.assertEqual(self.dispatch(sos), [])
+        self.assertEqual(self.alerts(sos), {})
+
+    def test_without_location_goes_to_stocked_pharmacies_anywhere(self):
+        far = [self.pharmacy(north(km)) for km in (40, 400)]
+        self.pharmacy(north(1), qty=0)
+        self.index()
+        main.app.config['SOS_DISPATCH_LIMIT'] = 5
+        sos = self.sos(located=False)
+        self.assertEqual(sorted(self.dispatch(sos)), sorted(far))
+        self.assertEqual(self.alerts(sos)[far[0]].message, 'SOS: Asha urgently needs Dolo 650')
+
+
+class DispatchJobTestCase(SOSTestCase):
+    def test_alerts_once_and_publishes_after_commit(self):
+        near = self.pharmacy(north(1))
+        self.index()
+        sos = self.sos()
+        seq = main.sos_broker.seq
+        publish = main.dispatch_sos_job({'sos_id': sos.id})
+        db.session.commit()
+        self.assertEqual(main.sos_broker.seq, seq)  # nothing published before the commit
+        publish()
+        created, = main.sos_broker.events_after(seq)
+        self.assertEqual((created.name, created.data['id'], created.audience), ('created', sos.id, frozenset({near})))
+        self.assertEqual(SystemAlert.query.filter_by(sos_id=sos.id).count(), 1)
+
+        # A retry after the commit must not alert twice
+        self.assertIsNone(main.dispatch_sos_job({'sos_id': sos.id}))
+        self.assertEqual(SystemAlert.query.filter_by(sos_id=sos.id).count(), 1)
+
+    def test_skips_missing_and_closed_sos(self):
+        self.pharmacy(north(1))
+        self.index()
+        sos = self.sos()
+        sos.status = 'resolved'
+        db.session.commit()
+        self.assertIsNone(main.dispatch_sos_job({'sos_id': sos.id}))
+        self.assertIsNone(main.dispatch_sos_job({'sos_id': sos.id + 1}))
+        self.assertEqual(SystemAlert.query.count(), 0)
+
+
+class OpenEmergenciesTestCase(SOSTestCase):
+    def test_lists_open_sos_dispatched_to_the_pharmacy_newest_first(self):
+        mine, other = self.pharmacy(north(1)), self.pharmacy(north(2))
+        self.index()
+        dispatched = [self.sos(f'Dolo {i}') for i in range(12)]
+        for sos in dispatched:
+            db.session.add(SystemAlert(pharmacy_id=mine, sos_id=sos.id, message='m'))
+        dispatched[-1].status = 'resolved'
+        elsewhere = self.sos()
+        db.session.add(SystemAlert(pharmacy_id=other, sos_id=elsewhere.id, message='m'))
+        db.session.add(SystemAlert(pharmacy_id=mine, message='broadcast'))
+        db.session.commit()
+
+        rows = main.open_emergencies(mine)
+        self.assertEqual([row['id'] for row in rows], [sos.id for sos in reversed(dispatched[1:11])])
+        self.assertEqual(main.open_emergencies(other)[0]['id'], elsewhere.id)
+
+    def test_query_is_driven_by_the_pharmacys_alerts(self):
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            main.open_emergencies(1)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        statement, parameters = statements[-1]
+        plan = [row[-1] for row in db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+        self.assertIn('ix_system_alert_pharmacy_sos', plan[0])
+        self.assertIn('PRIMARY KEY', plan[1])
+        self.assertFalse(any('TEMP B-TREE' in step for step in plan), plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import threading
+import time
+import unittest
+from sos_events import EventBroker, sse
+
+
+class EventBrokerTestCase(unittest.TestCase):
+    def test_publish_and_events_after(self):
+        broker = EventBroker()
+        self.assertEqual(broker.events_after(0), [])
+        first = broker.publish('created', {'id': 1})
+        broker.publish('resolved', {'id': 1})
+        self.assertEqual([e.name for e in broker.events_after(0)], ['created', 'resolved'])
+        self.assertEqual([e.name for e in broker.events_after(broker.parse(first))], ['resolved'])
+        self.assertEqual(broker.events_after(broker.seq), [])
+
+    def test_audience(self):
+        broker = EventBroker()
+        broker.publish('created', {'id': 1}, audience=[3, 4])
+        broker.publish('resolved', {'id': 1})
+        first, second = broker.events_after(0)
+        self.assertEqual(first.audience, frozenset({3, 4}))
+        self.assertIsNone(second.audience)
+
+    def test_dropped_events_need_resync(self):
+        broker = EventBroker(backlog=2)
+        for i in range(3):
+            broker.publish('created', {'id': i})
+        self.assertIsNone(broker.events_after(0))
+        self.assertEqual([e.data['id'] for e in broker.events_after(1)], [1, 2])
+
+    def test_parse_rejects_foreign_ids(self):
+        broker = EventBroker()
+        event_id = broker.publish('created', {})
+        self.assertEqual(broker.parse(event_id), 1)
+        self.assertIsNone(broker.parse(EventBroker().event_id(1)))
+        self.assertIsNone(broker.parse(broker.event_id(5)))
+        self.assertIsNone(broker.parse('garbage'))
+        self.assertIsNone(broker.parse(None))
+
+    def test_wait_wakes_on_publish(self):
+        broker = EventBroker()
+        threading.Timer(0.05, broker.publish, ('created', {'id': 7})).start()
+        start = time.monotonic()
+        events = broker.wait(0, timeout=5)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(events[0].data, {'id': 7})
+
+    def test_wait_times_out_empty(self):
+        self.assertEqual(EventBroker().wait(0, timeout=0.01), [])
+
+    def test_sse_format(self):
+        self.assertEqual(sse('a-1', 'created', {'id': 1}), 'id: a-1\nevent: created\ndata: {"id":1}\n\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
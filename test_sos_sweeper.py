@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from models import db, User, SOS
+from test_support import DatabaseTestCase
+import counters
+from sos_sweeper import Sweeper
+
+
+class SweeperTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        patient = User(username='patient', password='x', role='patient', name='Patient')
+        db.session.add(patient)
+        db.session.flush()
+        now = datetime.utcnow()
+        for i in range(7):
+            db.session.add(SOS(patient_id=patient.id, medicine_name=f'Old {i}', created_at=now - timedelta(hours=3, minutes=i)))
+        db.session.add(SOS(patient_id=patient.id, medicine_name='Fresh', created_at=now))
+        db.session.add(SOS(patient_id=patient.id, medicine_name='Done', status='resolved', created_at=now - timedelta(days=2)))
+        db.session.commit()
+        counters.read(db.session)
+        self.expired = []
+
+    def sweeper(self, **kwargs):
+        return Sweeper(ttl=3600, on_expired=self.expired.append, **kwargs)
+
+    def test_expires_old_open_sos_in_batches(self):
+        swept = self.sweeper(batch_size=3).sweep(db.session)
+        self.assertEqual(len(swept), 7)
+        self.assertEqual([len(ids) for ids in self.expired], [3, 3, 1])
+        # Oldest first
+        self.assertEqual(set(self.expired[0]),
+                         {s.id for s in SOS.query.filter(SOS.medicine_name.in_(['Old 6', 'Old 5', 'Old 4']))})
+        statuses = {s.medicine_name: s.status for s in SOS.query}
+        self.assertEqual(statuses['Fresh'], 'open')
+        self.assertEqual(statuses['Done'], 'resolved')
+        self.assertEqual(counters.read(db.session)['open_sos'], 1)
+
+    def test_max_batches_leaves_the_rest_for_the_next_sweep(self):
+        sweeper = self.sweeper(batch_size=2, max_batches=2)
+        self.assertEqual(len(sweeper.sweep(db.session)), 4)
+        self.assertEqual(len(sweeper.sweep(db.session)), 3)
+        self.assertEqual(sweeper.sweep(db.session), [])
+
+    def test_batch_is_an_index_range_scan(self):
+        statement = self.sweeper().batch(datetime.utcnow()).compile(db.engine, compile_kwargs={'literal_binds': True})
+        plan = ' '.join(row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}')))
+        self.assertIn('COVERING INDEX ix_sos_status_created_at', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from datetime import date
+from sqlalchemy.orm.exc import StaleDataError
+from models import db, User, Pharmacy, Medicine
+from test_support import DatabaseTestCase
+import stock_adjust
+from stock_adjust import BatchError, parse_lines
+
+
+class ParseLinesTestCase(unittest.TestCase):
+    def test_merges_lines_per_medicine(self):
+        lines, errors = parse_lines({'lines': [
+            {'medicine_id': 1, 'delta': -2}, {'medicine_id': '1', 'delta': '-1', 'version': 4},
+            {'medicine_id': 2, 'delta': 3}, {'medicine_id': 2, 'delta': 1, 'version': 5}, {'medicine_id': 2, 'delta': 1, 'version': 6},
+            {'medicine_id': 3}, 'junk', {'medicine_id': True, 'delta': 1},
+        ]})
+        self.assertEqual(lines, {1: {'delta': -3, 'version': 4}, 2: {'delta': 4, 'version': 5}})
+        self.assertEqual([e['line'] for e in errors], [5, 6, 7, 8])
+
+    def test_rejects_bad_batches(self):
+        for payload in (None, {}, [], {'lines': 'x'}):
+            with self.assertRaises(BatchError):
+                parse_lines(payload)
+        with self.assertRaises(BatchError):
+            parse_lines([{'medicine_id': 1, 'delta': 1}] * 3, max_lines=2)
+
+
+class ApplyTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = User(username='owner', password='x', role='pharmacy', name='Owner')
+        other = User(username='other', password='x', role='pharmacy', name='Other')
+        self.pharmacy = Pharmacy(owner=owner, shop_name='Shop', phone='1')
+        self.other = Pharmacy(owner=other, shop_name='Other', phone='2')
+        self.meds = [Medicine(pharmacy=self.pharmacy, name=f'Med {i}', qty=5, expiry=date(2030, 1, 1)) for i in range(3)]
+        self.foreign = Medicine(pharmacy=self.other, name='Foreign', qty=5, expiry=date(2030, 1, 1))
+        db.session.add_all([self.pharmacy, self.other, *self.meds, self.foreign])
+        db.session.commit()
+
+    def stock(self):
+        db.session.expire_all()
+        return {m.id: (m.qty, m.version) for m in Medicine.query.order_by(Medicine.id)}
+
+    def test_applies_valid_lines_and_reports_conflicts(self):
+        a, b, c = (m.id for m in self.meds)
+        applied, conflicts = stock_adjust.apply(db.session, self.pharmacy.id, {
+            a: {'delta': -5, 'version': None},
+            b: {'delta': -6, 'version': None},
+            c: {'delta': 2, 'version': 9},
+            self.foreign.id: {'delta': -1, 'version': None},
+        })
+        db.session.commit()
+        self.assertEqual([(row.id, row.qty, row.version) for row in applied], [(a, 0, 2)])
+        self.assertEqual(conflicts, [
+            {'medicine_id': b, 'reason': 'insufficient_stock', 'qty': 5, 'version': 1},
+            {'medicine_id': c, 'reason': 'version_conflict', 'qty': 5, 'version': 1},
+            {'medicine_id': self.foreign.id, 'reason': 'not_found'},
+        ])
+        self.assertEqual(self.stock(), {a: (0, 2), b: (5, 1), c: (5, 1), self.foreign.id: (5, 1)})
+
+    def test_version_match_applies(self):
+        a = self.meds[0].id
+        applied, conflicts = stock_adjust.apply(db.session, self.pharmacy.id, {a: {'delta': 3, 'version': 1}})
+        self.assertEqual((applied[0].qty, applied[0].version, conflicts), (8, 2, []))
+
+    def test_orm_flush_of_stale_row_fails(self):
+        med = self.meds[0]
+        stock_adjust.apply(db.session, self.pharmacy.id, {med.id: {'delta': -1, 'version': None}})
+        med.qty = 100
+        with self.assertRaises(StaleDataError):
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
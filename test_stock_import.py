@@ -0,0 +1,79 @@
+import io
+import json
+import unittest
+from datetime import date
+from models import db, User, Pharmacy, Medicine
+from test_support import DatabaseTestCase
+import stock_import
+from stock_import import UploadError, iter_csv, iter_json_array, validate
+
+
+class ParseTestCase(unittest.TestCase):
+    def test_json_array_across_chunk_boundaries(self):
+        rows = [{'name': f'Med {i}', 'qty': i * 1000, 'note': 'é' * i} for i in range(50)] + [12345, 'x']
+        body = json.dumps(rows, ensure_ascii=False).encode()
+        for chunk_size in (1, 3, 7, 64 * 1024):
+            self.assertEqual(list(iter_json_array(io.BytesIO(body), chunk_size=chunk_size)), rows)
+
+    def test_json_edge_cases(self):
+        self.assertEqual(list(iter_json_array(io.BytesIO(b' [ ] '))), [])
+        for body in (b'{"a": 1}', b'', b'[{"a": 1}', b'[{"a": 1} {"b": 2}]', b'[{"a": }]'):
+            with self.assertRaises(UploadError):
+                list(iter_json_array(io.BytesIO(body), chunk_size=4))
+
+    def test_csv_rows_and_header(self):
+        body = '﻿Name, Qty ,expiry\nDolo,3,2030-01-01\n"Crocin, 500",1,2030-02-01\n'.encode()
+        self.assertEqual(list(iter_csv(io.BytesIO(body))), [
+            {'name': 'Dolo', 'qty': '3', 'expiry': '2030-01-01'},
+            {'name': 'Crocin, 500', 'qty': '1', 'expiry': '2030-02-01'},
+        ])
+        with self.assertRaises(UploadError):
+            list(iter_csv(io.BytesIO(b'name,qty\nDolo,3\n')))
+        self.assertEqual(list(iter_csv(io.BytesIO(b''))), [])
+
+    def test_validate(self):
+        self.assertEqual(validate({'name': ' Dolo ', 'qty': '3', 'price': '2.5', 'expiry': '2030-01-01'}), {
+            'name': 'Dolo', 'generic_name': None, 'manufacturer': None, 'description': None,
+            'qty': 3, 'price': 2.5, 'expiry': date(2030, 1, 1)})
+        self.assertEqual(validate({'name': 'Dolo', 'qty': '', 'price': ' ', 'expiry': '2030-01-01'})['qty'], 0)
+        bad = [
+            ({'qty': 1, 'expiry': '2030-01-01'}, 'name'),
+            ({'name': 'x' * 101, 'expiry': '2030-01-01'}, 'name'),
+            ({'name': 'Dolo', 'qty': '1.5', 'expiry': '2030-01-01'}, 'qty'),
+            ({'name': 'Dolo', 'qty': -1, 'expiry': '2030-01-01'}, 'qty'),
+            ({'name': 'Dolo', 'price': 'abc', 'expiry': '2030-01-01'}, 'price'),
+            ({'name': 'Dolo'}, 'expiry'),
+            ({'name': 'Dolo', 'expiry': '01-01-2030'}, 'expiry'),
+        ]
+        for row, field in bad:
+            with self.assertRaisesRegex(ValueError, field):
+                validate(row)
+
+
+class ImportRowsTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pharmacy = Pharmacy(owner=User(username='owner', password='x', role='pharmacy', name='Owner'),
+                                 shop_name='Shop', phone='1')
+        db.session.add(self.pharmacy)
+        db.session.commit()
+
+    def test_inserts_valid_rows_in_chunks(self):
+        rows = [{'name': f'Med {i}', 'qty': i, 'expiry': '2030-01-01'} for i in range(7)]
+        rows.insert(3, {'name': '', 'expiry': '2030-01-01'})
+        inserted, errors = stock_import.import_rows(db.session, self.pharmacy.id, rows, chunk_size=3)
+        db.session.commit()
+        self.assertEqual(errors, [{'row': 4, 'error': 'name is required'}])
+        self.assertEqual(len(inserted), 7)
+        stored = {m.id: m.name for m in Medicine.query.filter_by(pharmacy_id=self.pharmacy.id)}
+        self.assertEqual(stored, {row['id']: row['name'] for row in inserted})
+
+    def test_max_rows(self):
+        rows = [{'name': 'Dolo', 'expiry': '2030-01-01'}] * 5
+        inserted, errors = stock_import.import_rows(db.session, self.pharmacy.id, rows, max_rows=2)
+        self.assertEqual(len(inserted), 2)
+        self.assertEqual(errors[0]['row'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
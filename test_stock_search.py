@@ -0,0 +1,154 @@
+import random
+import time
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+from models import db, User, Pharmacy, Medicine
+from test_support import DatabaseTestCase
+from geo import geohash_bounds, haversine
+import app as main
+
+ORIGIN = (12.0, 77.0)
+KM_PER_DEGREE = 111.195
+
+
+def north(km):
+    return ORIGIN[0] + km / KM_PER_DEGREE, ORIGIN[1]
+
+
+class StockSearchTestCase(DatabaseTestCase):
+    """Seeds pharmacies at known distances and calls the search helpers in app.py."""
+
+    config = {}
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(main.app.config, self.config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pharmacy(self, lat_lng, name='Dolo 650', qty=5, expiry=None):
+        number = Pharmacy.query.count()
+        pharmacy = Pharmacy(owner=User(username=f'owner{number}', password='x', role='pharmacy', name='Owner'),
+                            shop_name=f'Shop {number}', phone='1', latitude=lat_lng[0], longitude=lat_lng[1])
+        pharmacy.inventory.append(Medicine(name=name, qty=qty, expiry=expiry or date.today() + timedelta(days=90)))
+        db.session.add(pharmacy)
+        db.session.commit()
+        return pharmacy.id
+
+    def index(self):
+        """Rebuild the process-wide indexes over this test's rows."""
+        main.pharmacy_index.rebuild(db.session.query(Pharmacy.id, Pharmacy.latitude, Pharmacy.longitude).all())
+        main.medicine_index.rebuild(db.session.query(Medicine.id, Medicine.name, Medicine.pharmacy_id).all())
+        main.alternative_graph.invalidate()
+
+    def queried_rings(self, run):
+        """Call run() and return the pharmacy ids of each stock query it issued."""
+        with mock.patch.object(main, 'medicine_search_query', wraps=main.medicine_search_query) as query:
+            result = run()
+        return result, [list(call.args[1]) for call in query.call_args_list]
+
+
+class NearestStockTestCase(StockSearchTestCase):
+    config = {'KNN_RING_SIZE': 2}
+
+    def test_k_nearest_sellable_nearest_first(self):
+        near = [self.pharmacy(north(km)) for km in (1, 2, 3, 4, 5, 6)]
+        self.pharmacy(north(0.5), qty=0)
+        self.pharmacy(north(0.6), expiry=date.today() - timedelta(days=1))
+        self.pharmacy(north(0.7), name='Crocin')
+        self.index()
+        nearby = main.pharmacy_index.within(*ORIGIN, 50)
+        rows = main.nearest_stock(['dolo'], nearby, 3)
+        self.assertEqual([row.pharmacy_id for row in rows], near[:3])
+
+    def test_stops_after_the_ring_that_reaches_k(self):
+        near = [self.pharmacy(north(km)) for km in (1, 2, 3, 4, 5, 6)]
+        self.index()
+        nearby = main.pharmacy_index.within(*ORIGIN, 50)
+        rows, rings = self.queried_rings(lambda: main.nearest_stock(['dolo'], nearby, 3))
+        self.assertEqual(rings, [near[0:2], near[2:4]])
+        self.assertEqual([row.pharmacy_id for row in rows], near[:3])
+
+    def test_continues_past_pharmacies_without_stock(self):
+        near = [self.pharmacy(north(km), qty=0 if km < 5 else 5) for km in (1, 2, 3, 4, 5, 6)]
+        self.index()
+        nearby = main.pharmacy_index.within(*ORIGIN, 50)
+        rows, rings = self.queried_rings(lambda: main.nearest_stock(['dolo'], nearby, 2))
+        self.assertEqual(len(rings), 3)
+        self.assertEqual([row.pharmacy_id for row in rows], near[4:])
+
+    def test_slack_superset_holds_the_k_nearest_anywhere_in_the_cell(self):
+        rng = random.Random(7)
+        points = {}
+        for _ in range(80):
+            lat_lng = (ORIGIN[0] + rng.uniform(-0.15, 0.15), ORIGIN[1] + rng.uniform(-0.15, 0.15))
+            points[self.pharmacy(lat_lng)] = lat_lng
+        self.index()
+        k = 5
+        cell, centre_lat, centre_lng, radius, reach = main.search_area(*ORIGIN, 50)
+        nearby = main.pharmacy_index.within(centre_lat, centre_lng, radius)
+        candidates = {row.pharmacy_id for row in main.nearest_stock(['dolo'], nearby, k, slack=2 * reach)}
+        self.assertLess(len(candidates), len(points))  # the slack bound still stopped early
+
+        lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds(cell)
+        inset = 0.01 * (lat_hi - lat_lo)
+        origins = [(lat, lng) for lat in (lat_lo + inset, centre_lat, lat_hi - inset)
+                   for lng in (lng_lo + inset, centre_lng, lng_hi - inset)]
+        for lat, lng in origins:
+            nearest = sorted(points, key=lambda pid: haversine(lat, lng, *points[pid]))[:k]
+            self.assertLessEqual(set(nearest), candidates, (lat, lng))
+
+
+class ExpandingStockSearchTestCase(StockSearchTestCase):
+    config = {'SEARCH_RINGS_KM': [2, 5, 15, 50], 'KNN_MAX_K': 100}
+
+    def setUp(self):
+        super().setUp()
+        self.ids = {km: self.pharmacy(north(km)) for km in (1, 3, 4, 10, 30)}
+        self.index()
+
+    def search(self, target, deadline=None):
+        deadline = time.monotonic() + 10 if deadline is None else deadline
+        return self.queried_rings(lambda: main.expanding_stock_search(['dolo'], *ORIGIN, target, deadline))
+
+    def test_stops_at_the_ring_that_meets_the_target(self):
+        (rows, distances, radius), rings = self.search(2)
+        self.assertEqual(radius, 5)
+        self.assertEqual([row.pharmacy_id for row in rows], [self.ids[1], self.ids[3]])
+        self.assertEqual(rings, [[self.ids[1]], [self.ids[3], self.ids[4]]])
+        self.assertAlmostEqual(distances[self.ids[3]], 3, places=2)
+
+    def test_each_ring_queries_only_new_pharmacies(self):
+        (rows, _, radius), rings = self.search(10)
+        self.assertEqual(radius, 50)
+        self.assertEqual(rings, [[self.ids[1]], [self.ids[3], self.ids[4]], [self.ids[10]], [self.ids[30]]])
+        self.assertEqual([row.pharmacy_id for row in rows], list(self.ids.values()))
+
+    def test_deadline_stops_expansion(self):
+        (rows, _, radius), rings = self.search(10, deadline=time.monotonic() - 1)
+        self.assertEqual((radius, len(rings), len(rows)), (2, 1, 1))
+
+    def rings_response(self, query, target):
+        with self.app.test_request_context('/?budget_ms=10000'):
+            return main.search_medicine_rings(query, *ORIGIN, target)
+
+    def test_response_reports_radius_and_target(self):
+        met = self.rings_response('dolo', 2)
+        self.assertEqual((met['radius_km'], met['target_met'], len(met['results'])), (5, True, 2))
+        self.assertEqual([r['dist'] for r in met['results']], [1.0, 3.0])
+        missed = self.rings_response('dolo', 6)
+        self.assertEqual((missed['radius_km'], missed['target_met'], len(missed['results'])), (50, False, 5))
+
+    def test_falls_back_to_alternatives(self):
+        db.session.add(main.MedicineAlternative(medicine_name='Calpol', alternative_name='Dolo 650'))
+        db.session.commit()
+        main.alternative_graph.invalidate()
+        result = self.rings_response('calpol', 1)
+        self.assertEqual((result['radius_km'], result['target_met']), (2, True))
+        self.assertEqual(result['results'][0]['original_search'], 'calpol')
+        self.assertTrue(result['results'][0]['is_alternative'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+"""Shared base for tests that run against an in-memory SQLite database."""
+import unittest
+
+from flask import Flask
+
+from models import db
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Fresh tables in a pushed app context for every test."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
@@ -0,0 +1,87 @@
+import unittest
+from datetime import date
+from sqlalchemy import insert
+from models import db, User, Pharmacy, Medicine, Hospital
+from test_support import DatabaseTestCase
+import table_versions
+
+
+class TableVersionsTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User(username='owner', password='x', role='pharmacy', name='Owner')
+        self.pharmacy = Pharmacy(owner=self.user, shop_name='Shop', phone='1')
+        db.session.add(self.pharmacy)
+        db.session.commit()
+
+    def versions(self):
+        return table_versions.current(db.session, ['medicine', 'hospital'])
+
+    def test_unit_of_work_writes_bump_once_per_flush(self):
+        before = self.versions()
+        db.session.add_all([Medicine(pharmacy_id=self.pharmacy.id, name=f'Med {i}', qty=1, expiry=date(2030, 1, 1)) for i in range(5)])
+        db.session.commit()
+        after = self.versions()
+        self.assertEqual(after['medicine'], before['medicine'] + 1)
+        self.assertEqual(after['hospital'], before['hospital'])
+
+        med = Medicine.query.first()
+        med.qty = 7
+        db.session.commit()
+        self.assertEqual(self.versions()['medicine'], after['medicine'] + 1)
+
+        db.session.delete(med)
+        db.session.commit()
+        self.assertEqual(self.versions()['medicine'], after['medicine'] + 2)
+
+    def test_medicine_writes_bump_their_pharmacy_only(self):
+        other = Pharmacy(owner=User(username='other', password='x', role='pharmacy', name='Other'), shop_name='Other', phone='2')
+        db.session.add(other)
+        db.session.commit()
+        mine, theirs = (table_versions.scoped('medicine', p.id) for p in (self.pharmacy, other))
+        before = table_versions.current(db.session, [mine, theirs])
+        db.session.add(Medicine(pharmacy_id=self.pharmacy.id, name='Dolo', qty=1, expiry=date(2030, 1, 1)))
+        db.session.commit()
+        after = table_versions.current(db.session, [mine, theirs])
+        self.assertEqual(after[mine], before[mine] + 1)
+        self.assertEqual(after[theirs], before[theirs])
+
+    def test_unchanged_objects_do_not_bump(self):
+        db.session.add(Medicine(pharmacy_id=self.pharmacy.id, name='Dolo', qty=1, expiry=date(2030, 1, 1)))
+        db.session.commit()
+        before = self.versions()
+        med = Medicine.query.first()
+        med.qty = med.qty
+        db.session.commit()
+        self.assertEqual(self.versions(), before)
+
+    def test_bulk_statements_bump(self):
+        before = self.versions()['medicine']
+        db.session.execute(insert(Medicine), [{'pharmacy_id': self.pharmacy.id, 'name': 'Dolo', 'qty': 1, 'expiry': date(2030, 1, 1)}])
+        db.session.commit()
+        self.assertEqual(self.versions()['medicine'], before + 1)
+        Medicine.query.filter_by(name='Dolo').update({'qty': 3})
+        db.session.commit()
+        Medicine.query.filter_by(name='Dolo').delete()
+        db.session.commit()
+        self.assertEqual(self.versions()['medicine'], before + 3)
+
+    def test_rolled_back_writes_do_not_bump(self):
+        before = self.versions()
+        db.session.add(Hospital(name='H', phone='1', address='A'))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.versions(), before)
+
+    def test_etag_changes_with_versions_and_vary(self):
+        tag = table_versions.etag(db.session, ['hospital'], '/x', 1)
+        self.assertEqual(tag, table_versions.etag(db.session, ['hospital'], '/x', 1))
+        self.assertNotEqual(tag, table_versions.etag(db.session, ['hospital'], '/x', 2))
+        self.assertNotEqual(tag, table_versions.etag(db.session, ['hospital', 'medicine'], '/x', 1))
+        db.session.add(Hospital(name='H', phone='1', address='A'))
+        db.session.commit()
+        self.assertNotEqual(tag, table_versions.etag(db.session, ['hospital'], '/x', 1))
+
+
+if __name__ == '__main__':
+    unittest.main()